@@ -0,0 +1,41 @@
+''' Local stand-in for a backend cluster, runs several daemons on consecutive ports.
+
+    Usage: python cluster.py <number of daemons> [INI file]
+
+    The daemons use the ports from backend_daemon_port onwards. The printed ORE_BACKEND_DAEMONS
+    value configures the frontend for all of them. All daemons are stopped with Ctrl-C or SIGTERM.
+'''
+
+import ConfigParser
+import signal
+import subprocess
+import sys
+import time
+
+if __name__ == '__main__':
+    assert(2 <= len(sys.argv) <= 3)
+    count = int(sys.argv[1])
+    ini_file = sys.argv[2] if len(sys.argv) == 3 else './daemon.ini'
+    conf = ConfigParser.ConfigParser()
+    conf.readfp(open(ini_file))
+    first_port = conf.getint('server', 'backend_daemon_port')
+
+    # Stopping the cluster process stops the daemons, too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    daemons = []
+    for port in range(first_port, first_port + count):
+        daemons.append(subprocess.Popen([sys.executable, 'daemon.py', ini_file, str(port)]))
+    print "ORE_BACKEND_DAEMONS=" + ','.join('http://localhost:%u' % port
+                                            for port in range(first_port, first_port + count))
+    try:
+        while all(daemon.poll() is None for daemon in daemons):
+            time.sleep(1)
+        print "A daemon terminated, stopping the others"
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for daemon in daemons:
+            if daemon.poll() is None:
+                daemon.terminate()
+        for daemon in daemons:
+            daemon.wait()
@@ -1,5 +1,4 @@
 import ConfigParser
-import base64
 import sys
 import logging
 import urllib2
@@ -7,8 +6,16 @@ import tempfile
 import shutil
 import os
 import threading
-import json
+import glob
+import gzip
+import tarfile
 import socket
+import time
+import Queue
+import shlex
+import signal
+import subprocess
+import zlib
 from SimpleXMLRPCServer import SimpleXMLRPCServer
 
 import requests
@@ -19,35 +26,223 @@ logger = logging.getLogger('FuzzEd')
 
 backends = {}
 options = {}
+queues = {}
 
 useTestServer = False
 
+# Exit codes reported for backend processes that were killed because of their limits
+TIME_LIMIT_EXIT_CODE = -2
+MEMORY_LIMIT_EXIT_CODE = -3
+
+# Seconds between two checks of a running backend process
+POLL_INTERVAL = 0.1
+
+# Bytes of the backend output that are logged for failed jobs
+OUTPUT_TAIL = 4096
+
+
+def resident_memory(pid):
+    ''' Current resident set size of the process in KB, 0 if unknown.'''
+    try:
+        with open('/proc/%u/status' % pid) as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (IOError, ValueError):
+        pass
+    return 0
+
+
+def execute(argv, time_limit=None, memory_limit=None, output=None):
+    '''
+        Runs a backend process and waits for it. The process gets its own process group, which is killed
+        as a whole when the process runs longer than 'time_limit' seconds or its resident memory exceeds
+        'memory_limit' KB. Standard output and error of the process are written to the file 'output'.
+
+        Returns the exit code, the runtime in seconds and the peak resident memory in KB.
+    '''
+    start = time.time()
+    process = subprocess.Popen(argv, preexec_fn=os.setsid,
+                               stdout=output, stderr=subprocess.STDOUT if output else None)
+    peak_memory = 0
+    exit_code = None
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        peak_memory = max(peak_memory, resident_memory(process.pid))
+        runtime = time.time() - start
+        if time_limit and runtime > time_limit:
+            logger.error("Killing %s after %.1fs, time limit exceeded" % (argv[0], runtime))
+            exit_code = TIME_LIMIT_EXIT_CODE
+        elif memory_limit and peak_memory > memory_limit:
+            logger.error("Killing %s with %u KB resident memory, memory limit exceeded" % (argv[0], peak_memory))
+            exit_code = MEMORY_LIMIT_EXIT_CODE
+        if exit_code is not None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            pid, status, usage = os.wait4(process.pid, 0)
+            break
+        time.sleep(POLL_INTERVAL)
+    # Reaped here, the Popen object must not wait for it again
+    process.returncode = status
+    runtime = time.time() - start
+    peak_memory = max(peak_memory, usage.ru_maxrss)
+    if exit_code is None:
+        exit_code = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return exit_code, runtime, peak_memory
+
+
+class JobQueue(object):
+    '''
+        The pending jobs of one backend type, processed by a fixed number of worker threads.
+        Jobs that do not fit into the queue anymore are rejected, instead of starting more
+        backend processes than the machine can handle.
+    '''
+
+    def __init__(self, jobtype, workers, size):
+        self.jobtype = jobtype
+        self.queue = Queue.Queue(maxsize=size)
+        self.lock = threading.Lock()
+        self.workers = workers
+        self.running = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.finished = 0
+        self.killed = 0
+        self.total_runtime = 0.0
+        self.max_memory = 0
+        for i in range(workers):
+            worker = WorkerThread(self)
+            worker.daemon = True
+            worker.start()
+
+    def put(self, joburl, input_data=None):
+        '''
+            Enqueues the job, returns False if the queue is full.
+            The zlib-compressed input data is kept until a worker takes the job.
+        '''
+        try:
+            self.queue.put_nowait((joburl, input_data, time.time()))
+        except Queue.Full:
+            with self.lock:
+                self.rejected += 1
+            logger.warning("Rejecting %s job at %s, %u jobs are waiting already" %
+                           (self.jobtype, joburl, self.queue.qsize()))
+            return False
+        with self.lock:
+            self.accepted += 1
+        return True
+
+    def get(self):
+        ''' Waits for the next job, and returns its URL and compressed input data.'''
+        joburl, input_data, queued = self.queue.get()
+        wait = time.time() - queued
+        with self.lock:
+            self.running += 1
+            self.started += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        logger.info("Starting %s job after %.2fs in the queue, %u jobs waiting" %
+                    (self.jobtype, wait, self.queue.qsize()))
+        return joburl, input_data
+
+    def done(self):
+        with self.lock:
+            self.running -= 1
+
+    def record(self, exit_code, runtime, peak_memory):
+        ''' Takes the resource usage of a finished backend process into the statistics.'''
+        with self.lock:
+            self.finished += 1
+            if exit_code in (TIME_LIMIT_EXIT_CODE, MEMORY_LIMIT_EXIT_CODE):
+                self.killed += 1
+            self.total_runtime += runtime
+            self.max_memory = max(self.max_memory, peak_memory)
+
+    def load(self):
+        ''' Number of jobs that can be taken at once, and number of jobs taken right now.'''
+        with self.lock:
+            return {'capacity': self.workers + self.queue.maxsize,
+                    'load': self.running + self.queue.qsize()}
+
+    def status(self):
+        ''' Queue depth, worker usage and wait time statistics, as reported by the status() RPC.'''
+        with self.lock:
+            return {'workers': self.workers,
+                    'running': self.running,
+                    'queued': self.queue.qsize(),
+                    'queue_size': self.queue.maxsize,
+                    'accepted': self.accepted,
+                    'rejected': self.rejected,
+                    'average_wait': self.total_wait / self.started if self.started else 0.0,
+                    'max_wait': self.max_wait,
+                    'killed': self.killed,
+                    'average_runtime': self.total_runtime / self.finished if self.finished else 0.0,
+                    'max_memory': self.max_memory}
+
 
 class WorkerThread(threading.Thread):
     jobtype = ""
     joburl = ""
+    input_data = None
 
-    def __init__(self, jobtype, joburl):
-        self.jobtype = jobtype
-        self.joburl = joburl
+    def __init__(self, jobqueue):
+        self.jobqueue = jobqueue
+        self.jobtype = jobqueue.jobtype
         threading.Thread.__init__(self)
 
-    def sendResult(self, exit_code, file_data=None, file_name=None):
+    def sendResult(self, exit_code, files=(), usage=None):
         """
+            Uploads the exit code and the result files as binary PATCH request. A single result file is sent as
+            gzip-compressed body, several result files as gzip-compressed tar archive. The payload is compressed
+            into a temporary file, which is streamed to the frontend.
+
         :rtype : None
         """
-        results = {'exit_code': exit_code}
-        if file_data and file_name:
-            results['file_name'] = file_name
-            results['file_data'] = base64.b64encode(file_data)
-        logger.debug("Sending result data to %s" % (self.joburl))
-        headers = {'content-type': 'application/json'}
-        r = requests.patch(self.joburl, data=json.dumps(
-            results), verify=False, headers=headers)
+        headers = {'X-Exit-Code': str(exit_code)}
+        if usage:
+            headers['X-Runtime'] = '%f' % usage[0]
+            headers['X-Peak-Memory'] = str(usage[1])
+        with tempfile.TemporaryFile() as payload:
+            if len(files) == 1:
+                headers['Content-Type'] = 'application/octet-stream'
+                headers['X-File-Name'] = os.path.basename(files[0])
+                with open(files[0], 'rb') as fd, gzip.GzipFile(fileobj=payload, mode='wb') as compressed:
+                    shutil.copyfileobj(fd, compressed)
+            elif files:
+                headers['Content-Type'] = 'application/x-tar'
+                with gzip.GzipFile(fileobj=payload, mode='wb') as compressed:
+                    with tarfile.open(fileobj=compressed, mode='w') as archive:
+                        for file_name in files:
+                            archive.add(file_name, arcname=os.path.basename(file_name))
+            if files:
+                headers['Content-Encoding'] = 'gzip'
+            payload.seek(0)
+            logger.debug("Sending %u result files to %s" % (len(files), self.joburl))
+            r = requests.patch(self.joburl, data=payload, verify=False, headers=headers)
         if r.text:
             logger.debug("Data sent, response was: " + str(r.text))
 
     def run(self):
+        while True:
+            self.joburl, self.input_data = self.jobqueue.get()
+            try:
+                self.process()
+            except Exception:
+                # The worker must survive, even if the result could not be delivered
+                logger.exception("Failed to deliver result for job URL " + self.joburl)
+            finally:
+                self.jobqueue.done()
+
+    def process(self):
+        tmpdir = None
+        output = None
         try:
             logger.info("Working for job URL: " + self.joburl)
 
@@ -55,8 +250,11 @@ class WorkerThread(threading.Thread):
             tmpdir = tempfile.mkdtemp()
             tmpfile = tempfile.NamedTemporaryFile(dir=tmpdir, delete=False)
 
-            # Fetch input data and store it
-            input_data = urllib2.urlopen(self.joburl).read()
+            # Take the input data that came with the job, fetch it only from older frontends
+            if self.input_data is not None:
+                input_data = zlib.decompress(self.input_data)
+            else:
+                input_data = urllib2.urlopen(self.joburl).read()
             tmpfile.write(input_data)
 #            logger.debug(input_data)
             tmpfile.close()
@@ -66,31 +264,39 @@ class WorkerThread(threading.Thread):
             # and the input file format is determined by the web server on download.
             # Alle backend executables are just expected to follow the same
             # command-line pattern as render.py.
-            cmd = "%s %s %s %s %s" % (backends[self.jobtype]['executable'],
-                                      tmpfile.name,
-                                      tmpdir + os.sep +
-                                      backends[self.jobtype]['output'],
-                                      tmpdir,
-                                      backends[self.jobtype]['log_file'])
-            logger.info("Running " + cmd)
-            output_file = backends[self.jobtype]['output']
-
-            # Run command synchronousely and wait for the exit code
-            exit_code = os.system(cmd)
+            settings = backends[self.jobtype]
+            output_file = settings['output']
+            argv = shlex.split(settings['executable']) + [tmpfile.name,
+                                                          tmpdir + os.sep + output_file,
+                                                          tmpdir,
+                                                          settings['log_file']]
+            logger.info("Running " + ' '.join(argv))
+
+            # Run command synchronousely and wait for the exit code, within the configured limits
+            output = tempfile.TemporaryFile()
+            exit_code, runtime, peak_memory = execute(argv,
+                                                      float(settings.get('time_limit', 0)),
+                                                      int(settings.get('memory_limit', 0)) * 1024,
+                                                      output)
+            logger.info("%s job finished with exit code %d after %.2fs, peak memory %u KB" %
+                        (self.jobtype, exit_code, runtime, peak_memory))
+            self.jobqueue.record(exit_code, runtime, peak_memory)
+            usage = (runtime, peak_memory)
             if exit_code == 0:
                 logger.info("Exit code 0, preparing result upload")
-                # multiple result file upload not implemented
-                assert(not output_file.startswith("*"))
-                with open(tmpdir + os.sep + output_file, "rb") as fd:
-                    data = fd.read()
-                    self.sendResult(0, data, output_file)
-#                    logger.debug(data)
+                # The output setting may be a pattern for several result files
+                files = sorted(glob.glob(tmpdir + os.sep + output_file))
+                if not files:
+                    raise Exception("No result file matching " + output_file)
+                self.sendResult(0, files, usage)
             else:
                 logger.error("Error on execution: Exit code " + str(exit_code))
+                output.seek(max(0, os.fstat(output.fileno()).st_size - OUTPUT_TAIL))
+                logger.error("Backend output:\n" + output.read())
                 logger.error(
                     "Saving input file for later reference: /tmp/lastinput.xml")
-                os.system("cp %s /tmp/lastinput.xml" % tmpfile.name)
-                self.sendResult(exit_code)
+                shutil.copy(tmpfile.name, "/tmp/lastinput.xml")
+                self.sendResult(exit_code, usage=usage)
 
         except Exception as e:
             logger.debug(
@@ -98,7 +304,10 @@ class WorkerThread(threading.Thread):
             self.sendResult(-1)
 
         finally:
-            shutil.rmtree(tmpdir, ignore_errors=True)
+            if output:
+                output.close()
+            if tmpdir:
+                shutil.rmtree(tmpdir, ignore_errors=True)
 
 
 class JobServer(SimpleXMLRPCServer):
@@ -107,17 +316,37 @@ class JobServer(SimpleXMLRPCServer):
         SimpleXMLRPCServer.__init__(
             self, (socket.gethostbyname("0.0.0.0"), int(options['backend_daemon_port'])))
         self.register_function(self.handle_request, 'start_job')
+        self.register_function(self.status, 'status')
+        self.register_function(self.load, 'load')
+        # A fixed set of worker threads per backend type
+        default_size = int(options.get('queue_size', 10))
+        for jobtype, settings in backends.iteritems():
+            queues[jobtype] = JobQueue(jobtype,
+                                       int(settings.get('workers', 1)),
+                                       int(settings.get('queue_size', default_size)))
 
-    def handle_request(self, jobtype, joburl):
+    def handle_request(self, jobtype, joburl, input_data=None):
+        '''
+            Accepts a job. The frontend sends the job input as zlib-compressed binary,
+            which saves the round trip for fetching it from the job URL.
+        '''
         logger.debug("Received %s job at %s" % (jobtype, joburl))
         if jobtype not in backends.keys():
             logger.error("Unknown job type " + jobtype)
             return False
         else:
-            # Start worker thread for this task
-            worker = WorkerThread(jobtype, joburl)
-            worker.start()
-            return True
+            # Queue the job for the next free worker, False tells the caller that we are busy
+            return queues[jobtype].put(joburl, input_data.data if input_data is not None else None)
+
+    def status(self):
+        return {jobtype: queue.status() for jobtype, queue in queues.iteritems()}
+
+    def load(self):
+        '''
+            Capacity and current load per backend type. The frontend uses it as health check,
+            and dispatches new jobs to the least loaded daemon.
+        '''
+        return {jobtype: queue.load() for jobtype, queue in queues.iteritems()}
 
 
 if __name__ == '__main__':
@@ -136,6 +365,9 @@ if __name__ == '__main__':
             backends[settings['job_kind']] = settings
         elif section == 'server':
             options = dict(conf.items('server'))
+    if len(sys.argv) == 3:
+        # Port given on the command line, for running several daemons with one INI file
+        options['backend_daemon_port'] = sys.argv[2]
     logger.info("Configured backends: " + str(backends.keys()))
     logger.info("Options: " + str(options))
     # Start server
@@ -2,6 +2,8 @@ import unittest
 import subprocess
 import sys
 import os
+import tempfile
+import time
 from xml.dom.minidom import parse
 
 
@@ -24,3 +26,61 @@ class AnalysisTestCase(unittest.TestCase):
                     (fname), shell=True)
                 self.assertEqual(retcode, 0, fname + " failed")
                 parse('/tmp/output.xml')
+
+
+class ExecuteTestCase(unittest.TestCase):
+    """
+        Tests for the limits and the output capturing of backend processes in the daemon.
+    """
+
+    def setUp(self):
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import daemon
+        self.daemon = daemon
+
+    def tearDown(self):
+        sys.path.pop(0)
+
+    def isRunning(self, pid):
+        ''' Killed processes may stay zombies until their new parent reaps them.'''
+        try:
+            with open('/proc/%u/stat' % pid) as stat:
+                return stat.read().split(')')[-1].split()[0] != 'Z'
+        except IOError:
+            return False
+
+    def execute(self, argv, time_limit=None, memory_limit=None):
+        with tempfile.TemporaryFile() as output:
+            result = self.daemon.execute(argv, time_limit, memory_limit, output)
+            output.seek(0)
+            return result + (output.read(),)
+
+    @unittest.skipUnless(
+        sys.platform.startswith("linux"), "requires Linux")
+    def testTimeLimit(self):
+        # The backend starts a child of its own, which has to go down with it
+        exit_code, runtime, peak_memory, output = self.execute(['sh', '-c', 'sleep 10 & echo $!; wait'],
+                                                               time_limit=0.2)
+        self.assertEqual(exit_code, self.daemon.TIME_LIMIT_EXIT_CODE)
+        self.assertLess(runtime, 5)
+        child = int(output)
+        for i in range(20):
+            if not self.isRunning(child):
+                break
+            time.sleep(0.1)
+        self.assertFalse(self.isRunning(child))
+
+    @unittest.skipUnless(
+        sys.platform.startswith("linux"), "requires Linux")
+    def testMemoryLimit(self):
+        exit_code, runtime, peak_memory, output = self.execute(
+            [sys.executable, '-c', 'import time; data = " " * 200 * 1024 * 1024; time.sleep(10)'],
+            memory_limit=50 * 1024)
+        self.assertEqual(exit_code, self.daemon.MEMORY_LIMIT_EXIT_CODE)
+        self.assertGreater(peak_memory, 50 * 1024)
+        self.assertLess(runtime, 5)
+
+    def testOutput(self):
+        exit_code, runtime, peak_memory, output = self.execute(['sh', '-c', 'echo out; echo err >&2; exit 3'])
+        self.assertEqual(exit_code, 3)
+        self.assertEqual(output.split(), ['out', 'err'])
@@ -1,9 +1,14 @@
 import base64
 import logging
 import json
+import tarfile
+import tempfile
+import zlib
+from cStringIO import StringIO
 
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.core.mail import mail_managers
+from django.db import transaction
 from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound
 from tastypie import fields
 from django.conf.urls import url
@@ -15,6 +20,50 @@ from django.conf import settings
 
 logger = logging.getLogger('ore')
 
+# Bytes read at once from result uploads, and the maximum bytes decompressed from one chunk at once
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Uploads are kept in memory up to this size, larger ones go to a temporary file
+UPLOAD_SPOOL_SIZE = 1024 * 1024
+
+
+class ResultTooLarge(Exception):
+    pass
+
+
+def decompress(chunks):
+    '''
+        Generator for the decompressed data of the given gzip-compressed chunks, in pieces of at most
+        UPLOAD_CHUNK_SIZE bytes, so that a small chunk can not expand into a huge string.
+    '''
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        while chunk:
+            yield decompressor.decompress(chunk, UPLOAD_CHUNK_SIZE)
+            chunk = decompressor.unconsumed_tail
+    yield decompressor.flush()
+
+
+def spool(chunks):
+    '''
+        Writes the given chunks into a temporary file, which stays in memory up to UPLOAD_SPOOL_SIZE bytes.
+
+        Returns:
+         {file} the temporary file, positioned at the start
+
+        Raises:
+         ResultTooLarge when the data exceeds the BACKEND_RESULT_MAX_SIZE setting
+    '''
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > settings.BACKEND_RESULT_MAX_SIZE:
+            spooled.close()
+            raise ResultTooLarge('Result upload exceeds %u bytes' % settings.BACKEND_RESULT_MAX_SIZE)
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
 
 class JobResource(common.JobResource):
 
@@ -45,7 +94,8 @@ class JobResource(common.JobResource):
 
     def get_detail(self, request, **kwargs):
         """
-            Allows the backend to retrieve the job input file.
+            Allows the backend to retrieve the job input file, as frozen on job creation.
+            Current daemons get the input together with the job, see job_post_save().
         """
         basic_bundle = self.build_bundle(request=request)
         try:
@@ -72,8 +122,9 @@ class JobResource(common.JobResource):
             to the object. In this method, we still have access to what actually really
             comes as part of the update payload.
 
-            The result comes as 'application/json' dictionary content,
-            with an entry for the exit code of the backend service and the base64-encoded file data.
+            The result comes as binary body, see read_result(). Older daemons send 'application/json'
+            dictionary content, with an entry for the exit code of the backend service and the
+            base64-encoded file data.
 
             If the resource is updated, return ``HttpAccepted`` (202 Accepted).
             If the resource did not exist, return ``HttpNotFound`` (404 Not Found).
@@ -97,14 +148,24 @@ class JobResource(common.JobResource):
         else:
             logger.debug("Parsing and storing result data for job %d" % job.pk)
             try:
-                result = json.loads(request.body)
-                assert('exit_code' in result)
+                job.exit_code, job.runtime, job.peak_memory, files = self.read_result(request)
+            except ResultTooLarge as e:
+                logger.error("Discarding result upload for job %u: %s" % (job.pk, e))
+                # Inform the frontend that this went wrong
+                job.exit_code = -444
+                job.save()
+                return HttpResponse(status=413)
             except Exception:
                 return HttpResponseBadRequest()
-            job.exit_code = result['exit_code']
-            if "file_name" in result:
+            if files:
                 try:
-                    job.parse_result(base64.b64decode(result['file_data']))
+                    with transaction.atomic():
+                        # Only the first result file replaces the results of a former run
+                        for index, (file_name, data) in enumerate(files):
+                            job.parse_result(data, replace=(index == 0))
+                    if len(files) == 1:
+                        files[0][1].seek(0)
+                        job.cache_result(files[0][1])
                 except Exception as e:
                     if settings.DEBUG:
                         logger.error(e)
@@ -125,3 +186,43 @@ class JobResource(common.JobResource):
         # it MUST be the very last thing to do
             job.save()
         return HttpResponse(status=202)
+
+    def read_result(self, request):
+        """
+            Reads the result upload of the backend daemon. The exit code comes in the 'X-Exit-Code' header,
+            the runtime (seconds) and peak memory (KB) of the backend process in the optional 'X-Runtime' and
+            'X-Peak-Memory' headers. A single result file is sent as body with its name in 'X-File-Name',
+            several result files as tar archive ('application/x-tar'). The body may be gzip-compressed,
+            it is then decompressed while reading. The data is kept in a temporary file, which is limited to
+            the BACKEND_RESULT_MAX_SIZE setting after decompression.
+
+            Returns:
+             {tuple} exit code, runtime, peak memory and the list of (file name, file object) tuples
+        """
+        if request.META.get('CONTENT_TYPE', '').startswith('application/json'):
+            result = json.loads(request.body)
+            files = []
+            if 'file_name' in result:
+                files.append((result['file_name'], StringIO(base64.b64decode(result['file_data']))))
+            return result['exit_code'], result.get('runtime'), result.get('peak_memory'), files
+
+        exit_code = int(request.META['HTTP_X_EXIT_CODE'])
+        runtime = request.META.get('HTTP_X_RUNTIME')
+        peak_memory = request.META.get('HTTP_X_PEAK_MEMORY')
+        chunks = iter(lambda: request.read(UPLOAD_CHUNK_SIZE), '')
+        if request.META.get('HTTP_CONTENT_ENCODING') == 'gzip':
+            chunks = decompress(chunks)
+        body = spool(chunks)
+
+        if request.META.get('CONTENT_TYPE', '').startswith('application/x-tar'):
+            # The member files are read from the spooled archive
+            archive = tarfile.open(fileobj=body, mode='r:')
+            files = [(member.name, archive.extractfile(member)) for member in archive if member.isfile()]
+        elif 'HTTP_X_FILE_NAME' in request.META:
+            files = [(request.META['HTTP_X_FILE_NAME'], body)]
+        else:
+            files = []
+        return (exit_code,
+                float(runtime) if runtime is not None else None,
+                int(peak_memory) if peak_memory is not None else None,
+                files)
@@ -7,9 +7,11 @@ from tastypie.authorization import Authorization
 from tastypie.exceptions import UnsupportedFormat, BadRequest, ImmediateHttpResponse
 from django.core.exceptions import ValidationError
 from tastypie.serializers import Serializer
+from tastypie.bundle import Bundle
+from tastypie.utils.mime import build_content_type
 from tastypie import fields
 from tastypie.http import HttpForbidden, HttpBadRequest
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.utils.cache import patch_cache_control, patch_vary_headers
@@ -70,6 +72,13 @@ class GraphSerializer(Serializer):
     def to_graphml(self, data, options=None):
         return data.obj.to_graphml()
 
+    def to_graphml_stream(self, data, options=None):
+        '''
+           Same result as to_graphml(), but as generator of text chunks,
+           so that large graphs can be streamed to the client.
+        '''
+        return data.obj.iter_graphml()
+
     def from_graphml(self, content):
         '''
            Tastypie serialization demands a dictionary of (graph) model
@@ -203,6 +212,23 @@ class GraphResource(ModelResource):
         bundle.obj.from_graphml(bundle.request.body)
         return bundle.obj
 
+    def create_response(self, request, data, response_class=HttpResponse, **response_kwargs):
+        '''
+           GraphML downloads of a single graph are streamed, instead of being
+           rendered into one string by the default Tastypie implementation.
+        '''
+        desired_format = self.determine_format(request)
+        if isinstance(data, Bundle) and response_class is HttpResponse and \
+                desired_format == self._meta.serializer.content_types['graphml']:
+            response = StreamingHttpResponse(self._meta.serializer.to_graphml_stream(data),
+                                             content_type=build_content_type(desired_format),
+                                             **response_kwargs)
+            response['Content-Disposition'] = 'attachment; filename=graph.xml'
+            # Tastypie's dispatch() only accepts HttpResponse instances as result,
+            # so the streaming response is handed over as immediate response instead
+            raise ImmediateHttpResponse(response=response)
+        return super(GraphResource, self).create_response(request, data, response_class, **response_kwargs)
+
     @abstractmethod
     def dispatch_edges(self, request, **kwargs):
         pass
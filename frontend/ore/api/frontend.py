@@ -2,20 +2,23 @@ import json
 import logging
 
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+from django.conf.urls import url
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse
 from django.conf import settings
 from tastypie.authentication import SessionAuthentication
 from tastypie.authorization import Authorization
 from tastypie.bundle import Bundle
-from tastypie.exceptions import ImmediateHttpResponse
-from tastypie.http import HttpApplicationError, HttpAccepted, HttpForbidden, HttpNotFound, HttpMultipleChoices
+from tastypie.exceptions import ImmediateHttpResponse, NotFound
+from tastypie.http import HttpApplicationError, HttpAccepted, HttpForbidden, HttpNotFound, HttpMultipleChoices, \
+    HttpBadRequest
 from tastypie import fields
 from django.core.mail import mail_managers
 from tastypie.resources import ModelResource
 from tastypie.serializers import Serializer
 
 from ore.models import Job, Graph, Notification, Node, NodeGroup, Edge, Result
+from ore import job_completion
 from . import common
 
 logger = logging.getLogger('ore')
@@ -104,13 +107,13 @@ class JobResource(common.JobResource):
         """
         graph = Graph.objects.get(pk=kwargs['graph_id'], deleted=False)
         # Check if we have a cached result, and deliver this job
-        job = Job.exists_with_result(graph=graph, kind=bundle.data['kind'])
-        if not job:
-            # We need a truly new job
+        job = Job.prepare(graph=graph, kind=bundle.data['kind'])
+        if job.pk is None:
+            # We need a truly new job, its input was already frozen for the cache lookup
             bundle.data['graph'] = graph
             bundle.data['graph_modified'] = graph.modified
             bundle.data['kind'] = bundle.data['kind']
-            bundle.obj = self._meta.object_class()
+            bundle.obj = job
             bundle = self.full_hydrate(bundle)
             return self.save(bundle)
         else:
@@ -123,6 +126,8 @@ class JobResource(common.JobResource):
         """
             Called by the request dispatcher in case somebody tries to GET a job resource.
             For the frontend, deliver the current job status if pending, or the result.
+            With the 'wait' parameter, a pending job is awaited for up to this number of seconds
+            (limited by the JOB_WAIT_TIMEOUT setting), so that clients need not repeat their request.
         """
         basic_bundle = self.build_bundle(request=request)
         try:
@@ -135,6 +140,14 @@ class JobResource(common.JobResource):
             return HttpMultipleChoices(
                 "More than one resource is found at this URI.")
 
+        try:
+            wait = min(float(request.GET.get('wait', 0)), settings.JOB_WAIT_TIMEOUT)
+        except ValueError:
+            return HttpBadRequest()
+        if not job.done() and wait > 0:
+            if job_completion.wait(lambda: Job.objects.filter(pk=job.pk, exit_code__isnull=False).exists(), wait):
+                job = Job.objects.get(pk=job.pk)
+
         if job.done():
             if job.exit_code == 0:
                 response = {}
@@ -223,11 +236,36 @@ class NodeSerializer(Serializer):
                     props[key] = val['value']
         return data_dict
 
-    def to_json(self, data):
-        return json.dumps(data)
+
+class GraphElementResource(ModelResource):
+
+    """
+        Base class for the API resources of nodes, edges and node groups, which are addressed by their graph and
+        client ID. Snapshots that still share the content of another graph keep their elements in that graph
+        (see Graph.content_graph), the elements are read from there on behalf of the snapshot.
+    """
+
+    def obj_get(self, bundle, **kwargs):
+        if 'graph_id' not in kwargs:
+            return super(GraphElementResource, self).obj_get(bundle, **kwargs)
+        kwargs = dict(kwargs)
+        graph = Graph.objects.filter(pk=kwargs.pop('graph_id'), deleted=False).first()
+        if graph is None:
+            raise self._meta.object_class.DoesNotExist("Couldn't find the graph of the element.")
+        content = graph.content_graph()
+        if content != graph and bundle.request.method != 'GET':
+            raise ImmediateHttpResponse(response=HttpForbidden("You can't modify this graph."))
+        try:
+            bundle.obj = self.get_object_list(bundle.request).get(graph=content, **kwargs)
+        except ValueError:
+            raise NotFound("Invalid resource lookup data provided (mismatched type).")
+        # Authorized and serialized as element of the addressed graph
+        bundle.obj.graph = graph
+        self.authorized_read_detail(self.get_object_list(bundle.request), bundle)
+        return bundle.obj
 
 
-class NodeResource(ModelResource):
+class NodeResource(GraphElementResource):
 
     """
         An API resource for nodes.
@@ -275,6 +313,19 @@ class NodeResource(ModelResource):
             bundle.obj.set_attrs(bundle.data['properties'])
         return self.save(bundle)
 
+    def obj_delete(self, bundle, **kwargs):
+        """
+            Nodes are only marked as deleted, so that clients can learn about the deletion from the graph changes.
+        """
+        try:
+            bundle.obj = self.get_object_list(bundle.request).get(
+                graph=kwargs['graph_id'],
+                client_id=kwargs['client_id'])
+        except ObjectDoesNotExist:
+            raise NotFound("A model instance matching the provided arguments could not be found.")
+        self.authorized_delete_detail(self.get_object_list(bundle.request), bundle)
+        bundle.obj.mark_deleted()
+
     def patch_detail(self, request, **kwargs):
         """
             Updates a resource in-place. We could also override obj_update, which is
@@ -333,7 +384,7 @@ class NodeGroupSerializer(Serializer):
         return json.dumps(data)
 
 
-class NodeGroupResource(ModelResource):
+class NodeGroupResource(GraphElementResource):
 
     """
         An API resource for node groups.
@@ -397,6 +448,19 @@ class NodeGroupResource(ModelResource):
         bundle.obj.save()
         return self.save(bundle)
 
+    def obj_delete(self, bundle, **kwargs):
+        """
+            Node groups are only marked as deleted, so that clients can learn about the deletion from the graph changes.
+        """
+        try:
+            bundle.obj = self.get_object_list(bundle.request).get(
+                graph=kwargs['graph_id'],
+                client_id=kwargs['client_id'])
+        except ObjectDoesNotExist:
+            raise NotFound("A model instance matching the provided arguments could not be found.")
+        self.authorized_delete_detail(self.get_object_list(bundle.request), bundle)
+        bundle.obj.mark_deleted()
+
     def patch_detail(self, request, **kwargs):
         """
             Updates a resource in-place. We could also override obj_update, which is
@@ -464,7 +528,7 @@ class EdgeSerializer(Serializer):
         return data_dict
 
 
-class EdgeResource(ModelResource):
+class EdgeResource(GraphElementResource):
 
     """
         An API resource for edges.
@@ -516,6 +580,19 @@ class EdgeResource(ModelResource):
             bundle.obj.set_attrs(bundle.data['properties'])
         return self.save(bundle)
 
+    def obj_delete(self, bundle, **kwargs):
+        """
+            Edges are only marked as deleted, so that clients can learn about the deletion from the graph changes.
+        """
+        try:
+            bundle.obj = self.get_object_list(bundle.request).get(
+                graph=kwargs['graph_id'],
+                client_id=kwargs['client_id'])
+        except ObjectDoesNotExist:
+            raise NotFound("A model instance matching the provided arguments could not be found.")
+        self.authorized_delete_detail(self.get_object_list(bundle.request), bundle)
+        bundle.obj.mark_deleted()
+
     def patch_detail(self, request, **kwargs):
         """
             Updates a resource in-place. We could also override obj_update, which is
@@ -597,6 +674,69 @@ class GraphResource(common.GraphResource):
         nodes = fields.ToManyField(NodeResource, 'nodes')
         edges = fields.ToManyField(EdgeResource, 'edges')
 
+    def prepend_urls(self):
+        return [
+            url(r'^graphs/(?P<pk>\d+)/changes/$',
+                self.wrap_view('dispatch_changes'),
+                name="changes"),
+            url(r'^graphs/(?P<pk>\d+)/batch$',
+                self.wrap_view('dispatch_batch'),
+                name="batch"),
+        ] + super(GraphResource, self).prepend_urls()
+
+    def dispatch_changes(self, request, **kwargs):
+        """
+            Returns the nodes, edges and node groups that were created, modified or deleted after the graph revision
+            given in the 'since' parameter. This allows clients to resynchronize without fetching the whole graph.
+            The current revision is part of the graph JSON and of every answer.
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        try:
+            since = int(request.GET['since'])
+        except (KeyError, ValueError):
+            return HttpBadRequest("The 'since' parameter must be a graph revision number.")
+        bundle = self.build_bundle(request=request)
+        try:
+            bundle.obj = self.cached_obj_get(bundle=bundle, pk=kwargs['pk'])
+        except ObjectDoesNotExist:
+            return HttpNotFound()
+        self.authorized_read_detail(self.get_object_list(request), bundle)
+        try:
+            changes = bundle.obj.changes_since(since, use_value_dict=True)
+        except ValueError as e:
+            return HttpBadRequest(str(e))
+        self.log_throttled_access(request)
+        return HttpResponse(json.dumps(changes), 'application/json')
+
+    def dispatch_batch(self, request, **kwargs):
+        """
+            Applies a list of create, update and delete operations for nodes, edges and node groups
+            in one transaction. The request body is a JSON object with the operation list in 'operations',
+            see GraphBatch for the format. The answer contains all resulting changes of the graph, in the
+            same format as the changes resource.
+        """
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        bundle = self.build_bundle(request=request)
+        try:
+            bundle.obj = self.cached_obj_get(bundle=bundle, pk=kwargs['pk'])
+        except ObjectDoesNotExist:
+            return HttpNotFound()
+        self.authorized_update_detail(self.get_object_list(request), bundle)
+        try:
+            operations = json.loads(request.body)['operations']
+        except (ValueError, KeyError, TypeError):
+            return HttpBadRequest("The request body must be a JSON object with an 'operations' list.")
+        try:
+            changes = bundle.obj.apply_batch(operations, use_value_dict=True)
+        except ValueError as e:
+            return HttpBadRequest(str(e))
+        self.log_throttled_access(request)
+        return HttpResponse(json.dumps(changes), 'application/json')
+
     def dispatch_edges(self, request, **kwargs):
         edge_resource = EdgeResource()
         return edge_resource.dispatch_list(request, graph_id=kwargs['pk'])
@@ -0,0 +1,216 @@
+'''
+    Dispatching of jobs to the backend daemons configured in BACKEND_DAEMONS, or to the single BACKEND_DAEMON.
+
+    The load() RPC of each daemon reports its capacity and current load per job kind, and serves as health check.
+    The results are kept per worker process for HEALTH_CHECK_INTERVAL seconds. Health checks run in background
+    threads, so that a slow or dead daemon never delays the dispatching. Only daemons that were never checked are
+    waited for, and at most FIRST_CHECK_WAIT seconds. A job goes to the least loaded healthy daemon. If that daemon
+    is unreachable or busy, the next one is tried. Unreachable daemons are only tried when all other daemons
+    failed, their health checks are repeated with exponentially growing intervals.
+'''
+
+import httplib
+import logging
+import socket
+import threading
+import time
+import xmlrpclib
+
+from django.conf import settings
+
+logger = logging.getLogger('ore')
+
+# Seconds a health check result is trusted
+HEALTH_CHECK_INTERVAL = 5.0
+# Upper bound for the health check interval of unreachable daemons
+MAX_CHECK_INTERVAL = 300.0
+# Seconds the dispatching waits for the first health check of a daemon
+FIRST_CHECK_WAIT = 1.0
+# Seconds to wait for an answer of a daemon
+RPC_TIMEOUT = 10.0
+
+# Guards all DaemonState fields
+_lock = threading.Lock()
+_daemons = {}
+
+
+class TimeoutTransport(xmlrpclib.Transport):
+
+    def make_connection(self, host):
+        connection = xmlrpclib.Transport.make_connection(self, host)
+        connection.timeout = RPC_TIMEOUT
+        return connection
+
+
+class SafeTimeoutTransport(xmlrpclib.SafeTransport):
+
+    def make_connection(self, host):
+        connection = xmlrpclib.SafeTransport.make_connection(self, host)
+        connection.timeout = RPC_TIMEOUT
+        return connection
+
+
+def server_proxy(url):
+    transport = SafeTimeoutTransport() if url.startswith('https') else TimeoutTransport()
+    return xmlrpclib.ServerProxy(url, transport=transport)
+
+
+class DaemonState(object):
+
+    """
+    Class: DaemonState
+
+    What the frontend knows about one backend daemon. All fields are only changed while holding _lock.
+
+    Fields:
+     {str}    url      - the XML-RPC URL of the daemon
+     {bool}   healthy  - False if the last call to the daemon failed, None if never checked
+     {float}  checked  - time of the last health check, 0 if never checked
+     {int}    failures - number of failed calls since the last successful one
+     {Thread} checking - the running health check thread, None if there is none
+     {dict}   load     - job kind to (load, capacity) tuple as reported by the daemon, None for daemons without
+                         the load() RPC
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.healthy = None
+        self.checked = 0
+        self.failures = 0
+        self.checking = None
+        self.load = None
+
+    def due(self, now):
+        ''' Tells if a new health check is needed, unreachable daemons are checked less often.'''
+        interval = min(HEALTH_CHECK_INTERVAL * 2 ** self.failures, MAX_CHECK_INTERVAL)
+        return self.checking is None and now - self.checked > interval
+
+    def start_check(self):
+        ''' Starts a health check in a background thread, must be called while holding _lock.'''
+        self.checking = threading.Thread(target=self.check, name='health check ' + self.url)
+        self.checking.daemon = True
+        self.checking.start()
+
+    def check(self):
+        ''' Fetches the current load of the daemon, which also tells if it is reachable.'''
+        load, healthy = None, False
+        try:
+            report = server_proxy(self.url).load()
+            load = {kind: (entry['load'], entry['capacity']) for kind, entry in report.iteritems()}
+            healthy = True
+        except xmlrpclib.Fault:
+            # Reachable, but too old to report its load
+            healthy = True
+        except (socket.error, httplib.HTTPException, xmlrpclib.ProtocolError) as e:
+            logger.warning("Backend daemon %s failed the health check: %s" % (self.url, e))
+        finally:
+            with _lock:
+                self.checking = None
+                self.checked = time.time()
+                if healthy:
+                    self.load = load
+                self.set_healthy(healthy)
+
+    def set_healthy(self, healthy):
+        ''' Records the outcome of a call to the daemon, must be called while holding _lock.'''
+        self.healthy = healthy
+        self.failures = 0 if healthy else self.failures + 1
+
+    def utilization(self, kind):
+        '''
+            The share of the capacity for this job kind that is in use, None if unknown.
+            Daemons that do not offer the job kind are fully utilized.
+        '''
+        if self.load is None:
+            return None
+        load, capacity = self.load.get(kind, (0, 0))
+        return float(load) / capacity if capacity else 1.0
+
+    def taken(self, kind):
+        ''' Accounts a dispatched job until the next health check reports the real load, must be called while
+            holding _lock.'''
+        if self.load is not None and kind in self.load:
+            load, capacity = self.load[kind]
+            self.load[kind] = (load + 1, capacity)
+
+
+def daemon_urls():
+    return list(settings.BACKEND_DAEMONS) or [settings.BACKEND_DAEMON]
+
+
+def candidates(kind):
+    '''
+        The configured daemons in dispatch order for the given job kind: healthy ones by utilization,
+        the ones without load information after them, then the ones that could not be checked yet, and the
+        unhealthy ones last. Stale health checks are started in the background, the current results are used
+        meanwhile.
+    '''
+    now = time.time()
+    with _lock:
+        daemons = [_daemons.setdefault(url, DaemonState(url)) for url in daemon_urls()]
+        for daemon in daemons:
+            if daemon.due(now):
+                daemon.start_check()
+        first_checks = [daemon.checking for daemon in daemons if daemon.healthy is None and daemon.checking]
+    deadline = now + FIRST_CHECK_WAIT
+    for thread in first_checks:
+        thread.join(max(0, deadline - time.time()))
+
+    with _lock:
+        states = [(daemon, daemon.healthy, daemon.utilization(kind)) for daemon in daemons]
+
+    def order(state):
+        daemon, healthy, utilization = state
+        if healthy is False:
+            return (3, 0)
+        if healthy is None:
+            return (2, 0)
+        if utilization is None:
+            return (1, 0)
+        return (0, utilization)
+    return [daemon for daemon, healthy, utilization in sorted(states, key=order)]
+
+
+def dispatch(kind, job_url, input_data):
+    '''
+        Starts the job on the least loaded daemon that accepts it.
+
+        Returns:
+         {bool} True if a daemon took the job, False if all reachable daemons are busy
+
+        Raises:
+         The error of the last daemon, if no daemon was reachable
+    '''
+    error = None
+    busy = False
+    for daemon in candidates(kind):
+        try:
+            logger.debug("Triggering %s job available through url %s on %s" % (kind, job_url, daemon.url))
+            accepted = server_proxy(daemon.url).start_job(kind, job_url, xmlrpclib.Binary(input_data))
+        except (socket.error, httplib.HTTPException, xmlrpclib.Error) as e:
+            logger.warning("Backend daemon %s failed, trying the next one: %s" % (daemon.url, e))
+            with _lock:
+                daemon.set_healthy(False)
+                daemon.checked = time.time()
+            error = e
+            continue
+        with _lock:
+            daemon.set_healthy(True)
+            if accepted:
+                daemon.taken(kind)
+        if accepted:
+            return True
+        logger.debug("Backend daemon %s is busy" % daemon.url)
+        busy = True
+    if busy or error is None:
+        return False
+    raise error
+
+
+def status():
+    ''' The known state of all configured daemons, as list of dictionaries.'''
+    with _lock:
+        return [{'url': url,
+                 'healthy': _daemons[url].healthy if url in _daemons else None,
+                 'load': _daemons[url].load if url in _daemons else None}
+                for url in daemon_urls()]
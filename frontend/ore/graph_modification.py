@@ -0,0 +1,232 @@
+'''
+    Coalesced tracking of graph modifications.
+
+    Saving or deleting a node, edge, node group or property modifies its graph. The graph revision must
+    then be incremented, the touched element stamped with it (see Graph.changes_since), and the modification
+    dates of the graph and its project updated.
+
+    Inside of a collect() block, the modified graphs and elements are only remembered. When the outermost
+    block ends, every modified graph is updated with one query, the touched elements of each graph are stamped
+    with one query per element type, and all affected projects are updated with one more query. Every request
+    runs in such a block (see GraphModificationMiddleware), larger operations such as imports can open their own.
+    Outside of a block, each modification is written directly.
+
+    Readers that depend on the graph revision call flush() first, so that they never see elements that are
+    modified but not yet stamped. The new revision, the stamps and the modification dates of each write are
+    committed together, with the graph row locked, so that readers in other requests see either all of them
+    or none, and concurrent writers never stamp with the same revision.
+
+    Snapshots may share the content of another graph (see Graph.snapshot). Code that modifies the content of
+    a graph therefore calls before_modification() first, which gives the sharing snapshots their own copy.
+    The check is done once per graph and collection, and on every call outside of a collection.
+'''
+
+import datetime
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.core.signals import request_finished
+from django.db import DatabaseError, transaction
+
+logger = logging.getLogger('ore')
+
+# Primary keys per UPDATE query when stamping elements
+STAMP_BATCH_SIZE = 500
+
+_state = threading.local()
+
+
+def _stack():
+    if not hasattr(_state, 'stack'):
+        _state.stack = []
+    return _state.stack
+
+
+def _checked():
+    if not hasattr(_state, 'checked'):
+        _state.checked = set()
+    return _state.checked
+
+
+def before_modification(graph_pk):
+    '''
+        Must be called before the nodes, edges, node groups or properties of the graph with the given primary
+        key are changed, so that snapshots sharing the content keep the old state (see Graph.detach_snapshots).
+    '''
+    from ore.models import Graph
+    if not _stack():
+        # Outside of a collection, e.g. in management commands, nothing would forget the check again.
+        # The collection forgets it when it ends.
+        with collect():
+            before_modification(graph_pk)
+        return
+    checked = _checked()
+    if graph_pk in checked:
+        return
+    # Marked before, the copying of the content must not trigger another check
+    checked.add(graph_pk)
+    try:
+        with collect():
+            Graph.detach_snapshots(graph_pk)
+    except Exception:
+        checked.discard(graph_pk)
+        raise
+
+
+def content_shared(graph_pk):
+    '''
+        Records that a new snapshot shares the content of the graph, so that the next modification in the
+        current collection checks the graph again.
+    '''
+    _checked().discard(graph_pk)
+
+
+def graph_modified(graph_pk, model=None, pks=()):
+    '''
+        Records a modification of the graph with the given primary key. The primary keys of the modified
+        elements of the given model class (Node, Edge or NodeGroup) are stamped with the new graph revision.
+    '''
+    stack = _stack()
+    if not stack:
+        write({graph_pk: {model: set(pks)} if model else {}})
+        return
+    elements = stack[-1].setdefault(graph_pk, {})
+    if model:
+        elements.setdefault(model, set()).update(pks)
+
+
+def element_modified(element):
+    '''
+        Records a modification of the given node, edge or node group.
+    '''
+    graph_modified(element.graph_id, type(element), [element.pk])
+
+
+def merge(target, modifications):
+    for graph_pk, elements in modifications.iteritems():
+        target_elements = target.setdefault(graph_pk, {})
+        for model, pks in elements.iteritems():
+            target_elements.setdefault(model, set()).update(pks)
+
+
+def is_pending(graph_pk):
+    '''
+        Checks if the graph has modifications that are not written yet.
+    '''
+    return any(graph_pk in pending for pending in _stack())
+
+
+def write(modifications):
+    '''
+        Writes the given modifications, a dictionary of graph primary keys to {model: set of element pk's},
+        in one transaction.
+    '''
+    from ore.models import Graph, Project
+    if not modifications:
+        return
+    now = datetime.datetime.now()
+    with transaction.atomic():
+        # Graph rows are locked in a fixed order, so that concurrent writes cannot deadlock
+        for graph_pk in sorted(modifications):
+            revision = Graph.objects.select_for_update().filter(pk=graph_pk) \
+                                    .values_list('revision', flat=True).first()
+            if revision is None:
+                # The graph was deleted along with its elements
+                continue
+            revision += 1
+            Graph.objects.filter(pk=graph_pk).update(revision=revision, modified=now)
+            for model, pks in modifications[graph_pk].iteritems():
+                pks = list(pks)
+                for start in xrange(0, len(pks), STAMP_BATCH_SIZE):
+                    model.objects.filter(pk__in=pks[start:start + STAMP_BATCH_SIZE]).update(revision=revision)
+        Project.objects.filter(graphs__pk__in=modifications.keys()).update(modified=now)
+
+
+def flush():
+    '''
+        Writes the modifications collected so far, the collection continues afterwards.
+    '''
+    modifications = {}
+    for pending in _stack():
+        merge(modifications, pending)
+        pending.clear()
+    write(modifications)
+
+
+def begin():
+    '''
+        Starts collecting modifications, calls can be nested.
+    '''
+    _stack().append({})
+
+
+def end(failed=False, rolled_back=False):
+    '''
+        Ends a collection started with begin(). Nested collections hand their modifications over to the
+        enclosing one, the outermost collection writes them.
+
+        When a collection fails, 'rolled_back' tells if its database changes are undone by an enclosing
+        transaction. The collected modifications are dropped then. Otherwise, they are written in any case,
+        but errors in the writing are only logged, so that they do not hide the original problem.
+    '''
+    stack = _stack()
+    pending = stack.pop()
+    if not stack or (failed and rolled_back):
+        # Copies of shared content may be rolled back, and other requests may create new snapshots
+        _checked().clear()
+    if failed and rolled_back:
+        logger.debug('Dropping graph modifications of a rolled back transaction')
+        return
+    if stack:
+        merge(stack[-1], pending)
+        return
+    if not failed:
+        write(pending)
+        return
+    try:
+        write(pending)
+    except DatabaseError:
+        logger.exception('Could not record the graph modifications of a failed operation')
+
+
+def abandon():
+    '''
+        Ends all collections that are still open, e.g. because a request failed before its collection could
+        be ended. Their modifications are written, since the changed elements are already stored.
+    '''
+    stack = _stack()
+    if not stack:
+        return
+    logger.warning('Writing the graph modifications of %u collections that were not ended' % len(stack))
+    modifications = {}
+    for pending in stack:
+        merge(modifications, pending)
+    del stack[:]
+    _checked().clear()
+    try:
+        write(modifications)
+    except DatabaseError:
+        logger.exception('Could not record the graph modifications of abandoned collections')
+
+
+def request_finished_handler(sender, **kwargs):
+    abandon()
+
+request_finished.connect(request_finished_handler)
+
+
+@contextmanager
+def collect(transactional=False):
+    '''
+        Context manager for collecting the graph modifications of a block of code. Blocks that run in a
+        transaction, which is rolled back on errors, pass 'transactional'.
+    '''
+    begin()
+    try:
+        yield
+    except Exception:
+        end(failed=True, rolled_back=transactional)
+        raise
+    else:
+        end()
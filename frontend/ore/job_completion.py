@@ -0,0 +1,63 @@
+'''
+    Waiting for jobs to finish, for the job status requests of the frontend (see JobResource.get_detail()).
+
+    The exit code of a job is stored by whichever worker process receives the result upload, so the database is
+    the channel that all processes share. A waiting request re-reads the job state every CHECK_INTERVAL seconds,
+    with one cheap indexed query. Jobs that are finished in the same process wake up their waiters right away.
+
+    Every waiting request holds a WSGI thread. Only JOB_WAIT_SLOTS requests per process wait at the same time,
+    so that threads stay free for other requests, such as the result uploads of the backend daemons. Requests
+    beyond that answer immediately, and the client repeats them as before.
+'''
+
+import threading
+import time
+
+from django.conf import settings
+
+# Seconds between two checks of the job state in the database
+CHECK_INTERVAL = 0.5
+
+_condition = threading.Condition()
+_generation = 0
+_waiting = 0
+
+
+def notify():
+    ''' Wakes up all waiting requests of this process, so that they check their jobs again.'''
+    global _generation
+    with _condition:
+        _generation += 1
+        _condition.notify_all()
+
+
+def wait(is_done, timeout):
+    '''
+        Waits until is_done() returns True, but at most 'timeout' seconds. Returns at once if all wait slots of
+        this process are taken.
+
+        Returns:
+         {bool} the last result of is_done()
+    '''
+    global _waiting
+    with _condition:
+        if _waiting >= settings.JOB_WAIT_SLOTS:
+            return is_done()
+        _waiting += 1
+    try:
+        deadline = time.time() + timeout
+        while True:
+            with _condition:
+                seen = _generation
+            if is_done():
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            with _condition:
+                # Notifications that came in since the check above are not missed
+                if _generation == seen:
+                    _condition.wait(min(remaining, CHECK_INTERVAL))
+    finally:
+        with _condition:
+            _waiting -= 1
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from ore.models import Job, Result
+from ore.models import Job, Result, CachedResult
 
 
 class Command(BaseCommand):
@@ -16,3 +16,9 @@ class Command(BaseCommand):
 
         print "Deleting finished jobs ..."
         finished_jobs.delete()
+
+        stats = CachedResult.stats()
+        print "Deleting %u shared cached results (%u bytes, %u hits, %u misses) ..." % (
+            stats['entries'], stats['size'], stats['hits'], stats['misses'])
+        CachedResult.objects.all().delete()
+        CachedResult.reset_stats()
@@ -11,4 +11,5 @@ class Command(BaseCommand):
         graph = Graph.objects.get(pk=graph_id)
 
         print 'Dumping graph %d' % (graph_id)
-        print graph.to_graphml()
+        for chunk in graph.iter_graphml():
+            self.stdout.write(chunk, ending='')
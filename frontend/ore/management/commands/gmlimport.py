@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from ore.models import Graph, Project
+from ore import graph_modification
 from django.contrib.auth.models import User
 
 
@@ -19,6 +20,6 @@ class Command(BaseCommand):
         project.save()
         graph = Graph(owner=user, kind=args[1], project=project)
         graph.save()
-        xmldata = open(args[2]).read()
-        graph.from_graphml(xmldata)
+        with open(args[2]) as xmlfile, graph_modification.collect():
+            graph.from_graphml(xmlfile)
         print "Graph created, ID is %u" % graph.pk
@@ -11,6 +11,8 @@ from django.http import HttpResponse, HttpResponseRedirect, HttpResponsePermanen
     HttpResponseBadRequest, HttpResponseNotFound, HttpResponseForbidden, HttpResponseNotAllowed, HttpResponseGone, \
     HttpResponseServerError
 
+from ore import graph_modification
+
 
 class OreException(Exception):
 
@@ -94,6 +96,16 @@ class HttpResponseServerErrorAnswer(OreException):
         return HttpResponseServerError(self.message)
 
 
+class HttpResponseServiceUnavailable(HttpResponse):
+    status_code = 503
+
+
+class HttpResponseServiceUnavailableAnswer(OreException):
+
+    def result(self):
+        return HttpResponseServiceUnavailable(self.message)
+
+
 class HttpResponseCreated(HttpResponse):
     status_code = 201
 
@@ -126,3 +138,31 @@ class HttpErrorMiddleware(object):
         else:
             # default exception handling kicks in
             return None
+
+
+class GraphModificationMiddleware(object):
+
+    '''
+    Collects the graph modifications of each request, so that every modified graph and project
+    is only updated once at the end of the request (see ore.graph_modification).
+
+    The changed elements are stored before the end of the request. When the view fails, the collected
+    modifications are therefore written right away, and collections that are still open when the request
+    finished are written by graph_modification.abandon().
+    '''
+
+    def process_request(self, request):
+        graph_modification.begin()
+        request.collects_graph_modifications = True
+
+    def process_exception(self, request, exception):
+        if getattr(request, 'collects_graph_modifications', False):
+            graph_modification.flush()
+        return None
+
+    def process_response(self, request, response):
+        # process_request() is skipped when an earlier middleware answered the request
+        if getattr(request, 'collects_graph_modifications', False):
+            request.collects_graph_modifications = False
+            graph_modification.end()
+        return response
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ore', '0002_graph_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edge',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='nodegroup',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='edge',
+            index_together=set([('graph', 'revision')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='node',
+            index_together=set([('graph', 'revision')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='nodegroup',
+            index_together=set([('graph', 'revision')]),
+        ),
+    ]
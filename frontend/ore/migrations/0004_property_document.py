@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.db import migrations, models
+
+# Owners per chunk when building the property documents
+CHUNK_SIZE = 500
+# Rows per UPDATE query, keeps the number of query parameters below the SQLite limit
+UPDATE_BATCH_SIZE = 300
+
+OWNERS = (('Node', 'node', 'nodes'),
+          ('Edge', 'edge', 'edges'),
+          ('NodeGroup', 'node_group', 'nodeGroups'))
+
+# Non-text value types of the notation properties at the time of this migration, by graph kind and node kind
+# (or notation section for edges and node groups). All other properties are stored as text.
+VALUE_TYPES = {
+    ('dfd', 'stickyNote'): {'height': 'numeric', 'width': 'numeric'},
+    ('faulttree', 'basicEvent'): {'probability': 'compound'},
+    ('faulttree', 'basicEventSet'): {'cardinality': 'numeric', 'probability': 'compound'},
+    ('faulttree', 'eventSet'): {'cardinality': 'numeric'},
+    ('faulttree', 'houseEvent'): {'probability': 'compound'},
+    ('faulttree', 'intermediateEventSet'): {'cardinality': 'numeric'},
+    ('faulttree', 'nodeGroups'): {'probability': 'compound'},
+    ('faulttree', 'spareGate'): {'dormancyFactor': 'numeric'},
+    ('faulttree', 'stickyNote'): {'height': 'numeric', 'width': 'numeric'},
+    ('faulttree', 'topEvent'): {'missionTime': 'numeric'},
+    ('faulttree', 'transferIn'): {'transfer': 'transfer'},
+    ('faulttree', 'votingOrGate'): {'k': 'numeric'},
+    ('fuzztree', 'basicEvent'): {'cost': 'numeric', 'optional': 'bool', 'probability': 'compound'},
+    ('fuzztree', 'basicEventSet'): {'cardinality': 'numeric', 'cost': 'numeric',
+                                    'optional': 'bool', 'probability': 'compound'},
+    ('fuzztree', 'event'): {'cost': 'numeric', 'optional': 'bool'},
+    ('fuzztree', 'eventSet'): {'cardinality': 'numeric', 'cost': 'numeric', 'optional': 'bool'},
+    ('fuzztree', 'houseEvent'): {'cost': 'numeric', 'optional': 'bool', 'probability': 'compound'},
+    ('fuzztree', 'intermediateEvent'): {'cost': 'numeric', 'optional': 'bool'},
+    ('fuzztree', 'intermediateEventSet'): {'cardinality': 'numeric', 'cost': 'numeric', 'optional': 'bool'},
+    ('fuzztree', 'nodeGroups'): {'cost': 'numeric', 'optional': 'bool', 'probability': 'compound'},
+    ('fuzztree', 'redundancyVariation'): {'nRange': 'range'},
+    ('fuzztree', 'stickyNote'): {'height': 'numeric', 'width': 'numeric'},
+    ('fuzztree', 'topEvent'): {'decompositions': 'numeric', 'missionTime': 'numeric'},
+    ('fuzztree', 'transferIn'): {'transfer': 'transfer', 'transferMaxCost': 'numeric'},
+    ('fuzztree', 'undevelopedEvent'): {'cost': 'numeric', 'optional': 'bool'},
+    ('fuzztree', 'votingOrGate'): {'k': 'numeric'},
+    ('rbd', 'block'): {'probability': 'compound'},
+    ('rbd', 'out_of'): {'out_of': 'range'},
+    ('rbd', 'stickyNote'): {'height': 'numeric', 'width': 'numeric'},
+}
+POSITION_KEYS = ('x', 'y', 'key')
+
+
+def decode(graph_kind, kind, key, text):
+    ''' Converts a stored property text into its native value, as Property.text_to_value() did.'''
+    val_type = 'numeric' if key in POSITION_KEYS else VALUE_TYPES.get((graph_kind, kind), {}).get(key)
+    if val_type in ('compound', 'range'):
+        if text.startswith('"') and text.endswith('"'):
+            # Illformed legacy data
+            text = text[1:-1]
+        return json.loads(text)
+    elif val_type in ('numeric', 'transfer'):
+        return int(text)
+    elif val_type == 'bool':
+        return text.lower() == 'true'
+    return text
+
+
+def build_property_documents(apps, schema_editor):
+    '''
+        Fills the property documents of all existing nodes, edges and node groups from their Property rows.
+    '''
+    Property = apps.get_model('ore', 'Property')
+    for model_name, owner_field, section in OWNERS:
+        model = apps.get_model('ore', model_name)
+        if section == 'nodes':
+            owners = list(model.objects.order_by('pk').values_list('pk', 'graph__kind', 'kind'))
+        else:
+            owners = [owner + (section,) for owner in model.objects.order_by('pk').values_list('pk', 'graph__kind')]
+        for start in xrange(0, len(owners), CHUNK_SIZE):
+            chunk = owners[start:start + CHUNK_SIZE]
+            documents = {pk: {} for pk, graph_kind, kind in chunk}
+            kinds = {pk: (graph_kind, kind) for pk, graph_kind, kind in chunk}
+            properties = Property.objects.filter(deleted=False, **{owner_field + '_id__in': documents.keys()})
+            for owner_pk, key, text in properties.order_by('pk').values_list(owner_field + '_id', 'key', 'value'):
+                documents[owner_pk][key] = decode(kinds[owner_pk][0], kinds[owner_pk][1], key, text)
+            pks = documents.keys()
+            for batch_start in xrange(0, len(pks), UPDATE_BATCH_SIZE):
+                batch = pks[batch_start:batch_start + UPDATE_BATCH_SIZE]
+                document = models.Case(*[models.When(pk=pk, then=models.Value(json.dumps(documents[pk])))
+                                         for pk in batch], output_field=models.TextField())
+                model.objects.filter(pk__in=batch).update(property_document=document)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ore', '0003_element_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edge',
+            name='property_document',
+            field=models.TextField(default=None, null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='property_document',
+            field=models.TextField(default=None, null=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='nodegroup',
+            name='property_document',
+            field=models.TextField(default=None, null=True, editable=False),
+        ),
+        migrations.RunPython(build_property_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ore', '0004_property_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='content_source',
+            field=models.ForeignKey(related_name='shared_snapshots', on_delete=django.db.models.deletion.SET_NULL, blank=True, editable=False, to='ore.Graph', null=True),
+        ),
+    ]
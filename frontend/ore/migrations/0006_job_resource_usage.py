@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ore', '0005_graph_content_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='peak_memory',
+            field=models.IntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='runtime',
+            field=models.FloatField(null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ore', '0007_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='input_document',
+            field=models.BinaryField(null=True, blank=True),
+        ),
+    ]
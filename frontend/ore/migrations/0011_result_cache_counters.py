@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+COUNTERS = ['resultcache:hits', 'resultcache:misses']
+
+
+def create_counters(apps, schema_editor):
+    CacheCounter = apps.get_model('ore', 'CacheCounter')
+    for name in COUNTERS:
+        CacheCounter.objects.get_or_create(name=name)
+
+
+def delete_counters(apps, schema_editor):
+    apps.get_model('ore', 'CacheCounter').objects.filter(name__in=COUNTERS).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ore', '0010_serialization_cache_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_counters, delete_counters),
+    ]
@@ -6,6 +6,8 @@ from .sharing import Sharing
 from .node import Node
 from .edge import Edge
 from .job import Job
+from .cached_result import CachedResult
+from .cache_counter import CacheCounter
 from .properties import Property
 from .user import UserProfile
 from .result import Result
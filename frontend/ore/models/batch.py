@@ -0,0 +1,342 @@
+'''
+    Transactional application of many node, edge and node group modifications to one graph, based on bulk SQL.
+'''
+
+import datetime
+import logging
+
+from django.db import transaction
+from django.db.models import Q
+
+from ore import graph_modification
+
+from .bulk import bulk_create_with_pks, bulk_update, bulk_save_properties
+from .graph import Graph
+from .project import Project
+from .node import Node
+from .edge import Edge
+from .node_group import NodeGroup
+from .properties import Property
+from .notations import by_kind
+
+logger = logging.getLogger('ore')
+
+ACTIONS = ('create', 'update', 'delete')
+
+# Value range of the integer model fields, which the database enforces
+FIELD_RANGES = {
+    'client_id': (-2 ** 63, 2 ** 63 - 1),
+    'x': (-2 ** 31, 2 ** 31 - 1),
+    'y': (-2 ** 31, 2 ** 31 - 1)
+}
+
+# Per element type: model class, Property owner field, notation section, attributes stored in model fields
+ELEMENT_TYPES = {
+    'node': (Node, 'node', 'nodes', ('client_id', 'kind', 'x', 'y')),
+    'edge': (Edge, 'edge', 'edges', ('client_id',)),
+    'nodegroup': (NodeGroup, 'node_group', 'nodeGroups', ('client_id',))
+}
+
+
+class GraphBatch(object):
+
+    """
+    Class: GraphBatch
+
+    A list of create, update and delete operations for the nodes, edges and node groups of one graph, which is
+    applied in a single transaction with a number of queries that does not depend on the number of operations.
+    Each operation is a dictionary with the entries:
+
+     'action' - 'create', 'update' or 'delete'
+     'type'   - 'node', 'edge' or 'nodegroup'
+     'id'     - the client ID of the element, for updates and deletions
+     'data'   - the payload of the according single element request of the frontend API, for creations and updates
+                (e.g. {'client_id': 5, 'kind': 'basicEvent', 'x': 1, 'y': 2, 'properties': {'name': 'Foo'}})
+
+    All creations are applied first, followed by all updates and all deletions, so that operations can refer
+    to elements created in the same batch. Invalid operations raise a ValueError, and nothing is changed then.
+    No model signals are sent, all modified elements are stamped with one new graph revision instead.
+    """
+
+    def __init__(self, graph, operations):
+        self.graph = graph
+        self.creations = {kind: [] for kind in ELEMENT_TYPES}
+        self.updates = {kind: [] for kind in ELEMENT_TYPES}
+        self.deletions = {kind: [] for kind in ELEMENT_TYPES}
+        # Client ID's given to elements by this batch, mapped to the index of the operation
+        self.new_client_ids = {kind: {} for kind in ELEMENT_TYPES}
+        if not isinstance(operations, list):
+            raise ValueError('The batch operations must be given as list.')
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                raise ValueError('Operation %u is no dictionary.' % index)
+            action, kind = operation.get('action'), operation.get('type')
+            if action not in ACTIONS:
+                raise ValueError('Operation %u has an invalid action %r.' % (index, action))
+            if kind not in ELEMENT_TYPES:
+                raise ValueError('Operation %u has an invalid element type %r.' % (index, kind))
+            data = operation.get('data', {})
+            if not isinstance(data, dict) or not isinstance(data.get('properties', {}), dict) or \
+                    not isinstance(data.get('nodeIds', []), list):
+                raise ValueError('Operation %u has invalid data.' % index)
+            data = self.validate_fields(index, kind, data)
+            data['properties'] = self.validate_fields(index, kind, data.get('properties', {}))
+            if action == 'create':
+                self.creations[kind].append((index, data))
+                self.claim_client_id(index, kind, data['properties'].get('client_id', data.get('client_id')))
+            elif action == 'update':
+                client_id = self.client_id(index, operation.get('id'))
+                self.updates[kind].append((index, client_id, data))
+                if data['properties'].get('client_id', client_id) != client_id:
+                    self.claim_client_id(index, kind, data['properties']['client_id'])
+            else:
+                self.deletions[kind].append((index, self.client_id(index, operation.get('id'))))
+
+    def validate_fields(self, index, kind, values):
+        '''
+            Checks the given attributes of one element that are stored in model fields, so that invalid values
+            are reported as ValueError instead of failing in the database. Node kinds must be part of the graph
+            notation, integer fields accept everything that converts to an integer in their range.
+
+            Returns:
+             {dict} a copy of the attributes, with the integer fields converted
+        '''
+        values = dict(values)
+        for key in ELEMENT_TYPES[kind][3]:
+            if key not in values:
+                continue
+            if key == 'kind':
+                if values[key] not in by_kind[self.graph.kind]['nodes']:
+                    raise ValueError('Operation %u has an invalid node kind %r.' % (index, values[key]))
+                continue
+            try:
+                if isinstance(values[key], bool):
+                    raise TypeError()
+                values[key] = int(values[key])
+            except (TypeError, ValueError):
+                raise ValueError('Operation %u has an invalid %s value %r.' % (index, key, values[key]))
+            low, high = FIELD_RANGES[key]
+            if not low <= values[key] <= high:
+                raise ValueError('Operation %u has an out of range %s value %r.' % (index, key, values[key]))
+        return values
+
+    def claim_client_id(self, index, kind, client_id):
+        '''
+            Remembers the client ID a created or updated element gets, which no other operation of the batch may
+            give to an element of the same type. Existing elements are checked in load_elements().
+        '''
+        client_id = self.client_id(index, client_id)
+        if client_id in self.new_client_ids[kind]:
+            raise ValueError('Operation %u uses the %s client ID %u of operation %u again.' %
+                             (index, kind, client_id, self.new_client_ids[kind][client_id]))
+        self.new_client_ids[kind][client_id] = index
+
+    @staticmethod
+    def client_id(index, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError('Operation %u has an invalid client ID %r.' % (index, value))
+
+    def apply(self):
+        '''
+            Applies all operations in one transaction.
+
+            Returns:
+             {int} the graph revision the modified elements are stamped with
+        '''
+        # Signals of the per-object saves in bulk_create_with_pks() must not survive a rollback
+        with transaction.atomic(), graph_modification.collect(transactional=True):
+            # Before the revision is taken, since giving a shared snapshot its own content increments it
+            graph_modification.before_modification(self.graph.pk)
+            # The update also locks the graph row, so concurrent batches for the graph are serialized
+            self.revision = Graph.bump_revision(self.graph.pk)
+            self.properties = {kind: {} for kind in ELEMENT_TYPES}
+            self.load_elements()
+            self.create_nodes()
+            self.create_edges()
+            self.create_groups()
+            self.apply_updates()
+            self.apply_deletions()
+            for kind, (model, owner_field, section, native) in ELEMENT_TYPES.iteritems():
+                bulk_save_properties(owner_field, self.properties[kind])
+            now = datetime.datetime.now()
+            Graph.objects.filter(pk=self.graph.pk).update(modified=now)
+            Project.objects.filter(pk=self.graph.project_id).update(modified=now)
+        logger.debug("Applied batch to graph %u in revision %u" % (self.graph.pk, self.revision))
+        return self.revision
+
+    def load_elements(self):
+        '''
+            Fetches primary key and kind of all existing elements the operations refer to, with one query per
+            element type. Client ID's that the batch gives to elements must not be in use yet.
+        '''
+        referenced = {kind: set(client_id for index, client_id, data in self.updates[kind]) |
+                      set(client_id for index, client_id in self.deletions[kind]) |
+                      set(self.new_client_ids[kind])
+                      for kind in ELEMENT_TYPES}
+        for index, data in self.creations['edge']:
+            referenced['node'].update(self.client_id(index, data.get(end)) for end in ('source', 'target'))
+        for index, data in self.creations['nodegroup'] + [(index, data) for index, _, data in
+                                                          self.updates['nodegroup']]:
+            referenced['node'].update(self.client_id(index, node_id) for node_id in data.get('nodeIds', []))
+
+        self.elements = {}
+        for kind, (model, owner_field, section, native) in ELEMENT_TYPES.iteritems():
+            rows = model.objects.filter(graph=self.graph, deleted=False, client_id__in=referenced[kind])
+            if kind == 'node':
+                rows = rows.values_list('client_id', 'pk', 'kind')
+            else:
+                rows = rows.values_list('client_id', 'pk')
+            self.elements[kind] = {row[0]: row[1:] for row in rows}
+            for client_id, index in self.new_client_ids[kind].iteritems():
+                if client_id in self.elements[kind]:
+                    raise ValueError('Operation %u uses the client ID %u of an existing %s.' % (index, client_id, kind))
+
+    def element(self, index, kind, client_id):
+        '''
+            Returns the (pk,) or (pk, node kind) tuple for the element with the given client ID.
+        '''
+        try:
+            return self.elements[kind][client_id]
+        except KeyError:
+            raise ValueError('Operation %u refers to the unknown %s %u.' % (index, kind, client_id))
+
+    def validate_properties(self, index, kind, properties, node_kind=None):
+        '''
+            Converts the given properties of one element into their text representation, according to the notation.
+            Attributes that are stored in model fields are returned separately. A changed node kind is already the
+            one the properties are checked against.
+
+            Returns:
+             {tuple} the model field values and the property text values, as dictionaries
+        '''
+        model, owner_field, section, native = ELEMENT_TYPES[kind]
+        node_kind = properties.get('kind', node_kind)
+        native_values, texts = {}, {}
+        for key, value in properties.iteritems():
+            if key in native:
+                native_values[key] = value
+                continue
+            try:
+                val_type = Property.notation_value_type(key, self.graph.kind, section, node_kind)
+                texts[key] = Property.value_to_text(val_type, value)
+            except Exception as e:
+                raise ValueError('Operation %u: %s' % (index, e))
+        return native_values, texts
+
+    def create(self, kind, elements):
+        '''
+            Inserts the given (index, unsaved element, properties) tuples of one type in bulk.
+        '''
+        model = ELEMENT_TYPES[kind][0]
+        texts = []
+        for index, element, properties in elements:
+            node_kind = element.kind if kind == 'node' else None
+            native_values, element_texts = self.validate_properties(index, kind, properties, node_kind)
+            for key, value in native_values.iteritems():
+                setattr(element, key, value)
+            texts.append(element_texts)
+        bulk_create_with_pks(model, [element for index, element, properties in elements])
+        for (index, element, properties), element_texts in zip(elements, texts):
+            self.properties[kind][element.pk] = element_texts
+            if kind == 'node':
+                self.elements[kind][element.client_id] = (element.pk, element.kind)
+            else:
+                self.elements[kind][element.client_id] = (element.pk,)
+
+    def create_nodes(self):
+        notation_nodes = by_kind[self.graph.kind]['nodes']
+        nodes = []
+        for index, data in self.creations['node']:
+            if data.get('kind') not in notation_nodes:
+                raise ValueError('Operation %u has an invalid node kind %r.' % (index, data.get('kind')))
+            node = Node(graph=self.graph, revision=self.revision, kind=data['kind'],
+                        client_id=self.client_id(index, data.get('client_id')),
+                        x=data.get('x', 0), y=data.get('y', 0))
+            nodes.append((index, node, data.get('properties', {})))
+        self.create('node', nodes)
+
+    def create_edges(self):
+        edges = []
+        for index, data in self.creations['edge']:
+            source = self.element(index, 'node', self.client_id(index, data.get('source')))
+            target = self.element(index, 'node', self.client_id(index, data.get('target')))
+            edge = Edge(graph=self.graph, revision=self.revision, source_id=source[0], target_id=target[0],
+                        client_id=self.client_id(index, data.get('client_id')))
+            edges.append((index, edge, data.get('properties', {})))
+        self.create('edge', edges)
+
+    def create_groups(self):
+        groups = []
+        node_ids = []
+        for index, data in self.creations['nodegroup']:
+            group = NodeGroup(graph=self.graph, revision=self.revision,
+                              client_id=self.client_id(index, data.get('client_id')))
+            groups.append((index, group, data.get('properties', {})))
+            node_ids.append(data.get('nodeIds', []))
+        self.create('nodegroup', groups)
+        self.set_group_members({group.pk: self.group_members(index, ids)
+                                for (index, group, properties), ids in zip(groups, node_ids)})
+
+    def group_members(self, index, node_ids):
+        # Like in the single request API, the client may refer to nodes that are already gone
+        members = []
+        for node_id in node_ids:
+            node = self.elements['node'].get(self.client_id(index, node_id))
+            if node is not None:
+                members.append(node[0])
+        return members
+
+    def set_group_members(self, memberships):
+        '''
+            Replaces the member nodes of the given node groups, 'memberships' maps group pk's to node pk's.
+        '''
+        through = NodeGroup.nodes.through
+        through.objects.filter(nodegroup_id__in=memberships.keys()).delete()
+        through.objects.bulk_create([through(nodegroup_id=group_pk, node_id=node_pk)
+                                     for group_pk, node_pks in memberships.iteritems() for node_pk in node_pks])
+
+    def update_fields(self, model, values):
+        '''
+            Stores model field values given as {pk: {field: value}}, with one bulk update per field.
+        '''
+        by_field = {}
+        for pk, fields in values.iteritems():
+            for field, value in fields.iteritems():
+                by_field.setdefault(field, {})[pk] = value
+        for field, field_values in by_field.iteritems():
+            bulk_update(model, field, field_values)
+
+    def apply_updates(self):
+        memberships = {}
+        for kind, (model, owner_field, section, native) in ELEMENT_TYPES.iteritems():
+            native_values = {}
+            for index, client_id, data in self.updates[kind]:
+                element = self.element(index, kind, client_id)
+                node_kind = element[1] if kind == 'node' else None
+                native_values[element[0]], texts = self.validate_properties(
+                    index, kind, data.get('properties', {}), node_kind)
+                self.properties[kind].setdefault(element[0], {}).update(texts)
+                if kind == 'nodegroup' and 'nodeIds' in data:
+                    memberships[element[0]] = self.group_members(index, data['nodeIds'])
+            self.update_fields(model, native_values)
+            model.objects.filter(pk__in=native_values.keys()).update(revision=self.revision)
+        self.set_group_members(memberships)
+
+    def apply_deletions(self):
+        '''
+            Marks the elements as deleted. As in Node.mark_deleted(), the edges of deleted nodes are deleted
+            as well, and the nodes are removed from their node groups.
+        '''
+        pks = {kind: [self.element(index, kind, client_id)[0] for index, client_id in self.deletions[kind]]
+               for kind in ELEMENT_TYPES}
+        if pks['node']:
+            Edge.objects.filter(graph=self.graph, deleted=False) \
+                        .filter(Q(source_id__in=pks['node']) | Q(target_id__in=pks['node'])) \
+                        .update(deleted=True, revision=self.revision)
+            NodeGroup.objects.filter(nodes__in=pks['node']).update(revision=self.revision)
+            NodeGroup.nodes.through.objects.filter(node_id__in=pks['node']).delete()
+        for kind, (model, owner_field, section, native) in ELEMENT_TYPES.iteritems():
+            if pks[kind]:
+                model.objects.filter(pk__in=pks[kind]).update(deleted=True, revision=self.revision)
@@ -0,0 +1,107 @@
+'''
+    Helpers for bulk database operations that are not offered by the Django version in use.
+'''
+
+import logging
+
+from django.db import connection
+from django.db.models import Case, When, Value
+
+logger = logging.getLogger('ore')
+
+# Rows per UPDATE query in bulk_update(), keeps the number of query parameters below the SQLite limit
+BULK_UPDATE_BATCH_SIZE = 300
+
+
+def reserve_pks(model, count):
+    '''
+        Reserves 'count' primary key values from the PostgreSQL sequence of the model table with one query.
+
+        Returns:
+         {list} the reserved primary keys
+    '''
+    table = model._meta.db_table
+    column = model._meta.pk.column
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                       [table, column, count])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def bulk_create_with_pks(model, objects, batch_size=None):
+    '''
+        Inserts the given unsaved model instances, and sets their primary keys.
+
+        Django 1.8 does not return primary keys from bulk_create(). On PostgreSQL, the keys are therefore
+        reserved from the table sequence in advance, which keeps the whole operation at two queries.
+        On SQLite, the rows of one bulk insert transaction get consecutive keys, so they can be derived
+        from the last inserted key. Other database backends fall back to saving the objects one by one.
+
+        Returns:
+         {list} the saved objects
+    '''
+    if not objects:
+        return objects
+    if connection.vendor == 'postgresql':
+        for obj, pk in zip(objects, reserve_pks(model, len(objects))):
+            obj.pk = pk
+        model.objects.bulk_create(objects, batch_size=batch_size)
+    elif connection.vendor == 'sqlite':
+        model.objects.bulk_create(objects, batch_size=batch_size)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT last_insert_rowid()")
+            last_pk = cursor.fetchone()[0]
+        for obj, pk in zip(objects, xrange(last_pk - len(objects) + 1, last_pk + 1)):
+            obj.pk = pk
+    else:
+        logger.debug("No bulk primary key support for %s, saving %u objects one by one" %
+                     (connection.vendor, len(objects)))
+        for obj in objects:
+            obj.save(force_insert=True)
+    return objects
+
+
+def bulk_update(model, field, values, **fixed):
+    '''
+        Sets 'field' of many model instances to individual values, with one UPDATE query per
+        BULK_UPDATE_BATCH_SIZE rows. 'values' maps primary keys to the new field values. Fields that get
+        the same value in all rows can be given as keyword arguments. No model signals are sent.
+    '''
+    output_field = model._meta.get_field(field)
+    pks = values.keys()
+    for start in xrange(0, len(pks), BULK_UPDATE_BATCH_SIZE):
+        chunk = pks[start:start + BULK_UPDATE_BATCH_SIZE]
+        updates = {field: Case(*[When(pk=pk, then=Value(values[pk])) for pk in chunk], output_field=output_field)}
+        updates.update(fixed)
+        model.objects.filter(pk__in=chunk).update(**updates)
+
+
+def bulk_save_properties(owner_field, values):
+    '''
+        Stores property text values for many owners of one type ('node', 'edge' or 'node_group'). 'values' maps
+        owner primary keys to {key: text value}. The existing properties are fetched with one query and updated
+        in bulk, missing ones are created with one bulk insert. The property documents of the owners are reset,
+        so that they are rebuilt on the next read (see property_owner). No model signals are sent.
+    '''
+    from .properties import Property
+    values = {owner_pk: props for owner_pk, props in values.iteritems() if props}
+    if not values:
+        return
+    owner_model = Property._meta.get_field(owner_field).rel.to
+    keys = set(key for props in values.itervalues() for key in props)
+    existing = {}
+    rows = Property.objects.filter(key__in=keys, **{owner_field + '_id__in': values.keys()}).order_by('pk')
+    for pk, owner_pk, key in rows.values_list('pk', owner_field + '_id', 'key'):
+        existing.setdefault((owner_pk, key), pk)
+    updates = {}
+    new_properties = []
+    for owner_pk, props in values.iteritems():
+        for key, text in props.iteritems():
+            if (owner_pk, key) in existing:
+                updates[existing[(owner_pk, key)]] = text
+            else:
+                new_properties.append(Property(key=key, value=text, **{owner_field + '_id': owner_pk}))
+    logger.debug("Updating %u and creating %u %s properties" % (len(updates), len(new_properties), owner_field))
+    bulk_update(Property, 'value', updates)
+    Property.objects.bulk_create(new_properties)
+    owner_model.objects.filter(pk__in=values.keys()).update(property_document=None)
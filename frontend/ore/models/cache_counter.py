@@ -0,0 +1,78 @@
+import threading
+import time
+
+from django.core.signals import request_finished
+from django.db import models, transaction, IntegrityError
+
+# Seconds between two writes of the counts of one process
+FLUSH_INTERVAL = 10.0
+
+_lock = threading.Lock()
+_pending = {}
+_flushed = [time.time()]
+
+
+class CacheCounter(models.Model):
+
+    """
+    Class: CacheCounter
+
+    A named event counter for the caches, such as the number of cache hits. The counters are kept in the database,
+    so that all worker processes count into the same value. Counting itself does not touch the database, since
+    cache hits must stay reads. The counts of a process are collected in memory and added to the database at
+    the end of a request, at most every FLUSH_INTERVAL seconds, and before the values are read.
+
+    Fields:
+     {str} name  - the name of the counter, e.g. 'serialization:hits'
+     {int} value - the current count
+    """
+
+    class Meta:
+        app_label = 'ore'
+
+    name = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def count(cls, name):
+        ''' Increments the given counter in memory, see flush().'''
+        with _lock:
+            _pending[name] = _pending.get(name, 0) + 1
+
+    @classmethod
+    def flush(cls):
+        ''' Adds the counts collected by this process to the database, with one UPDATE per counter.'''
+        with _lock:
+            pending = dict(_pending)
+            _pending.clear()
+            _flushed[0] = time.time()
+        for name, count in sorted(pending.iteritems()):
+            if cls.objects.filter(name=name).update(value=models.F('value') + count):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(name=name, value=count)
+            except IntegrityError:
+                # Created by another process in the meantime
+                cls.objects.filter(name=name).update(value=models.F('value') + count)
+
+    @classmethod
+    def values(cls, *names):
+        ''' Returns the current values of the given counters as tuple, counters that never counted are 0.'''
+        cls.flush()
+        counters = dict(cls.objects.filter(name__in=names).values_list('name', 'value'))
+        return tuple(counters.get(name, 0) for name in names)
+
+    @classmethod
+    def reset(cls, *names):
+        with _lock:
+            for name in names:
+                _pending.pop(name, None)
+        cls.objects.filter(name__in=names).update(value=0)
+
+
+def request_finished_handler(sender, **kwargs):
+    if _pending and time.time() - _flushed[0] > FLUSH_INTERVAL:
+        CacheCounter.flush()
+
+request_finished.connect(request_finished_handler)
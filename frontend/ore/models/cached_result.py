@@ -0,0 +1,148 @@
+import datetime
+import hashlib
+import logging
+import re
+import zlib
+
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+
+from .cache_counter import CacheCounter
+
+logger = logging.getLogger('ore')
+
+HITS_COUNTER = 'resultcache:hits'
+MISSES_COUNTER = 'resultcache:misses'
+
+# Bytes read at once from file-like result data
+COMPRESS_CHUNK_SIZE = 64 * 1024
+
+# Attributes of the XML root element that identify the graph, but do not influence the analysis
+ROOT_TAG = re.compile(r'<(?![?!])[^>]*>')
+GRAPH_ATTRIBUTES = re.compile(r'\s(?:id|name)="[^"]*"')
+
+
+def canonical_input(data):
+    '''
+        The job input without the graph ID and name in the XML root element, so that copies and
+        snapshots of a graph lead to the same input. TiKZ input contains neither of them, and refers
+        to nodes by their client ID, which copies keep.
+    '''
+    root = ROOT_TAG.search(data)
+    if root is None:
+        return data
+    return data[:root.start()] + GRAPH_ATTRIBUTES.sub('', root.group(0)) + data[root.end():]
+
+
+class CachedResult(models.Model):
+
+    """
+    Class: CachedResult
+
+    The raw backend result for a job input, shared between all graphs and users that submit the same input for the
+    same job kind. The result data is stored compressed. When the summed size of all entries exceeds the
+    RESULT_CACHE_SIZE setting, the least recently used entries are evicted.
+
+    Fields:
+     {str}      key       - hash of the job kind and the canonical job input, see input_hash()
+     {str}      kind      - the job kind
+     {bytes}    data      - the zlib-compressed backend result
+     {int}      size      - the length of the compressed result in bytes
+     {int}      model_id  - the graph ID that the backend result refers to
+     {int}      hits      - number of jobs that got this result from the cache
+     {datetime} created   - creation time of the entry
+     {datetime} last_used - time of the last cache hit, or the creation time
+    """
+
+    class Meta:
+        app_label = 'ore'
+
+    key = models.CharField(max_length=64, unique=True)
+    kind = models.CharField(max_length=127)
+    data = models.BinaryField()
+    size = models.IntegerField()
+    model_id = models.IntegerField()
+    hits = models.IntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    last_used = models.DateTimeField(db_index=True)
+
+    @classmethod
+    def input_hash(cls, kind, input_data):
+        ''' The cache key for the given job kind and job input.'''
+        if isinstance(input_data, unicode):
+            input_data = input_data.encode('utf-8')
+        return hashlib.sha256(kind + '\0' + canonical_input(input_data)).hexdigest()
+
+    @classmethod
+    def lookup(cls, key):
+        '''
+            Returns the uncompressed result data stored for the given key and the graph ID it refers to,
+            or None.
+        '''
+        entry = cls.objects.filter(key=key).values_list('pk', 'data', 'model_id').first()
+        if entry is None:
+            CacheCounter.count(MISSES_COUNTER)
+            return None
+        CacheCounter.count(HITS_COUNTER)
+        cls.objects.filter(pk=entry[0]).update(hits=models.F('hits') + 1, last_used=datetime.datetime.now())
+        return zlib.decompress(entry[1]), entry[2]
+
+    @classmethod
+    def store(cls, key, kind, data, model_id):
+        '''
+            Stores the result data for the given key, and evicts old entries if the cache became too large.
+            Results that are larger than the cache as a whole are not stored. File-like data is compressed
+            while reading it.
+        '''
+        if hasattr(data, 'read'):
+            compressor = zlib.compressobj()
+            chunks = [compressor.compress(chunk) for chunk in iter(lambda: data.read(COMPRESS_CHUNK_SIZE), '')]
+            chunks.append(compressor.flush())
+            compressed = ''.join(chunks)
+        else:
+            compressed = zlib.compress(data)
+        if len(compressed) > settings.RESULT_CACHE_SIZE:
+            logger.debug('Not caching %s result, size %u is above the limit' % (kind, len(compressed)))
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(key=key, kind=kind, data=compressed, size=len(compressed), model_id=model_id,
+                                   last_used=datetime.datetime.now())
+        except IntegrityError:
+            # Stored by a job with the same input in the meantime
+            return
+        cls.evict()
+
+    @classmethod
+    def evict(cls):
+        '''
+            Deletes the least recently used entries until the summed size is within the RESULT_CACHE_SIZE setting.
+        '''
+        total = cls.objects.aggregate(total=models.Sum('size'))['total'] or 0
+        if total <= settings.RESULT_CACHE_SIZE:
+            return
+        doomed = []
+        for pk, size in cls.objects.order_by('last_used', 'pk').values_list('pk', 'size').iterator():
+            if total <= settings.RESULT_CACHE_SIZE:
+                break
+            doomed.append(pk)
+            total -= size
+        logger.debug('Evicting %u cached results' % len(doomed))
+        cls.objects.filter(pk__in=doomed).delete()
+
+    @classmethod
+    def stats(cls):
+        '''
+            Returns the hit / miss counters and the current size of the cache, as dictionary.
+        '''
+        hits, misses = CacheCounter.values(HITS_COUNTER, MISSES_COUNTER)
+        usage = cls.objects.aggregate(entries=models.Count('pk'), size=models.Sum('size'))
+        return {'hits': hits,
+                'misses': misses,
+                'hit_rate': float(hits) / (hits + misses) if hits + misses else None,
+                'entries': usage['entries'],
+                'size': usage['size'] or 0}
+
+    @classmethod
+    def reset_stats(cls):
+        CacheCounter.reset(HITS_COUNTER, MISSES_COUNTER)
@@ -1,15 +1,16 @@
 import json
-import datetime
 
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.db import models
 
+from ore import graph_modification
 from .node import Node
 from .graph import Graph
+from .property_owner import PropertyOwner
 
 
-class Edge(models.Model):
+class Edge(PropertyOwner):
 
     """
     Class: Edge
@@ -22,15 +23,21 @@ class Edge(models.Model):
      {<Node>} target     - endpoint of the edge
      {bool}   deleted    - flag indicating whether the edge was deleted. Simplifies the restoration of the edge by
                            toggling this switch.
+     {int}    revision   - the graph revision of the last modification of this edge, see <Graph.changes_since>
     """
     class Meta:
         app_label = 'ore'
+        index_together = [('graph', 'revision')]
+
+    property_section = 'edges'
+    property_owner_field = 'edge'
 
     client_id = models.BigIntegerField()
     graph = models.ForeignKey(Graph, null=False, related_name='edges')
     source = models.ForeignKey(Node, null=False, related_name='outgoing')
     target = models.ForeignKey(Node, null=False, related_name='incoming')
     deleted = models.BooleanField(default=False)
+    revision = models.PositiveIntegerField(default=0, editable=False)
     # TODO: maybe add a reference to the graph. this would simplify the
     # JSON-serialization of the graph
 
@@ -48,13 +55,9 @@ class Edge(models.Model):
         Returns:
          {dict} the edge as dictionary
         """
+        prop_values = self.property_texts()
         if use_value_dict:
-            prop_values = {prop.key: {'value': prop.value}
-                           for prop in self.properties.filter(deleted=False)}
-        else:
-            prop_values = {
-                prop.key: prop.value for prop in self.properties.filter(
-                    deleted=False)}
+            prop_values = {key: {'value': value} for key, value in prop_values.iteritems()}
 
         return {
             'properties': prop_values,
@@ -109,23 +112,46 @@ class Edge(models.Model):
                 key=key, defaults={
                     'edge': self})
             prop.save_value(value)
+            # Reset by the Property signal handler in the database
+            self.property_document = None
 
-    def set_attrs(self, d):
+    def mark_deleted(self):
         '''
-            Set edge attributes according to the provided dictionary.
+            Deletes this edge by setting its deleted flag, so that the deletion remains visible in the graph changes.
+        '''
+        self.deleted = True
+        self.save()
 
-            TODO: Replace by true bulk insert implementation.
+    def set_attrs(self, d):
+        '''
+            Set edge attributes according to the provided dictionary. All property values are checked
+            against the notation first, and then stored with a constant number of queries.
         '''
-        for key, value in d.iteritems():
-            self.set_attr(key, value)
+        from .properties import Property
+        assert(self.pk)
+        # Native edge attributes, such as client_id
+        native = {key: value for key, value in d.iteritems() if hasattr(self, key)}
+        Property.save_values(self, {key: value for key, value in d.iteritems() if key not in native})
+        for key, value in native.iteritems():
+            setattr(self, key, value)
         post_save.send(sender=self.__class__, instance=self)
 
 
-@receiver(post_save, sender=Edge)
+@receiver(pre_save, sender=Edge)
 @receiver(pre_delete, sender=Edge)
+def graph_content_modify(sender, instance, **kwargs):
+    # snapshots that share the graph content get their own copy before it changes
+    if not kwargs.get('raw'):
+        graph_modification.before_modification(instance.graph_id)
+
+
+@receiver(post_save, sender=Edge)
+@receiver(post_delete, sender=Edge)
 def graph_modify(sender, instance, **kwargs):
-    instance.graph.modified = datetime.datetime.now()
-    instance.graph.save()
-    # updating project modification date
-    instance.graph.project.modified = instance.graph.modified
-    instance.graph.project.save()
+    # increments the graph revision, which invalidates cached serializations,
+    # and updates the graph and project modification dates. Deletions are reported
+    # once the row is gone, so that no reader caches the old state under the new revision.
+    if kwargs['signal'] is post_save:
+        graph_modification.element_modified(instance)
+    else:
+        graph_modification.graph_modified(instance.graph_id)
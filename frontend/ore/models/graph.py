@@ -2,20 +2,18 @@ import json
 import notations
 
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.aggregates import Max
+from django.db import models, transaction
 
-import pyxb.utils.domutils
 try:
-    from .xml_fuzztree import FuzzTree as XmlFuzzTree, Namespace as XmlFuzzTreeNamespace, CreateFromDocument as fuzzTreeFromXml
-    from .xml_faulttree import FaultTree as XmlFaultTree, Namespace as XmlFaultTreeNamespace, CreateFromDocument as faultTreeFromXml
+    from .xml_fuzztree import CreateFromDocument as fuzzTreeFromXml
+    from .xml_faulttree import CreateFromDocument as faultTreeFromXml
     from .node_rendering import tikz_shapes
 except Exception:
     print "ERROR: Perform a build process first."
     exit(-1)
-from defusedxml.ElementTree import fromstring as parseXml
 
 from .project import Project
+from ore import serialization_cache, graph_modification
 
 import logging
 logger = logging.getLogger('ore')
@@ -39,6 +37,10 @@ class Graph(models.Model):
      {bool}           deleted      - flag indicating whether this graph was deleted or not. Simplifies restoration of the
                                      graph if needed by toggling this member (default: False)
      {JSON}           graph_issues -
+     {int}            revision     - incremented with every modification of the graph or its elements, used as key
+                                     for cached serializations
+     {Graph}          content_source - the graph whose nodes, edges and node groups are shared by this snapshot, or
+                                     None if the graph has its own content (see <snapshot>)
     """
     class Meta:
         app_label = 'ore'
@@ -51,18 +53,157 @@ class Graph(models.Model):
     modified = models.DateTimeField(auto_now=True)
     deleted = models.BooleanField(default=False)
     read_only = models.BooleanField(default=False)
+    revision = models.PositiveIntegerField(default=0, editable=False)
+    content_source = models.ForeignKey('self', null=True, blank=True, editable=False, on_delete=models.SET_NULL,
+                                       related_name='shared_snapshots')
 
     def __unicode__(self):
         return unicode(
             '%s%s' % ('[DELETED] ' if self.deleted else '', self.name))
 
+    def save(self, *args, **kwargs):
+        """
+        Method: save
+            Every update of an existing graph increments its revision in the database. The value is not taken from the
+            instance, so that outdated instances can never move the revision backwards.
+        """
+        if self._state.adding:
+            super(Graph, self).save(*args, **kwargs)
+        else:
+            self.revision = models.F('revision') + 1
+            super(Graph, self).save(*args, **kwargs)
+            self.revision = self.current_revision()
+
+    def current_revision(self):
+        """
+        Method: current_revision
+            Fetches the latest revision number of this graph from the database. Collected modifications are
+            written before, so that the revision covers them (see <graph_modification>).
+
+        Returns:
+            {int} The revision number
+        """
+        if graph_modification.is_pending(self.pk):
+            graph_modification.flush()
+        return Graph.objects.filter(pk=self.pk).values_list('revision', flat=True).get()
+
+    @classmethod
+    def bump_revision(cls, pk):
+        """
+        Method: bump_revision
+            Increments the revision of the graph with the given primary key, for modifications that do not save
+            the graph itself.
+
+        Returns:
+            {int} The new revision number
+        """
+        cls.objects.filter(pk=pk).update(revision=models.F('revision') + 1)
+        return cls.objects.filter(pk=pk).values_list('revision', flat=True).get()
+
+    def delete(self, *args, **kwargs):
+        """
+        Method: delete
+            Snapshots that share the content of this graph get their own copy before it is deleted.
+        """
+        graph_modification.before_modification(self.pk)
+        super(Graph, self).delete(*args, **kwargs)
+
+    def snapshot(self, name, owner, project):
+        """
+        Method: snapshot
+            Creates a read-only snapshot of this graph. The snapshot shares the nodes, edges, node groups and properties
+            of this graph instead of copying them, so that the creation takes a constant number of queries. The content
+            is only copied when one of the graphs is modified later on (see <detach_snapshots>). Snapshots of snapshots
+            share the content of the original graph.
+
+        Returns:
+            {Graph} The new snapshot
+        """
+        source_pk = self.content_source_id or self.pk
+        snapshot = Graph(kind=self.kind, name=name, owner=owner, project=project, read_only=True,
+                         content_source_id=source_pk)
+        snapshot.save()
+        # A modification of the source in the same collection must detach the new snapshot
+        graph_modification.content_shared(source_pk)
+        return snapshot
+
+    def content_graph(self):
+        """
+        Method: content_graph
+            The graph whose node, edge and node group rows make up the content of this graph. This is the graph itself,
+            unless it is a snapshot that still shares the content of its source.
+
+        Returns:
+            {Graph} The graph holding the content
+        """
+        if self.content_source_id is None:
+            return self
+        return self.content_source
+
+    def materialize(self, sharing_pks=()):
+        """
+        Method: materialize
+            Gives a snapshot its own copy of the shared content. The results of the snapshot, and of the snapshots
+            in 'sharing_pks' that share the copy afterwards, are moved to the copied nodes. Nothing is copied if the
+            snapshot was materialized meanwhile, e.g. through another instance or by a concurrent request.
+        """
+        from .graph_copy import copy_graph
+        if self.content_source_id is None:
+            return
+        source = self.content_source
+        with transaction.atomic():
+            # Unlinked first, so that the copied elements are not treated as shared content again. Only the
+            # request that actually unlinks the snapshot copies the content.
+            unlinked = Graph.objects.filter(pk=self.pk, content_source=source.pk).update(content_source=None)
+            self.content_source = None
+            if not unlinked:
+                return
+            copy_graph(source, self, sharing_pks)
+        logger.debug("Materialized snapshot %u of graph %u" % (self.pk, source.pk))
+
+    @classmethod
+    def detach_snapshots(cls, pk):
+        """
+        Method: detach_snapshots
+            Must run before the content of the graph with the given primary key is modified, see
+            <graph_modification.before_modification>. If the graph itself is a snapshot that shares the content of
+            another graph, it gets its own copy. If other snapshots share the content of the graph, the first of them
+            gets a copy, and the remaining ones share this copy from now on. The content is therefore only duplicated
+            once, no matter how many snapshots there are. Without shared content, this takes one query.
+        """
+        sharing = models.Q(pk=pk, content_source__isnull=False) | models.Q(content_source=pk)
+        if not cls.objects.filter(sharing).exists():
+            return
+        with transaction.atomic():
+            # Read again and locked, so that concurrent modifications of the graph detach its snapshots only once
+            graphs = list(cls.objects.select_for_update().filter(sharing).order_by('pk'))
+            for graph in graphs:
+                if graph.pk == pk:
+                    graph.materialize()
+            snapshots = [graph for graph in graphs if graph.pk != pk]
+            if snapshots:
+                snapshots[0].materialize([snapshot.pk for snapshot in snapshots[1:]])
+                cls.objects.filter(pk__in=[snapshot.pk for snapshot in snapshots[1:]]) \
+                           .update(content_source=snapshots[0].pk)
+
+    @staticmethod
+    def stamp_revision(element, revision):
+        """
+        Method: stamp_revision
+            Marks the given node, edge or node group as modified in the given graph revision, so that it is reported
+            by <changes_since>.
+        """
+        element.revision = revision
+        type(element).objects.filter(pk=element.pk).update(revision=revision)
+
     def ensure_default_nodes(self):
         """
             Add nodes that are contained in this kind of graph by default,
             in case they are missing.
         """
         notation = notations.by_kind[self.kind]
-        if 'defaults' in notation:
+        # Shared snapshot content contains the default nodes of its source already
+        if 'defaults' in notation and self.content_source_id is None:
             from .node import Node
             for index, default_node in enumerate(
                     notation['defaults']['nodes']):
@@ -89,7 +230,7 @@ class Graph(models.Model):
          {Node} instance
         """
         if self.kind in {'faulttree', 'fuzztree'}:
-            return self.nodes.all().get(kind='topEvent')
+            return self.content_graph().nodes.all().get(kind='topEvent')
         else:
             return None
 
@@ -102,72 +243,137 @@ class Graph(models.Model):
         Returns:
          {dict} the graph in JSON representation
         """
-        return json.dumps(self.to_dict(use_value_dict))
+        return serialization_cache.get_or_render(
+            self, 'json', (use_value_dict,), lambda use_value_dict: json.dumps(self.to_dict(use_value_dict)))
 
     def to_dict(self, use_value_dict=False):
         """
         Method: to_dict
 
-        Encodes the whole graph as dictionary.
+        Encodes the whole graph as dictionary. The graph content is fetched with a constant number of
+        queries, see <PreloadedGraph>.
 
         Returns:
          {dict} the graph as dictionary
         """
-        node_set = self.nodes.filter(deleted=False)
-        edge_set = self.edges.filter(deleted=False)
-        group_set = self.groups.filter(deleted=False)
-        nodes = [node.to_dict(use_value_dict) for node in node_set]
-        edges = [edge.to_dict(use_value_dict) for edge in edge_set]
-        groups = [group.to_dict(use_value_dict) for group in group_set]
-
-        node_seed = self.nodes.aggregate(Max('client_id'))['client_id__max']
-        edge_seed = self.edges.aggregate(Max('client_id'))['client_id__max']
-        group_seed = self.groups.aggregate(Max('client_id'))['client_id__max']
-
-        return {
-            'id': self.pk,
-            'seed': max(node_seed, edge_seed, group_seed),
-            'name': self.name,
-            'type': self.kind,
-            'readOnly': self.read_only,
-            'nodes': nodes,
-            'edges': edges,
-            'nodeGroups': groups
-        }
+        return self.preload().to_dict(use_value_dict)
+
+    def preload(self):
+        """
+        Method: preload
+
+        Fetches all nodes, edges, node groups and properties of this graph into memory.
+
+        Returns:
+         {PreloadedGraph} the in-memory copy of the graph content
+        """
+        from .preloaded_graph import PreloadedGraph
+        return PreloadedGraph(self)
+
+    def changes_since(self, revision, use_value_dict=False):
+        """
+        Method: changes_since
+
+        Encodes the nodes, edges and node groups that were created, modified or deleted after the given revision of
+        this graph. Deleted elements are listed by their client ID in the 'deleted' entry.
+
+        Returns:
+         {dict} the changes, in the format of <to_dict>
+        """
+        from .preloaded_graph import PreloadedChanges
+        return PreloadedChanges(self, revision).to_dict(use_value_dict)
+
+    def apply_batch(self, operations, use_value_dict=False):
+        """
+        Method: apply_batch
+
+        Applies a list of node, edge and node group operations in one transaction, see <GraphBatch> for the format.
+        Raises a ValueError for invalid operations, the graph is not modified then.
+
+        Returns:
+         {dict} the resulting changes of the graph, in the format of <changes_since>
+        """
+        from .batch import GraphBatch
+        revision = GraphBatch(self, operations).apply()
+        return self.changes_since(revision - 1, use_value_dict)
 
     def to_bool_term(self):
-        root = self.nodes.get(kind__exact='topEvent')
+        root = self.content_graph().nodes.get(kind__exact='topEvent')
         return root.to_bool_term()
 
     def to_graphml(self):
-        graphKindData = '        <data key="kind">%s</data>\n' % (self.kind)
+        """
+        Method: to_graphml
+            Serializes the graph into its GraphML representation.
+
+        Returns:
+            {string} The GraphML representation of the graph
+        """
+        return ''.join(self.iter_graphml())
+
+    def iter_graphml(self):
+        """
+        Method: iter_graphml
+            Generates the GraphML representation of the graph chunk by chunk, or returns the cached result.
+
+        Returns:
+            {generator} The GraphML text chunks
+        """
+        return serialization_cache.iter_or_render(self, 'graphml', (), self.render_graphml)
+
+    def render_graphml(self):
+        """
+        Method: render_graphml
+            Generates the GraphML representation of the graph chunk by chunk. Nodes and edges are read with
+            queryset iterators, so that memory consumption does not grow with the graph size. The node properties
+            are taken from the property documents, missing documents are rebuilt in bulk before.
+
+        Returns:
+            {generator} The GraphML text chunks, one per node or edge
+        """
+        from .node import Node
+        from .edge import Edge
+        from .property_owner import build_documents
+
+        yield ('<?xml version="1.0" encoding="utf-8"?>\n'
+               '<graphml xmlns="http://graphml.graphdrawing.org/xmlns"\n'
+               '         xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n'
+               '         xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns\n'
+               '                             http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n'
+               '    <graph id="graph" edgedefault="directed">\n')
+        yield notations.graphml_keys[self.kind]
+        yield '\n'
+        yield '        <data key="kind">%s</data>\n' % (self.kind)
         if self.kind in {'faulttree', 'fuzztree'}:
-            missionData = '        <data key="missionTime">%d</data>\n' % (
-                self.top_node().get_property('missionTime'),)
-        else:
-            missionData = ''
-
-        return ''.join([
-            '<?xml version="1.0" encoding="utf-8"?>\n'
-            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns"\n'
-            '         xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n'
-            '         xsi:schemaLocation="http://graphml.graphdrawing.org/xmlns\n'
-            '                             http://graphml.graphdrawing.org/xmlns/1.0/graphml.xsd">\n'
-            '    <graph id="graph" edgedefault="directed">\n',
-            notations.graphml_keys[self.kind],
-            '\n',
-            graphKindData,
-            missionData] +
-            [node.to_graphml() for node in self.nodes.filter(deleted=False)] +
-            [edge.to_graphml() for edge in self.edges.filter(deleted=False)] +
-
-            ['    </graph>\n'
-             '</graphml>\n'
-             ])
+            yield '        <data key="missionTime">%d</data>\n' % (self.top_node().get_property('missionTime'),)
+
+        content = self.content_graph()
+        nodes = Node.objects.filter(graph=content, deleted=False)
+        build_documents(Node, self.kind, list(nodes.filter(property_document=None).values_list('pk', 'kind')))
+        for node in nodes.order_by('pk').iterator():
+            node.graph = self
+            yield node.to_graphml()
+
+        for edge in Edge.objects.filter(graph=content, deleted=False).order_by('pk') \
+                                .select_related('source', 'target').iterator():
+            yield edge.to_graphml()
+
+        yield ('    </graph>\n'
+               '</graphml>\n')
 
     def to_tikz(self):
         """
         Method: to_tikz
+            Translates the graph into a LaTex TIKZ representation, or returns the cached result.
+
+        Returns:
+            {string} The TIKZ representation of the graph
+        """
+        return serialization_cache.get_or_render(self, 'tikz', (), self.render_tikz)
+
+    def render_tikz(self):
+        """
+        Method: render_tikz
             Translates the graph into a LaTex TIKZ representation.
 
         Returns:
@@ -196,12 +402,13 @@ class Graph(models.Model):
         """
         # Find most left node and takes it's x coordinate as start offset
         # This basically shifts the whole tree to the left border
-        minx = self.nodes.aggregate(min_x=models.Min('x'))['min_x']
+        content = self.content_graph()
+        minx = content.nodes.aggregate(min_x=models.Min('x'))['min_x']
         # Find root node and start from there
         # Use the TOP node Y coordinate as starting point at the upper border
         # Note: (0,0) is the upper left corder in TiKZ, but the lower left in
         # the DB
-        top_event = self.nodes.get(kind='topEvent')
+        top_event = content.nodes.get(kind='topEvent')
         result += top_event.to_tikz(x_offset=-minx, y_offset=top_event.y)
 #        result += top_event.to_tikz_tree()
         result += """
@@ -220,30 +427,12 @@ class Graph(models.Model):
         Returns:
             {string} The XML representation of the graph
         """
-        bds = pyxb.utils.domutils.BindingDOMSupport()
-        if xmltype:
-            kind = xmltype
-        else:
-            kind = self.kind
-        if kind == "fuzztree":
-            tree = XmlFuzzTree(name=self.name, id=self.pk)
-            bds.DeclareNamespace(XmlFuzzTreeNamespace, 'fuzzTree')
-        elif kind == "faulttree":
-            tree = XmlFaultTree(name=self.name, id=self.pk)
-            bds.DeclareNamespace(XmlFaultTreeNamespace, 'faultTree')
-        else:
-            raise ValueError('No XML support for this graph type.')
-
-        # Find root node and start from there
-        top_event = self.nodes.get(kind='topEvent')
-        tree.topEvent = top_event.to_xml(kind)
-
-        dom = tree.toDOM(bds)
-        return dom.toprettyxml()
+        return serialization_cache.get_or_render(
+            self, 'xml', (xmltype or self.kind,), lambda xmltype: self.preload().to_xml(xmltype))
 
     def from_xml(self, xml):
-        ''' Fill this graph with the information gathered from the XML.'''
-        from .node import Node
+        ''' Fill this graph with the information gathered from the XML, with bulk inserts (see <XmlImport>).'''
+        from .xml_import import XmlImport
         if self.kind == "fuzztree":
             tree = fuzzTreeFromXml(xml)
         elif self.kind == "faulttree":
@@ -253,138 +442,24 @@ class Graph(models.Model):
 
         self.name = tree.name
         self.save()
-        top = Node(graph=self)
-        top.load_xml(tree.topEvent)
+        XmlImport(self).run(tree.topEvent)
 
     def from_graphml(self, graphml):
         '''
-            Parses the given GraphML with the DefusedXML library, for better security.
+            Fills this graph from the given GraphML text or file-like object. The document is parsed incrementally
+            with the DefusedXML library, for better security, and imported with bulk inserts (see <GraphmlImport>).
         '''
-        from .node import Node, new_client_id
-        from .edge import Edge
-        dom = parseXml(graphml)
-        graph = dom.find('{http://graphml.graphdrawing.org/xmlns}graph')
-        if graph is None:
-            raise Exception(
-                'Could not find <graph> element in the input data.')
-        if graph.get('edgedefault') != 'directed':
-            raise Exception(
-                'Only GraphML documents with directed edges are supported.')
-        # Determine graph type, in order to check for the right format rules
-        graph_kind_element = graph.find(
-            "{http://graphml.graphdrawing.org/xmlns}data[@key='kind']")
-        if graph_kind_element is None:
-            raise Exception(
-                'Missing <data> element for graph kind declaration.')
-        graph_kind = graph_kind_element.text
-        if graph_kind not in notations.graphml_node_data:
-            raise Exception('Invalid graph kind declaration.')
-        else:
-            self.kind = graph_kind
-        # Save graph object to get a valid, which is needed in the node refs
-        self.save()
-        # go through all GraphML nodes and create them as model nodes for this
-        # graph
-        id_map = {}           # GraphML node ID's to node model PK's
-        for gml_node in graph.iter(
-                '{http://graphml.graphdrawing.org/xmlns}node'):
-            gml_node_id = gml_node.get('id')
-            node = Node(graph=self, client_id=int(gml_node_id))
-            node.save()     # get a valid pk
-            id_map[gml_node_id] = node.pk
-            # Scan all data elements for the node
-            for gml_node_data in gml_node.iter(
-                    '{http://graphml.graphdrawing.org/xmlns}data'):
-                name = gml_node_data.get('key')
-                value = gml_node_data.text
-                if name not in notations.graphml_node_data[graph_kind]:
-                    raise Exception("Invalid graph node element '%s'" % name)
-                # set according node properties
-                if name == 'kind':
-                    node.kind = value
-                    node.save()
-                else:
-                    node.set_attr(name, value)
-            # logger.debug("New node from GraphML import: "+str(node.to_dict()))
-        # Graph properties belong to the TOP node
-        # GraphML files without graph <data> properties may refer to a graph type that has no
-        # TOP node concept
-        for data in graph.findall(
-                '{http://graphml.graphdrawing.org/xmlns}data'):
-            name = data.get('key')
-            if name != 'kind':          # already handled above
-                if name not in notations.graphml_graph_data[graph_kind]:
-                    raise Exception("Invalid graph data element '%s'" % name)
-                logger.debug(
-                    "Setting attribute %s to %s on top node" %
-                    (name, data.text))
-                self.top_node().set_attr(
-                    name,
-                    data.text)   # Fetch TOP node here, not existent in RBD's
-
-        # go through all GraphML edges and create them as model edges for this
-        # graph
-        for gml_edge in graph.iter(
-                '{http://graphml.graphdrawing.org/xmlns}edge'):
-            source = Node.objects.get(pk=id_map[gml_edge.get('source')])
-            target = Node.objects.get(pk=id_map[gml_edge.get('target')])
-            edge = Edge(
-                graph=self,
-                source=source,
-                target=target,
-                client_id=new_client_id())
-            edge.save()
+        from .graphml_import import GraphmlImport
+        GraphmlImport(self).run(graphml)
 
     def copy_values(self, other):
-        # copy all nodes, groups and their properties
-        node_cache = {}
-
-        for node in other.nodes.all():
-            # first cache the old node's properties
-            properties = node.properties.all()
-
-            # create node copy by overwriting the ID field
-            old_id = node.pk
-            node.pk = None
-            node.graph = self
-            node.save()
-            node_cache[old_id] = node
-
-            # now save the property objects for the new node
-            for prop in properties:
-                prop.pk = None
-                prop.node = node
-                prop.save()
-
-        for edge in other.edges.all():
-            properties = edge.properties.all()
-            edge.pk = None
-            edge.source = node_cache[edge.source.pk]
-            edge.target = node_cache[edge.target.pk]
-            edge.graph = self
-            edge.save()
-
-            # now save the property objects for the new edge
-            for prop in properties:
-                prop.pk = None
-                prop.edge = edge
-                prop.save()
-
-        from .node_group import NodeGroup
-        for group in other.groups.all():
-            # create group copy by overwriting the ID field
-            newgroup = NodeGroup(graph=self)
-            newgroup.save()         # prepare M2M field
-            for node in group.nodes.all():
-                newgroup.nodes.add(node_cache[node.pk])
-            newgroup.save()
-
-            # now save the property objects for the new group
-            for prop in group.properties.all():
-                prop.pk = None
-                prop.node_group = newgroup
-                prop.save()
-
+        """
+        Method: copy_values
+            Copies all nodes, edges, node groups and their properties of the other graph into this graph,
+            with bulk inserts (see <graph_copy>). The read-only flag is taken over as well.
+        """
+        from .graph_copy import copy_graph
+        copy_graph(other.content_graph(), self)
         self.read_only = other.read_only
         self.save()
 
@@ -420,9 +495,10 @@ class Graph(models.Model):
             difflines = difflib.unified_diff(text1, text2)
             logger.debug('\n'.join(difflines))
 
-        for my_node in self.nodes.all().filter(deleted=False):
+        mine, theirs = self.content_graph(), graph.content_graph()
+        for my_node in mine.nodes.all().filter(deleted=False):
             found_match = False
-            for their_node in graph.nodes.all().filter(deleted=False):
+            for their_node in theirs.nodes.all().filter(deleted=False):
                 logger.debug(
                     "Checking our %s (%u) against %s (%u)" %
                     (str(my_node), my_node.pk, str(their_node), their_node.pk))
@@ -437,9 +513,9 @@ class Graph(models.Model):
                 error_reporting()
                 return False
 
-        for my_group in self.groups.all().filter(deleted=False):
+        for my_group in mine.groups.all().filter(deleted=False):
             found_match = False
-            for their_group in graph.groups.all().filter(deleted=False):
+            for their_group in theirs.groups.all().filter(deleted=False):
                 if my_group.same_as(their_group):
                     found_match = True
                     break
@@ -0,0 +1,102 @@
+'''
+    Bulk copy of all elements of a graph into another graph, see Graph.copy_values().
+
+    Every table is read once and written with bulk inserts. The primary keys of the new nodes, edges and node groups
+    are mapped from the old ones, so that edges, properties and group memberships can be pointed to the copies.
+    The number of statements does not depend on the graph size, apart from the batching of large inserts.
+'''
+
+import datetime
+import logging
+
+from django.db import transaction
+
+from .bulk import bulk_create_with_pks, bulk_update
+from .graph import Graph
+from .project import Project
+from .node import Node
+from .edge import Edge
+from .node_group import NodeGroup
+from .properties import Property
+from .node_configuration import NodeConfiguration
+
+logger = logging.getLogger('ore')
+
+# Foreign keys of elements that point to nodes, they are mapped to the copied nodes
+NODE_FIELDS = ('source_id', 'target_id')
+
+
+def copied_fields(model):
+    ''' The column attributes of the model that are taken over into a copy.'''
+    return [field.attname for field in model._meta.concrete_fields
+            if not field.primary_key and field.attname not in ('graph_id', 'revision')]
+
+
+def copy_elements(model, source, target, revision, node_pks=None):
+    '''
+        Copies all nodes, edges or node groups of the source graph into the target graph, including the deleted ones.
+        The copies are stamped with the given target graph revision. Foreign keys to nodes are mapped with 'node_pks'.
+
+        Returns:
+         {dict} old primary key to new primary key
+    '''
+    fields = copied_fields(model)
+    node_fields = [field for field in fields if field in NODE_FIELDS]
+    rows = list(model.objects.filter(graph=source).order_by('pk').values_list('pk', *fields))
+    copies = []
+    for row in rows:
+        values = dict(zip(fields, row[1:]))
+        for field in node_fields:
+            values[field] = node_pks[values[field]]
+        copies.append(model(graph_id=target.pk, revision=revision, **values))
+    bulk_create_with_pks(model, copies)
+    return {row[0]: copy.pk for row, copy in zip(rows, copies)}
+
+
+def copy_properties(owner_field, source, owner_pks):
+    '''
+        Copies the properties of all owners of one type in the source graph to the new owners.
+    '''
+    rows = Property.objects.filter(**{owner_field + '__graph': source}) \
+                           .order_by('pk') \
+                           .values_list(owner_field + '_id', 'key', 'value', 'deleted')
+    Property.objects.bulk_create([Property(key=key, value=value, deleted=deleted,
+                                           **{owner_field + '_id': owner_pks[owner_pk]})
+                                  for owner_pk, key, value, deleted in rows])
+
+
+def remap_node_configurations(graph_pks, node_pks):
+    '''
+        Points the node configurations of the given graphs, which refer to nodes of the copied graph, to the
+        copied nodes.
+    '''
+    rows = NodeConfiguration.objects.filter(configuration__graph__in=graph_pks).values_list('pk', 'node_id')
+    bulk_update(NodeConfiguration, 'node', {pk: node_pks[node_pk] for pk, node_pk in rows if node_pk in node_pks})
+
+
+def copy_graph(source, target, sharing_pks=()):
+    '''
+        Copies all nodes, edges, node groups, their properties and the group memberships of the source graph into
+        the target graph, in one transaction. Analysis results of the target and of the graphs in 'sharing_pks',
+        which share the content of the target from now on, may refer to nodes of the source graph. Their node
+        configurations are pointed to the copies.
+    '''
+    with transaction.atomic():
+        revision = Graph.bump_revision(target.pk)
+        node_pks = copy_elements(Node, source, target, revision)
+        edge_pks = copy_elements(Edge, source, target, revision, node_pks)
+        group_pks = copy_elements(NodeGroup, source, target, revision)
+        copy_properties('node', source, node_pks)
+        copy_properties('edge', source, edge_pks)
+        copy_properties('node_group', source, group_pks)
+        through = NodeGroup.nodes.through
+        memberships = through.objects.filter(nodegroup__graph=source).order_by('pk') \
+                                     .values_list('nodegroup_id', 'node_id')
+        through.objects.bulk_create([through(nodegroup_id=group_pks[group_pk], node_id=node_pks[node_pk])
+                                     for group_pk, node_pk in memberships])
+        remap_node_configurations([target.pk] + list(sharing_pks), node_pks)
+        now = datetime.datetime.now()
+        Graph.objects.filter(pk=target.pk).update(modified=now)
+        Project.objects.filter(pk=target.project_id).update(modified=now)
+    logger.debug("Copied %u nodes, %u edges and %u node groups from graph %u to graph %u" %
+                 (len(node_pks), len(edge_pks), len(group_pks), source.pk, target.pk))
@@ -0,0 +1,192 @@
+'''
+    Streaming bulk import of GraphML documents, see Graph.from_graphml().
+'''
+
+import datetime
+import json
+import logging
+from cStringIO import StringIO
+
+from django.db import transaction
+from defusedxml.ElementTree import iterparse
+
+from ore import graph_modification
+
+from .bulk import bulk_create_with_pks
+from .graph import Graph
+from .project import Project
+from .node import Node
+from .edge import Edge
+from .properties import Property
+from . import notations
+
+logger = logging.getLogger('ore')
+
+GRAPHML = '{http://graphml.graphdrawing.org/xmlns}'
+
+# Nodes per bulk insert, also the maximum number of parsed nodes that are kept in memory
+NODE_BATCH_SIZE = 500
+
+# Node attributes that are stored in model fields instead of properties
+NODE_FIELDS = ('kind', 'x', 'y')
+
+
+class GraphmlImport(object):
+
+    """
+    Class: GraphmlImport
+
+    Fills a graph with the nodes, edges and graph properties of a GraphML document. The document is parsed
+    incrementally, and every parsed element is discarded right away. Nodes are validated against the notation and
+    inserted in batches, together with their properties. Edges are kept as pairs of GraphML node ID's and inserted
+    at the end, since they may refer to nodes that come later in the document. Everything happens in one transaction.
+
+    Fields:
+     {Graph} graph      - the graph to be filled
+     {str}   graph_kind - the graph kind declared in the document, None until it was found
+     {int}   revision   - the graph revision the imported elements are stamped with
+     {list}  nodes      - parsed nodes that are not inserted yet, as (GraphML ID, [(key, text)]) tuples
+     {list}  edges      - parsed edges, as (GraphML source ID, GraphML target ID) tuples
+     {list}  graph_data - (key, text) tuples of the graph <data> elements
+     {dict}  node_pks   - GraphML node ID to node primary key
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.graph_kind = None
+        self.revision = None
+        self.nodes = []
+        self.edges = []
+        self.graph_data = []
+        self.node_pks = {}
+
+    def run(self, graphml):
+        '''
+            Imports the given GraphML text or file-like object.
+        '''
+        if isinstance(graphml, unicode):
+            graphml = graphml.encode('utf-8')
+        if isinstance(graphml, str):
+            graphml = StringIO(graphml)
+        with transaction.atomic():
+            self.parse(graphml)
+            self.insert_edges()
+            self.apply_graph_data()
+            now = datetime.datetime.now()
+            Graph.objects.filter(pk=self.graph.pk).update(modified=now)
+            Project.objects.filter(pk=self.graph.project_id).update(modified=now)
+        logger.debug("Imported %u nodes and %u edges from GraphML into graph %u" %
+                     (len(self.node_pks), len(self.edges), self.graph.pk))
+
+    def parse(self, source):
+        '''
+            Walks through the document, only the element currently parsed and its children are kept in memory.
+        '''
+        path = []
+        graph_element = None
+        for event, element in iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                path.append(element.tag)
+                if element.tag == GRAPHML + 'graph' and graph_element is None:
+                    if element.get('edgedefault') != 'directed':
+                        raise Exception('Only GraphML documents with directed edges are supported.')
+                    graph_element = element
+                continue
+            path.pop()
+            if graph_element is None or not path or path[-1] != GRAPHML + 'graph':
+                # Only direct children of the graph are of interest, the rest is handled by them
+                continue
+            if element.tag == GRAPHML + 'node':
+                data = [(data.get('key'), data.text) for data in element.iter(GRAPHML + 'data')]
+                self.nodes.append((element.get('id'), data))
+                if len(self.nodes) >= NODE_BATCH_SIZE and self.graph_kind:
+                    self.insert_nodes()
+            elif element.tag == GRAPHML + 'edge':
+                self.edges.append((element.get('source'), element.get('target')))
+            elif element.tag == GRAPHML + 'data':
+                if element.get('key') == 'kind':
+                    self.set_graph_kind(element.text)
+                else:
+                    self.graph_data.append((element.get('key'), element.text))
+            graph_element.remove(element)
+        if graph_element is None:
+            raise Exception('Could not find <graph> element in the input data.')
+        if self.graph_kind is None:
+            raise Exception('Missing <data> element for graph kind declaration.')
+        self.insert_nodes()
+
+    def set_graph_kind(self, graph_kind):
+        '''
+            Takes over the graph kind declaration, the graph is saved to get a valid primary key for the nodes.
+        '''
+        if graph_kind not in notations.graphml_node_data:
+            raise Exception('Invalid graph kind declaration.')
+        self.graph_kind = graph_kind
+        self.graph.kind = graph_kind
+        self.graph.save()
+        graph_modification.before_modification(self.graph.pk)
+        self.revision = Graph.bump_revision(self.graph.pk)
+
+    def insert_nodes(self):
+        '''
+            Validates the parsed nodes against the notation, and inserts them and their properties in bulk.
+        '''
+        if not self.nodes:
+            return
+        allowed = notations.graphml_node_data[self.graph_kind]
+        nodes = []
+        texts = []
+        for gml_node_id, data in self.nodes:
+            fields, properties = {}, {}
+            for name, value in data:
+                if name not in allowed:
+                    raise Exception("Invalid graph node element '%s'" % name)
+                if name in NODE_FIELDS:
+                    fields[name] = Node._meta.get_field(name).to_python(value)
+                else:
+                    properties[name] = value
+            node_kind = fields.get('kind', '')
+            node_texts, document = {}, {}
+            for key, value in properties.iteritems():
+                val_type = Property.notation_value_type(key, self.graph_kind, 'nodes', node_kind)
+                node_texts[key] = Property.value_to_text(val_type, value)
+                document[key] = Property.text_to_value(val_type, node_texts[key])
+            nodes.append(Node(graph_id=self.graph.pk, revision=self.revision, client_id=int(gml_node_id),
+                              property_document=json.dumps(document), **fields))
+            texts.append(node_texts)
+        bulk_create_with_pks(Node, nodes)
+        Property.objects.bulk_create([Property(node_id=node.pk, key=key, value=text)
+                                      for node, node_texts in zip(nodes, texts)
+                                      for key, text in node_texts.iteritems()])
+        for (gml_node_id, data), node in zip(self.nodes, nodes):
+            self.node_pks[gml_node_id] = node.pk
+        self.nodes = []
+
+    def insert_edges(self):
+        '''
+            Inserts all parsed edges in bulk. GraphML edges have no ID's of their own, so the client ID's are
+            allocated as one block behind the largest node client ID.
+        '''
+        seed = max(Node.objects.filter(graph=self.graph).order_by('-client_id')
+                               .values_list('client_id', flat=True)[:1] or [0])
+        edges = []
+        for index, (source, target) in enumerate(self.edges):
+            if source not in self.node_pks or target not in self.node_pks:
+                raise Exception("Edge from '%s' to '%s' refers to an unknown node" % (source, target))
+            edges.append(Edge(graph_id=self.graph.pk, revision=self.revision, client_id=seed + 1 + index,
+                              source_id=self.node_pks[source], target_id=self.node_pks[target],
+                              property_document='{}'))
+        Edge.objects.bulk_create(edges)
+
+    def apply_graph_data(self):
+        '''
+            Graph properties belong to the top node. GraphML files without graph <data> properties may
+            refer to a graph type that has no top node concept.
+        '''
+        if not self.graph_data:
+            return
+        for name, value in self.graph_data:
+            if name not in notations.graphml_graph_data[self.graph_kind]:
+                raise Exception("Invalid graph data element '%s'" % name)
+        logger.debug("Setting attributes %s on top node" % ', '.join(name for name, value in self.graph_data))
+        Property.save_values(self.graph.top_node(), dict(self.graph_data))
@@ -1,10 +1,10 @@
 import uuid
 import json
-import xmlrpclib
+import zlib
 import math
 import logging
 
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.mail import mail_managers
@@ -16,14 +16,18 @@ from .node import Node
 from .configuration import Configuration
 from .node_configuration import NodeConfiguration
 from .result import Result
-from ore.models import xml_backend
-from ore.middleware import HttpResponseServerErrorAnswer
-from .xml_configurations import FeatureChoice, InclusionChoice, RedundancyChoice
-from .xml_backend import AnalysisResult, MincutResult, SimulationResult
+from .cached_result import CachedResult
+from ore import job_completion, backend_cluster
+from ore.middleware import HttpResponseServerErrorAnswer, HttpResponseServiceUnavailableAnswer
+from .result_reader import iter_backend_result
+from .bulk import bulk_create_with_pks
 
 
 logger = logging.getLogger('ore')
 
+# Number of parsed result rows that are collected before a bulk insert
+RESULT_BATCH_SIZE = 500
+
 
 class NativeXmlField(models.Field):
 
@@ -64,9 +68,29 @@ class Job(models.Model):
     created = models.DateTimeField(auto_now_add=True, editable=False)
     # Exit code for this job, NULL if pending
     exit_code = models.IntegerField(null=True)
-
-    def input_data(self):
-        ''' Used by the API to get the input data needed for the particular job type.'''
+    # Resource usage of the backend process as reported by the daemon, NULL if unknown
+    runtime = models.FloatField(null=True, blank=True)       # seconds
+    peak_memory = models.IntegerField(null=True, blank=True)  # KB
+    # Job input as zlib-compressed bytes, serialized once when the job is created
+    input_document = models.BinaryField(null=True, blank=True)
+    # Result cache key of the job input, see CachedResult.input_hash()
+    input_hash = models.CharField(max_length=64, null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        '''
+            New jobs freeze their input, so that the backend gets the graph as it was on submission.
+            Jobs whose input cannot be created fail right away, like a backend would on that input.
+        '''
+        if self._state.adding and self.input_document is None and not self.done():
+            try:
+                self.freeze_input()
+            except Exception as e:
+                logger.error("Could not create input for %s job %s: %s" % (self.kind, self.secret, e))
+                self.exit_code = -1
+        super(Job, self).save(*args, **kwargs)
+
+    def render_input(self):
+        ''' Serializes the graph into the input data needed for the particular job type.'''
         if self.kind in (
                 Job.MINCUT_JOB, Job.TOP_EVENT_JOB, Job.SIMULATION_JOB):
             return self.graph.to_xml(), 'application/xml'
@@ -74,6 +98,25 @@ class Job(models.Model):
             return self.graph.to_tikz(), 'application/text'
         assert (False)
 
+    def freeze_input(self):
+        ''' Stores the current input data of the job compressed, together with its hash.'''
+        input_data, content_type = self.render_input()
+        if isinstance(input_data, unicode):
+            input_data = input_data.encode('utf-8')
+        self.input_document = zlib.compress(input_data)
+        self.input_hash = CachedResult.input_hash(self.kind, input_data)
+
+    def compressed_input(self):
+        ''' The frozen input data of the job, zlib-compressed.'''
+        return str(self.input_document)
+
+    def input_data(self):
+        ''' Used by the API to get the input data needed for the particular job type, as frozen on job creation.'''
+        if self.input_document is None:
+            return self.render_input()
+        content_type = 'application/text' if self.requires_download else 'application/xml'
+        return zlib.decompress(self.input_document), content_type
+
     def done(self):
         return self.exit_code is not None
 
@@ -138,23 +181,50 @@ class Job(models.Model):
 
         return axis_titles
 
+    @classmethod
+    def prepare(cls, graph, kind):
+        '''
+            Return a new job for that graph and job kind, with its input frozen. If a result for the same job
+            input is in the result cache, the job is saved as finished with that result. The cache is shared
+            between all graphs, so that also copies and snapshots of an analyzed graph get their results without
+            running the backend again. Otherwise, the job is not saved yet. Saving it dispatches it to a backend,
+            with the input that was frozen for the cache lookup.
+        '''
+        job = Job(graph=graph, kind=kind, graph_modified=graph.modified)
+        try:
+            job.freeze_input()
+        except Exception as e:
+            # Fails right away when saved, like a backend would on that input
+            logger.error("Could not create input for %s job of graph %u: %s" % (kind, graph.pk, e))
+            job.exit_code = -1
+            return job
+        cached = CachedResult.lookup(job.input_hash)
+        if cached is None:
+            return job
+        logger.debug("Re-using cached %s result for graph %u" % (kind, graph.pk))
+        with transaction.atomic():
+            # Finished from the start, so no backend job is triggered
+            job.exit_code = 0
+            job.save()
+            job.parse_result(*cached)
+        return job
+
     @classmethod
     def exists_with_result(cls, graph, kind):
         '''
-            Return an existing job object for that graph and job kind, but only
-            if it was computed on the same graph data and has existing results.
+            Return a new finished job for that graph and job kind, if a result for the same job input
+            is in the result cache (see prepare()).
+        '''
+        job = cls.prepare(graph, kind)
+        return job if job.pk is not None else None
 
-            Theoretically, there is only one cached job left, since the new creation
-            leads to deletion of old versions. We anyway prepare for the case of
-            having multiple cached old results, by just using the youngest one.
+    def cache_result(self, data):
         '''
-        return None
-# TODO: The cached job fetching seems to fail in the API part, test again heavily and re-enable then
-#        try:
-#            return Job.objects.filter(
-#                graph=graph, kind=kind, graph_modified=graph.modified, exit_code=0).order_by('-created')[0]
-#        except:
-#            return None
+            Offers the result data of a successful backend run, given as string or file-like object, to the
+            result cache.
+        '''
+        if self.exit_code == 0 and self.input_hash:
+            CachedResult.store(self.input_hash, self.kind, data, self.graph.pk)
 
     def result_download(self):
         """
@@ -291,17 +361,23 @@ class Job(models.Model):
                 db_result.timestamp = None if math.isnan(
                     timestamp) else timestamp
 
-    def parse_result(self, data):
+    def parse_result(self, data, model_id=None, replace=True):
         """
-            Parses the result data and saves the content to the database,
-            in relation to this job.
+            Parses the result data, given as string or file-like object, and saves the content to the database,
+            in relation to this job. Result data that was computed for another graph
+            with the same content, such as cached results, gives that graph ID in 'model_id'.
+            Former configurations and results of the same kind are replaced by those contained in the data, unless
+            'replace' is False.
         """
         if self.requires_download:
+            if hasattr(data, 'read'):
+                data = data.read()
             if self.kind == self.PDF_RENDERING_JOB:
                 old_results = self.results.filter(
                     graph=self.graph,
                     kind=Result.PDF_RESULT)
-                old_results.delete()
+                if replace:
+                    old_results.delete()
                 db_result = Result(
                     graph=self.graph,
                     job=self,
@@ -310,7 +386,8 @@ class Job(models.Model):
                 old_results = self.results.filter(
                     graph=self.graph,
                     kind=Result.EPS_RESULT)
-                old_results.delete()
+                if replace:
+                    old_results.delete()
                 db_result = Result(
                     graph=self.graph,
                     job=self,
@@ -320,113 +397,150 @@ class Job(models.Model):
             return
 
         # Ok, it is not binary, it is true XML result data
-        print str(data)
-        logger.debug(
-            "Parsing backend result XML into database: \n" +
-            str(data))
-        doc = xml_backend.CreateFromDocument(str(data))
-
-        # Delete old graph issues from a former analysis run
-        self.graph.delete_results(kind=Result.GRAPH_ISSUES)
+        logger.debug("Parsing backend result XML into database")
+
+        with transaction.atomic():
+            if replace:
+                # Delete old graph issues from a former analysis run
+                self.graph.delete_results(kind=Result.GRAPH_ISSUES)
+            # Former configurations and results are only thrown away when the new data contains some
+            delete_configurations = delete_results = replace
+
+            conf_id_mappings = {}         # XML conf ID's to DB conf ID's
+            # All node client ID's of the graph are resolved with one query
+            node_pks = dict(Node.objects.filter(graph=self.graph.content_graph()).values_list('client_id', 'pk'))
+            graph_issues = []
+            # Configurations, node configurations and results are bulk-inserted in batches
+            pending_confs = []
+            db_results = []
+            for element, item in iter_backend_result(data):
+                if element == 'configuration':
+                    if delete_configurations:
+                        self.graph.delete_configurations()
+                        delete_configurations = False
+                    pending_confs.append(item)
+                    if len(pending_confs) >= RESULT_BATCH_SIZE:
+                        self.store_configurations(pending_confs, node_pks, conf_id_mappings)
+                        pending_confs = []
+                elif element == 'result':
+                    if delete_results:
+                        # Remove earlier results of the same kind
+                        if self.kind == self.TOP_EVENT_JOB:
+                            self.graph.delete_results(kind=Result.ANALYSIS_RESULT)
+                        elif self.kind == self.SIMULATION_JOB:
+                            self.graph.delete_results(kind=Result.SIMULATION_RESULT)
+                        elif self.kind == self.MINCUT_JOB:
+                            self.graph.delete_results(kind=Result.MINCUT_RESULT)
+                        delete_results = False
+                    if pending_confs:
+                        # Results refer to configurations, which must be stored before
+                        self.store_configurations(pending_confs, node_pks, conf_id_mappings)
+                        pending_confs = []
+                    db_results.append(self.parse_analysis_result(item, conf_id_mappings, model_id))
+                    if len(db_results) >= RESULT_BATCH_SIZE:
+                        Result.objects.bulk_create(db_results)
+                        db_results = []
+                elif element == 'issue':
+                    graph_issues.append(item)
+            logger.debug("Performing bulk insert of remaining configurations and parsed results")
+            self.store_configurations(pending_confs, node_pks, conf_id_mappings)
+            Result.objects.bulk_create(db_results)
 
-        if hasattr(doc, 'issue'):
             # Result-independent issues (for the whole graph, and not per configuration),
             # are saved as special kind of result
             db_result = Result(
                 graph=self.graph,
                 job=self,
                 kind=Result.GRAPH_ISSUES)
-            db_result.issues = json.dumps(self.interpret_issues(doc.issue))
+            db_result.issues = json.dumps(self.interpret_issues(graph_issues))
             db_result.save()
 
-        conf_id_mappings = {}         # XML conf ID's to DB conf ID's
-
-        if hasattr(doc, 'configuration'):
-            # Throw away existing configurations information
-            self.graph.delete_configurations()
-            # walk through all the configurations determined by the backend, as shown in the XML
-            # Node configurations can be bulk-inserted, since nobody links to them
-            # The expensive looped Configuration object creation cannot be bulk-inserted,
-            # since we need their pk's in the NodeCOnfiguration object
-            db_nodeconfs = []
-            for configuration in doc.configuration:
-                db_conf = Configuration(
-                    graph=self.graph,
-                    costs=configuration.costs if hasattr(
-                        configuration,
-                        'costs') else None)
-                db_conf.save()
-                conf_id_mappings[configuration.id] = db_conf
-                logger.debug(
-                    "Storing DB configuration %u for XML configuration %s in graph %u" %
-                    (db_conf.pk, configuration.id, self.graph.pk))
-                # Analyze node configuration choices in this configuration
-                assert(
-                    hasattr(
-                        configuration,
-                        'choice'))    # according to XSD, this must be given
-                for choice in configuration.choice:
-                    element = choice.value_
-                    json_choice = {}
-                    if isinstance(element, FeatureChoice):
-                        json_choice['type'] = 'FeatureChoice'
-                        json_choice['featureId'] = element.featureId
-                    elif isinstance(element, InclusionChoice):
-                        json_choice['type'] = 'InclusionChoice'
-                        json_choice['included'] = element.included
-                    elif isinstance(element, RedundancyChoice):
-                        json_choice['type'] = 'RedundancyChoice'
-                        json_choice['n'] = int(element.n)
-                    else:
-                        raise ValueError('Unknown choice %s' % element)
-                    db_node = Node.objects.get(
-                        client_id=choice.key,
-                        graph=self.graph)
-                    db_nodeconf = NodeConfiguration(
-                        node=db_node,
-                        configuration=db_conf,
-                        setting=json.dumps(json_choice))
-                    db_nodeconfs.append(db_nodeconf)
-            logger.debug("Performing bulk insert of node configurations")
-            NodeConfiguration.objects.bulk_create(db_nodeconfs)
-
-        if hasattr(doc, 'result'):
-            # Remove earlier results of the same kind
-            if self.kind == self.TOP_EVENT_JOB:
-                self.graph.delete_results(kind=Result.ANALYSIS_RESULT)
-            elif self.kind == self.SIMULATION_JOB:
-                self.graph.delete_results(kind=Result.SIMULATION_RESULT)
-            elif self.kind == self.MINCUT_JOB:
-                self.graph.delete_results(kind=Result.MINCUT_RESULT)
-            db_results = []
-            for result in doc.result:
-                assert(int(result.modelId) == self.graph.pk)
-                db_result = Result(graph=self.graph, job=self)
-                if result.configId in conf_id_mappings:
-                    db_result.configuration = conf_id_mappings[result.configId]
-                if isinstance(result, AnalysisResult):
-                    db_result.kind = Result.ANALYSIS_RESULT
-                elif isinstance(result, MincutResult):
-                    db_result.kind = Result.MINCUT_RESULT
-                elif isinstance(result, SimulationResult):
-                    db_result.kind = Result.SIMULATION_RESULT
-                self.interpret_value(result, db_result)
-                if result.issue:
-                    db_result.issues = json.dumps(
-                        self.interpret_issues(
-                            result.issue))
-                db_results.append(db_result)
-            logger.debug("Performing bulk insert of parsed results")
-            Result.objects.bulk_create(db_results)
+    def store_configurations(self, configurations, node_pks, conf_id_mappings):
+        """
+            Stores a batch of configurations from the backend result, and remembers their DB ID's in conf_id_mappings.
+            Configurations are inserted in bulk with primary key retrieval, since the NodeConfiguration objects need
+            them. The node configurations are then written in bulk as well.
+        """
+        if not configurations:
+            return
+        db_confs = [Configuration(graph=self.graph, costs=configuration.costs) for configuration in configurations]
+        bulk_create_with_pks(Configuration, db_confs)
+        db_nodeconfs = []
+        for configuration, db_conf in zip(configurations, db_confs):
+            conf_id_mappings[configuration.id] = db_conf.pk
+            db_nodeconfs.extend(self.parse_configuration(configuration, db_conf.pk, node_pks))
+        logger.debug(
+            "Stored %u configurations with %u node configurations in graph %u" %
+            (len(db_confs), len(db_nodeconfs), self.graph.pk))
+        NodeConfiguration.objects.bulk_create(db_nodeconfs, batch_size=RESULT_BATCH_SIZE)
+
+    def parse_configuration(self, configuration, conf_pk, node_pks):
+        """
+            Analyzes the node configuration choices in one configuration from the backend result.
+
+            Returns:
+             The list of unsaved NodeConfiguration objects for the choices in this configuration.
+        """
+        assert(configuration.choice is not None)    # according to XSD, this must be given
+        db_nodeconfs = []
+        for choice in configuration.choice:
+            element = choice.value_
+            json_choice = {}
+            if element.kind == 'FeatureChoice':
+                json_choice['type'] = 'FeatureChoice'
+                json_choice['featureId'] = element.featureId
+            elif element.kind == 'InclusionChoice':
+                json_choice['type'] = 'InclusionChoice'
+                json_choice['included'] = element.included
+            elif element.kind == 'RedundancyChoice':
+                json_choice['type'] = 'RedundancyChoice'
+                json_choice['n'] = int(element.n)
+            else:
+                raise ValueError('Unknown choice %s' % element)
+            try:
+                node_pk = node_pks[int(choice.key)]
+            except (KeyError, ValueError):
+                raise Node.DoesNotExist('Node %s from configuration %s does not exist in graph %u' %
+                                        (choice.key, configuration.id, self.graph.pk))
+            db_nodeconfs.append(NodeConfiguration(
+                node_id=node_pk,
+                configuration_id=conf_pk,
+                setting=json.dumps(json_choice)))
+        return db_nodeconfs
+
+    def parse_analysis_result(self, result, conf_id_mappings, model_id=None):
+        """
+            Creates the (unsaved) Result object for one result from the backend result.
+        """
+        assert(int(result.modelId) == (model_id or self.graph.pk))
+        db_result = Result(graph=self.graph, job=self)
+        if result.configId in conf_id_mappings:
+            db_result.configuration_id = conf_id_mappings[result.configId]
+        if result.kind == 'AnalysisResult':
+            db_result.kind = Result.ANALYSIS_RESULT
+        elif result.kind == 'MincutResult':
+            db_result.kind = Result.MINCUT_RESULT
+        elif result.kind == 'SimulationResult':
+            db_result.kind = Result.SIMULATION_RESULT
+        self.interpret_value(result, db_result)
+        if result.issue:
+            db_result.issues = json.dumps(
+                self.interpret_issues(
+                    result.issue))
+        return db_result
 
 
 @receiver(post_save, sender=Job)
 def job_post_save(sender, instance, created, **kwargs):
     ''' Informs notification listeners.
         The payload contains the job URL prefix with a secret,
-        which allows the listener to perform according actions.
+        which allows the listener to perform according actions,
+        and the zlib-compressed job input, which spares the listener to fetch it.
+        Jobs that are created with a cached result need no backend. Jobs that no backend takes are
+        deleted again, so that no pending job remains that is never run.
+        Finished jobs wake up the requests of this process that wait for them.
     '''
-    if created:
+    if created and not instance.done():
         # The only way to determine our own hostname + port number at runtime in Django
         # is from an HttpRequest object, which we do not have here.
         # Option 1 is to fetch this information from the HttpRequest and somehow move it here.
@@ -439,17 +553,23 @@ def job_post_save(sender, instance, created, **kwargs):
         job_url = settings.SERVER + '/api/back/jobs/' + instance.secret
 
         try:
-            # The proxy is instantiated here, since the connection should go
-            # away when finished
-            s = xmlrpclib.ServerProxy(settings.BACKEND_DAEMON)
-            logger.debug(
-                "Triggering %s job available through url %s" %
-                (instance.kind, job_url))
-            s.start_job(instance.kind, job_url)
+            # The least loaded daemon gets the job, unreachable ones are skipped
+            accepted = backend_cluster.dispatch(instance.kind, job_url, instance.compressed_input())
         except Exception as e:
+            # Nobody would ever run the job, the client has to submit it again
+            instance.delete()
             mail_managers(
                 "Exception on backend call - " +
-                settings.BACKEND_DAEMON,
+                ', '.join(backend_cluster.daemon_urls()),
                 str(e))
             raise HttpResponseServerErrorAnswer(
                 "Sorry, we seem to have a problem with our ORE backend. The admins are informed, thanks for the patience.")
+        if not accepted:
+            # The job queues of all backend daemons are full
+            logger.warning("Backend daemons rejected %s job %s" % (instance.kind, instance.secret))
+            instance.delete()
+            raise HttpResponseServiceUnavailableAnswer(
+                "Sorry, our ORE backend is busy right now. Please try again in a few minutes.")
+    elif not created and instance.done():
+        # Clients that wait for the job result can fetch it now
+        job_completion.notify()
@@ -1,24 +1,82 @@
 from . import xml_fuzztree
 from . import xml_faulttree
 from .graph import Graph
+from .property_owner import PropertyOwner
 
 import json
 import notations
 import sys
-import datetime
-import time
 import logging
 
-from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from django.db import models
-from django.db.models.signals import post_save, pre_delete
+from django.db import models, transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 
+from ore import graph_modification
+
 logger = logging.getLogger('ore')
 
 
-def new_client_id():
-    return str(int(time.mktime(time.gmtime())))
+def notation_default(graph_kind, node_kind, key, default=None):
+    """
+    Returns the notation default of the given node property, or the given default if the notation has none.
+    """
+    index_key = (graph_kind, node_kind, key)
+    if index_key not in notations.property_index:
+        return default
+    entry = notations.property_index[index_key]
+    if entry is None:
+        logger.warning('Notation configuration has empty default for node property ' + key)
+        return default
+    return entry['default']
+
+
+def xml_probability(graph_kind, probability):
+    """
+    Returns an XML wrapper object for the probability value given in frontend encoding,
+    as expected by the XML schema of the given graph kind.
+    """
+    logger.debug(
+        "Determining XML representation for probability " +
+        str(probability))
+    # Probability is a 2-tuple, were the first value is a type indicator
+    # and the second the value
+    if probability[0] == 0:
+        # Crisp probability
+        if graph_kind == "faulttree":
+            point = probability[1]
+            return xml_faulttree.CrispProbability(value_=point)
+        elif graph_kind == "fuzztree":
+            point = probability[1][0]
+            alpha = probability[1][1]
+            return xml_fuzztree.TriangularFuzzyInterval(
+                a=point - alpha, b1=point, b2=point, c=point + alpha)
+        else:
+            raise ValueError(
+                'Cannot handle crisp probability value for this graph type')
+    elif probability[0] == 1:
+        # Failure rate
+        if graph_kind == "faulttree":
+            return xml_faulttree.FailureRate(value_=probability[1])
+        elif graph_kind == "fuzztree":
+            return xml_fuzztree.FailureRate(value_=probability[1])
+        else:
+            raise ValueError(
+                'Cannot handle failure rate value for this graph type')
+    elif probability[0] == 2:
+        # Fuzzy probability
+        point = probability[1][0]
+        alpha = probability[1][1]
+        if graph_kind == "fuzztree":
+            return xml_fuzztree.TriangularFuzzyInterval(
+                a=point - alpha, b1=point, b2=point, c=point + alpha)
+        else:
+            raise ValueError(
+                'Cannot handle fuzzy probability value for this graph type')
+    else:
+        raise ValueError(
+            'Cannot handle probability value: "%s"' %
+            probability)
 
 
 fuzztree_classes = {
@@ -88,7 +146,7 @@ faulttree_classes = {
 }
 
 
-class Node(models.Model):
+class Node(PropertyOwner):
 
     """
     Class: Node
@@ -104,9 +162,14 @@ class Node(models.Model):
      {int}     y         - the y coordinate of the node (default: 0)
      {bool}    deleted   - flag indicating whether this node is deleted. Simplifies restoration of nodes by toggling
                            the flag (default: False)
+     {int}     revision  - the graph revision of the last modification of this node, see <Graph.changes_since>
     """
     class Meta:
         app_label = 'ore'
+        index_together = [('graph', 'revision')]
+
+    property_section = 'nodes'
+    property_owner_field = 'node'
 
     # Nodes that are created by the server (e.g. default nodes in the notation) should receive ids starting at
     # -sys.maxint and autoincrement from there on. The whole negative number range is reserved for the server. IDs from
@@ -117,22 +180,19 @@ class Node(models.Model):
     x = models.IntegerField(default=0)
     y = models.IntegerField(default=0)
     deleted = models.BooleanField(default=False)
+    revision = models.PositiveIntegerField(default=0, editable=False)
 
     def __unicode__(self):
         prefix = '[DELETED] ' if self.deleted else ''
 
-        try:
-            name = unicode(self.properties.get(key='name').value)
-            return unicode('%s%s' % (prefix, name))
-
-        except ObjectDoesNotExist:
-            try:
-                name = notations.by_kind[
-                    self.graph.kind]['nodes'][
-                    self.kind]['properties']['name']['default']
-                return unicode('%s%s_%s' % (prefix, self.pk, name))
-            except KeyError:
+        values = self.property_values()
+        if 'name' in values:
+            return unicode('%s%s' % (prefix, values['name']))
+        else:
+            entry = notations.property_index.get((self.graph.kind, self.kind, 'name'))
+            if entry is None:
                 return self.kind
+            return unicode('%s%s_%s' % (prefix, self.pk, entry['default']))
 
     def to_dict(self, use_value_dict=False):
         """
@@ -143,15 +203,9 @@ class Node(models.Model):
         Returns:
          {dict} the node as dictionary
         """
+        prop_values = self.property_values()
         if use_value_dict:
-            prop_values = {
-                prop.key: {
-                    'value': prop.get_value()} for prop in self.properties.filter(
-                    deleted=False)}
-        else:
-            prop_values = {
-                prop.key: prop.get_value() for prop in self.properties.filter(
-                    deleted=False)}
+            prop_values = {key: {'value': value} for key, value in prop_values.iteritems()}
         return {
             'properties': prop_values,
             'id': self.client_id,
@@ -186,10 +240,10 @@ class Node(models.Model):
         #    self.graph.kind]['nodes'][
         #    self.kind]['properties']
         graphml = []
-        properties = self.properties.filter(deleted=False)
+        properties = self.property_values()
 
-        for prop in properties:
-            if prop.key == 'missionTime':
+        for key in sorted(properties):
+            if key == 'missionTime':
                 continue
             # property_notation = properties_notation[prop.key]
             # property_kind     = property_notation['kind']
@@ -202,7 +256,7 @@ class Node(models.Model):
             #     graphml.append(self.graphml_data_key(key + 'Epsilon', value[1]))
             # else:
             #     graphml.append(self.graphml_data_key(key, value))
-            graphml.append(self.graphml_data_key(prop.key, prop.get_value()))
+            graphml.append(self.graphml_data_key(key, properties[key]))
 
         return graphml
 
@@ -258,28 +312,29 @@ class Node(models.Model):
         """
         result = []
         # Only consider properties that have to be displayed in the mirror
-        displayOrder = notations.by_kind[
-            self.graph.kind]['propertiesDisplayOrder']
-        propdetails = notations.by_kind[
-            self.graph.kind]['nodes'][
-            self.kind]['properties']
+        graph_kind = self.graph.kind
+        displayOrder = notations.by_kind[graph_kind]['propertiesDisplayOrder']
         for prop in displayOrder:
             # the displayOrder list is static, the property does not have to be
             # part of this node
-            if prop in propdetails and prop not in hiddenProps:
+            index_key = (graph_kind, self.kind, prop)
+            if index_key in notations.property_index and prop not in hiddenProps:
                 val = self.get_property(prop, None)
+                entry = notations.property_index[index_key]
                 # Some properties do not have a config dict in notations, such
                 # as optional=None
-                if isinstance(propdetails[prop], dict):
-                    kind = propdetails[prop]['kind']
+                if entry is not None:
+                    kind = entry['kind']
+                    mirror = entry['mirror']
                 else:
                     logger.debug(
                         "Property '%s' in %s has no config dictionary" %
                         (prop, self.kind))
                     kind = "text"
+                    mirror = None
                 if val is not None:
                     if kind == "range":
-                        format = propdetails[prop]['mirror']['format']
+                        format = mirror
                         format = format.replace(
                             u"\xb1",
                             "$\\pm$")    # Special unicodes used in format strings, such as \xb1
@@ -291,6 +346,7 @@ class Node(models.Model):
                     elif kind == "compound":
                         # Compounds are unions, the first number tells us the
                         # active part defintion
+                        propdetails = notations.by_kind[graph_kind]['nodes'][self.kind]['properties']
                         active_part = val[0]
                         partkind = propdetails[prop][
                             'parts'][active_part]['kind']
@@ -322,10 +378,9 @@ class Node(models.Model):
                                     break
                         elif partkind == 'numeric':
                             val = format.replace("{{$0}}", str(val[1]))
-                    elif 'mirror' in propdetails[prop]:
-                        if 'format' in propdetails[prop]['mirror']:
-                            format = propdetails[prop]['mirror'][
-                                'format'].encode('utf-8')
+                    elif mirror is not None:
+                        if mirror:
+                            format = mirror.encode('utf-8')
                             if isinstance(val, int):
                                 val = str(val)
                             val = format.replace(
@@ -355,30 +410,59 @@ class Node(models.Model):
         TikZ starts the coordinate system in the upper left corner, while we start in the lower left corner.
         This demands some coordinate mangling on the Y axis.
 
+        Nodes with more than one parent are rendered once, with an edge from every parent. The graph is
+        walked with an explicit stack, so that deep trees do not exhaust the Python call stack. TiKZ nodes
+        are named by client ID, so that copies of a graph lead to the same output.
+
         Returns:
          {str} the node and its children in LaTex representation
         """
+        result = []
+        rendered = set()
+        stack = [('enter', self, parent_kind)]
+        while stack:
+            step = stack.pop()
+            if step[0] == 'exit':
+                # All children are rendered now, so the edges can refer to them
+                node, children, mirror = step[1:]
+                for child in children:
+                    result.append(node.to_tikz_edge(child))
+                # Add the mirror text as separate text node, which makes formatting
+                # more precise
+                result.append(mirror)
+                continue
+            node, node_parent_kind = step[1:]
+            if node.pk in rendered:
+                continue
+            rendered.add(node.pk)
+            result.append(node.to_tikz_node(x_offset, y_offset))
+            children = [edge.target for edge in node.outgoing.filter(deleted=False)]
+            stack.append(('exit', node, children, node.to_tikz_mirror(node_parent_kind)))
+            stack.extend(('enter', child, node.kind) for child in reversed(children))
+        return ''.join(result)
+
+    def to_tikz_node(self, x_offset=0, y_offset=0):
+        """
+        Returns the TiKZ node for the graph icon of this node, without its mirror text.
+        """
         # Optional nodes are dashed
         if self.get_property("optional", False):
             nodeStyle = "shapeStyleDashed"
         else:
             nodeStyle = "shapeStyle"
+        # Y coordinates are stretched a little bit, for optics
+        return "\\node [shape=%s, %s] at (%u, -%f) (%u) {};\n" % (
+            self.kind, nodeStyle, self.x + x_offset, (self.y + y_offset) * 1.2, self.client_id)
+
+    def to_tikz_mirror(self, parent_kind=None):
+        """
+        Returns the TiKZ text node with the mirror text of this node, or an empty string if there is none.
+        """
         # If this is a child node, we need to check if the parent wants to hide
         # some child property
-        hiddenProps = []
+        hiddenProps = ()
         if parent_kind:
-            nodeConfig = notations.by_kind[
-                self.graph.kind]['nodes'][parent_kind]
-            if 'childProperties' in nodeConfig:
-                for childPropName in nodeConfig['childProperties']:
-                    for childPropSettingName, childPropSettingVal in nodeConfig[
-                            'childProperties'][childPropName].iteritems():
-                        if childPropSettingName == "hidden" and childPropSettingVal is True:
-                            hiddenProps.append(childPropName)
-        # Create Tikz snippet for tree node, we start with the TiKZ node for the graph icon
-        # Y coordinates are stretched a little bit, for optics
-        result = "\\node [shape=%s, %s] at (%u, -%f) (%u) {};\n" % (
-            self.kind, nodeStyle, self.x + x_offset, (self.y + y_offset) * 1.2, self.pk)
+            hiddenProps = notations.hidden_child_properties[(self.graph.kind, parent_kind)]
         # Determine the mirror text based on all properties
         # Text width is exactly the double width of the icons
         mirrorText = unicode()
@@ -395,129 +479,40 @@ class Node(models.Model):
                 propvalue = "{\\it\\scriptsize %s}" % propvalue
             propvalue = propvalue.decode('utf-8')
             mirrorText += propvalue + "\\\\"
-        # Create child nodes and their edges
-        for edge in self.outgoing.filter(deleted=False):
-            # Add child node rendering
-            result += edge.target.to_tikz(x_offset, y_offset, self.kind)
-            # Add connector from this node to the added child, consider if
-            # dashed line is needed
-            if 'dashstyle' in notations.by_kind[self.graph.kind][
-                    'nodes'][self.kind]['connector']:
-                result += "\path[fork edge, dashed] (%s.south) edge (%u.north);\n" % (
-                    self.pk, edge.target.pk)
-            else:
-                result += "\path[fork edge] (%s.south) edge (%u.north);\n" % (
-                    self.pk, edge.target.pk)
-        # Add the mirror text as separate text node, which makes formatting
-        # more precise
         if mirrorText != "":
-            result += "\\node [mirrorStyle] at (%u.south) (text%u) {%s};\n" % (
-                self.pk, self.pk, mirrorText)
-        return result
+            return "\\node [mirrorStyle] at (%u.south) (text%u) {%s};\n" % (
+                self.client_id, self.client_id, mirrorText)
+        return ""
+
+    def to_tikz_edge(self, child):
+        """
+        Returns the TiKZ connector from this node to the given child node.
+        """
+        # consider if dashed line is needed
+        if 'dashstyle' in notations.by_kind[self.graph.kind][
+                'nodes'][self.kind]['connector']:
+            return "\path[fork edge, dashed] (%s.south) edge (%u.north);\n" % (
+                self.client_id, child.client_id)
+        else:
+            return "\path[fork edge] (%s.south) edge (%u.north);\n" % (
+                self.client_id, child.client_id)
 
     def load_xml(self, xml_node, parent=None, xmltype=None):
         """
         Method load_xml
 
         Deserialize this node and it's children from the given PyXB XML tree, given by its root node.
-        The (self) Node object is expected to already have a valid graph attribute.
+        The (self) Node object is expected to already have a valid graph attribute. The whole tree is
+        created with bulk inserts, see <XmlImport>.
         """
-        from .edge import Edge
-
-        # If the target XML type is not given, we take the graph type
-        if not xmltype:
-            xmltype = self.graph.kind
-
-        assert (xmltype in ["faulttree", "fuzztree"])
-
-        # All XML nodes got a client id
-        self.client_id = xml_node.id
-        self.x = xml_node.x
-        self.y = xml_node.y
-
-        # Finding the right kind string is not possible by lookup, since the type(xml_node) result
-        # is different from the used type on generation (TopEvent vs.
-        # TopEvent_)
-        if xmltype == "faulttree":
-            classes = faulttree_classes
-        elif xmltype == "fuzztree":
-            classes = fuzztree_classes
-
-        self.kind = classes[type(xml_node)]
-        logger.debug("Adding %s node with id %s" % (self.kind, self.client_id))
-        self.save()
-
-        # Add properties
-        if hasattr(xml_node, 'name') and self.allows_property('name'):
-            logger.debug("Setting name to " + xml_node.name)
-            self.set_attr('name', xml_node.name)
-        if hasattr(xml_node, 'optional') and self.allows_property('optional'):
-            logger.debug(
-                "Setting optionality flag to " + str(xml_node.optional))
-            self.set_attr('optional', xml_node.optional)
-#        if hasattr(xml_node,'probability') and self.allows_property('probability'):
-# TODO: Consider also fuzzy probabilities and rates
-#               self.set_attr('probability', [0, xml_node.probability.value_])
-
-        # Create edge to parent, if needed
-        if parent:
-            e = Edge(
-                source=parent,
-                target=self,
-                graph=self.graph,
-                client_id=new_client_id())
-            e.save()
-
-        # Dive into the children
-        for child in xml_node.children:
-            n = Node(graph=self.graph)
-            n.load_xml(child, self)
+        from .xml_import import XmlImport
+        XmlImport(self.graph, xmltype).run(xml_node, root=self, parent=parent)
 
     def to_xml_probability(self, probability):
         """
         Returns an XML wrapper object for the probability value given in frontend encoding.
         """
-        logger.debug(
-            "Determining XML representation for probability " +
-            str(probability))
-        # Probability is a 2-tuple, were the first value is a type indicator
-        # and the second the value
-        if probability[0] == 0:
-            # Crisp probability
-            if self.graph.kind == "faulttree":
-                point = probability[1]
-                return xml_faulttree.CrispProbability(value_=point)
-            elif self.graph.kind == "fuzztree":
-                point = probability[1][0]
-                alpha = probability[1][1]
-                return xml_fuzztree.TriangularFuzzyInterval(
-                    a=point - alpha, b1=point, b2=point, c=point + alpha)
-            else:
-                raise ValueError(
-                    'Cannot handle crisp probability value for this graph type')
-        elif probability[0] == 1:
-            # Failure rate
-            if self.graph.kind == "faulttree":
-                return xml_faulttree.FailureRate(value_=probability[1])
-            elif self.graph.kind == "fuzztree":
-                return xml_fuzztree.FailureRate(value_=probability[1])
-            else:
-                raise ValueError(
-                    'Cannot handle failure rate value for this graph type')
-        elif probability[0] == 2:
-            # Fuzzy probability
-            point = probability[1][0]
-            alpha = probability[1][1]
-            if self.graph.kind == "fuzztree":
-                return xml_fuzztree.TriangularFuzzyInterval(
-                    a=point - alpha, b1=point, b2=point, c=point + alpha)
-            else:
-                raise ValueError(
-                    'Cannot handle fuzzy probability value for this graph type')
-        else:
-            raise ValueError(
-                'Cannot handle probability value: "%s"' %
-                probability)
+        return xml_probability(self.graph.kind, probability)
 
     def to_xml(self, xmltype=None):
         """
@@ -530,117 +525,8 @@ class Node(models.Model):
         Returns:
          The XML node instance for this graph node and its children
         """
-
-        # If the target XML type is not given, we take the graph type
-        if not xmltype:
-            xmltype = self.graph.kind
-
-        from .node_group import NodeGroup
-        group = NodeGroup.objects.filter(
-            deleted=False,
-            graph=self.graph,
-            nodes=self)
-        if len(group) == 0:
-            # This node is not in a node group
-            prop_src = self
-        else:
-            logger.debug(
-                "Considering node group properties instead of node properties")
-            # In theory, the node can be in multiple groups
-            # In (fault / fuzz) tree practice, it is only in one
-            prop_src = group[0]
-
-        properties = {
-            'id': self.client_id,
-            'name': prop_src.get_property('name', '-'),
-            'x': self.x,
-            'y': self.y
-        }
-
-        if self.kind == 'transferIn':
-            properties['fromModelId'] = prop_src.get_property('transfer')
-
-        # for any node that may have a quantity, set the according property
-        if self.kind in {'basicEventSet', 'intermediateEventSet'}:
-            properties['quantity'] = prop_src.get_property('cardinality')
-
-        if self.kind == 'topEvent':
-            properties['missionTime'] = prop_src.get_property('missionTime')
-            properties['decompositionNumber'] = prop_src.get_property(
-                'decompositions')
-
-        # Special treatment for some of the FuzzTree node types
-        if xmltype == 'fuzztree':
-            # for any node that may be optional, set the according property
-            if self.kind in {'basicEvent', 'basicEventSet',
-                             'intermediateEvent', 'intermediateEventSet', 'houseEvent'}:
-                properties['optional'] = prop_src.get_property(
-                    'optional',
-                    False)
-
-            # determine fuzzy or crisp probability, set it accordingly
-            if self.kind in {'basicEvent', 'basicEventSet', 'houseEvent'}:
-                properties['probability'] = self.to_xml_probability(
-                    prop_src.get_property(
-                        'probability',
-                        False))
-                # nodes that have a probability also have costs in FuzzTrees
-                properties['costs'] = prop_src.get_property('cost', 0)
-
-            # Voting OR in FuzzTrees has different parameter name than in fault
-            # trees
-            elif self.kind == 'votingOrGate':
-                properties['k'] = prop_src.get_property('k')
-
-            # add range attribute for redundancy variation
-            elif self.kind == 'redundancyVariation':
-                nRange = prop_src.get_property('nRange')
-                properties['start'] = nRange[0]
-                properties['end'] = nRange[1]
-                properties['formula'] = prop_src.get_property('kFormula')
-
-            xml_node = fuzztree_classes[self.kind](**properties)
-
-        # Special treatment for some of the FaultTree node types
-        elif xmltype == 'faulttree':
-            if self.kind == 'votingOrGate':
-                properties['k'] = prop_src.get_property('k')
-
-            # determine fuzzy or crisp probability, set it accordingly
-            if self.kind in {'basicEvent', 'basicEventSet', 'houseEvent'}:
-                properties['probability'] = self.to_xml_probability(
-                    prop_src.get_property('probability'))
-
-            if self.kind == 'fdepGate':
-                properties['triggeredEvents'] = [
-                    parent.client_id for parent in self.parents()]
-                children = self.children()
-                # Frontend restriction, comes from notations.json
-                assert(len(children) == 1)
-                properties['trigger'] = children[0].client_id
-
-            if self.kind == 'spareGate':
-                children_sorted = self.children_left2right()
-                # TODO: This will kill the XML generation if the graph is
-                # incompletly drawn. Do we want that?
-                assert(len(children_sorted) > 0)
-                properties['primaryID'] = children_sorted[0].client_id
-                properties['dormancyFactor'] = prop_src.get_property(
-                    'dormancyFactor')
-
-            if self.kind in ['seqGate', 'priorityAndGate']:
-                properties['eventSequence'] = [
-                    child.client_id for child in self.children_left2right()]
-
-            xml_node = faulttree_classes[self.kind](**properties)
-
-        # serialize children
-        logger.debug(
-            'Added node "%s" with properties %s' %
-            (self.kind, properties))
-        for edge in self.outgoing.filter(deleted=False):
-            xml_node.children.append(edge.target.to_xml(xmltype))
-
+        preloaded = self.graph.preload()
+        xml_node, depth = preloaded.xml_subtree(preloaded.nodes_by_pk[self.pk], xmltype)
         return xml_node
 
     def allows_property(self, name):
@@ -649,10 +535,7 @@ class Node(models.Model):
             particular node types in the JSON. If we do not follow this understanding, they get
             very 'exceptional'. The JSON renderer is not checking this, but the XML import must be picky.
         '''
-        propdetails = notations.by_kind[
-            self.graph.kind]['nodes'][
-            self.kind]['properties']
-        if name not in propdetails.keys():
+        if (self.graph.kind, self.kind, name) not in notations.property_index:
             logger.debug(
                 '%s is not allowed in %s' %
                 (str(name), str(
@@ -661,35 +544,14 @@ class Node(models.Model):
         else:
             return True
 
+    def property_node_kind(self):
+        return self.kind
+
     def get_property(self, key, default=None):
-        try:
-            return self.properties.get(key=key).get_value()
-        except ObjectDoesNotExist:
-            try:
-                prop = notations.by_kind[
-                    self.graph.kind]['nodes'][
-                    self.kind]['properties'][key]
-                if prop is None:
-                    logger.warning(
-                        'Notation configuration has empty default for node property ' +
-                        key)
-                    result = default
-                else:
-                    result = prop['default']
-                logger.debug(
-                    'Node has no property "%s", using default "%s"' %
-                    (key, str(result)))
-                return result
-            except KeyError:
-                logger.debug(
-                    'No default given in notation, using given default "%s" instead' %
-                    default)
-                return default
-        except MultipleObjectsReturned:
-            logger.error(
-                "ERROR: Property %s in node %u exists in multiple instances" %
-                (key, self.pk))
-            raise MultipleObjectsReturned()
+        values = self.property_values()
+        if key in values:
+            return values[key]
+        return notation_default(self.graph.kind, self.kind, key, default)
 
     def set_attr(self, key, value):
         """
@@ -716,17 +578,41 @@ class Node(models.Model):
                 key=key, defaults={
                     'node': self})
             prop.save_value(value)
+            # Reset by the Property signal handler in the database
+            self.property_document = None
 
     def set_attrs(self, d):
         '''
-            Set node attributes according to the provided dictionary.
-
-            TODO: Replace by true bulk insert implementation.
+            Set node attributes according to the provided dictionary. All property values are checked
+            against the notation first, and then stored with a constant number of queries.
         '''
-        for key, value in d.iteritems():
-            self.set_attr(key, value)
+        from .properties import Property
+        assert(self.pk)
+        # Native node attributes, such as X or Y
+        native = {key: value for key, value in d.iteritems() if hasattr(self, key)}
+        with transaction.atomic():
+            Property.save_values(self, {key: value for key, value in d.iteritems() if key not in native})
+            if native:
+                for key, value in native.iteritems():
+                    setattr(self, key, value)
+                self.save()
         post_save.send(sender=self.__class__, instance=self)
 
+    def mark_deleted(self):
+        '''
+            Deletes this node by setting its deleted flag, so that the deletion remains visible in the graph changes.
+            The connected edges are deleted along with it, and the node is removed from its node groups.
+        '''
+        with transaction.atomic():
+            self.deleted = True
+            self.save()
+            for edge in self.outgoing.filter(deleted=False):
+                edge.mark_deleted()
+            for edge in self.incoming.filter(deleted=False):
+                edge.mark_deleted()
+            for group in self.nodegroup_set.all():
+                group.nodes.remove(self)
+
     def same_as(self, node):
         '''
             Checks if this node is equal to the given one in terms of properties.
@@ -747,11 +633,21 @@ class Node(models.Model):
         return True
 
 
-@receiver(post_save, sender=Node)
+@receiver(pre_save, sender=Node)
 @receiver(pre_delete, sender=Node)
+def graph_content_modify(sender, instance, **kwargs):
+    # snapshots that share the graph content get their own copy before it changes
+    if not kwargs.get('raw'):
+        graph_modification.before_modification(instance.graph_id)
+
+
+@receiver(post_save, sender=Node)
+@receiver(post_delete, sender=Node)
 def graph_modify(sender, instance, **kwargs):
-    instance.graph.modified = datetime.datetime.now()
-    instance.graph.save()
-    # updating project modification date
-    instance.graph.project.modified = instance.graph.modified
-    instance.graph.project.save()
+    # increments the graph revision, which invalidates cached serializations,
+    # and updates the graph and project modification dates. Deletions are reported
+    # once the row is gone, so that no reader caches the old state under the new revision.
+    if kwargs['signal'] is post_save:
+        graph_modification.element_modified(instance)
+    else:
+        graph_modification.graph_modified(instance.graph_id)
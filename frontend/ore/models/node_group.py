@@ -1,37 +1,39 @@
 import json
-import datetime
 import sys
 import logging
 
 from django.dispatch import receiver
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.db import models
-from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 
+from ore import graph_modification
 from ore.models import Node, Graph
-from .notations import notations
+from .node import notation_default
+from .property_owner import PropertyOwner
 
 logger = logging.getLogger('ore')
 
 
-class NodeGroup(models.Model):
+class NodeGroup(PropertyOwner):
 
     class Meta:
         app_label = 'ore'
+        index_together = [('graph', 'revision')]
+
+    property_section = 'nodeGroups'
+    property_owner_field = 'node_group'
 
     client_id = models.BigIntegerField(default=-sys.maxsize)
     graph = models.ForeignKey(Graph, null=False, related_name='groups')
     nodes = models.ManyToManyField(Node)
     deleted = models.BooleanField(default=False)
+    # graph revision of the last modification, see Graph.changes_since()
+    revision = models.PositiveIntegerField(default=0, editable=False)
 
     def to_dict(self, use_value_dict=False):
+        prop_values = self.property_texts()
         if use_value_dict:
-            prop_values = {prop.key: {'value': prop.value}
-                           for prop in self.properties.filter(deleted=False)}
-        else:
-            prop_values = {
-                prop.key: prop.value for prop in self.properties.filter(
-                    deleted=False)}
+            prop_values = {key: {'value': value} for key, value in prop_values.iteritems()}
 
         return {'id': self.client_id,
                 'nodeIds': [node.client_id for node in self.nodes.all()],
@@ -42,37 +44,14 @@ class NodeGroup(models.Model):
         return json.dumps(self.to_dict(use_value_dict))
 
     def get_property(self, key, default=None):
-        try:
-            return self.properties.get(key=key).get_value()
-        except ObjectDoesNotExist:
-            node_kind = self.nodes.all()[0].kind
-            logger.debug(
-                "Assuming node kind %s for node group properties" %
-                node_kind)
-            try:
-                prop = notations.by_kind[
-                    self.graph.kind]['nodes'][node_kind]['properties'][key]
-                if prop is None:
-                    logger.warning(
-                        'Notation configuration has empty default for node property ' +
-                        key)
-                    result = default
-                else:
-                    result = prop['default']
-                logger.debug(
-                    'Node has no property "%s", using default "%s"' %
-                    (key, str(result)))
-                return result
-            except KeyError:
-                logger.debug(
-                    'No default given in notation, using given default "%s" instead' %
-                    default)
-                return default
-        except MultipleObjectsReturned:
-            logger.error(
-                "ERROR: Property %s in node group %u exists in multiple instances" %
-                (key, self.pk))
-            raise MultipleObjectsReturned()
+        values = self.property_values()
+        if key in values:
+            return values[key]
+        node_kind = self.nodes.all()[0].kind
+        logger.debug(
+            "Assuming node kind %s for node group properties" %
+            node_kind)
+        return notation_default(self.graph.kind, node_kind, key, default)
 
     def set_attr(self, key, value):
         """
@@ -96,17 +75,30 @@ class NodeGroup(models.Model):
                 key=key, defaults={
                     'node_group': self})
             prop.save_value(value)
+            # Reset by the Property signal handler in the database
+            self.property_document = None
 
     def set_attrs(self, d):
         '''
-            Set groups attributes according to the provided dictionary.
-
-            TODO: Replace by true bulk insert implementation.
+            Set groups attributes according to the provided dictionary. All property values are checked
+            against the notation first, and then stored with a constant number of queries.
         '''
-        for key, value in d.iteritems():
-            self.set_attr(key, value)
+        from .properties import Property
+        assert(self.pk)
+        # Native group attributes, such as client_id
+        native = {key: value for key, value in d.iteritems() if hasattr(self, key)}
+        Property.save_values(self, {key: value for key, value in d.iteritems() if key not in native})
+        for key, value in native.iteritems():
+            setattr(self, key, value)
         post_save.send(sender=self.__class__, instance=self)
 
+    def mark_deleted(self):
+        '''
+            Deletes this group by setting its deleted flag, so that the deletion remains visible in the graph changes.
+        '''
+        self.deleted = True
+        self.save()
+
     def same_as(self, group):
         '''
             Checks if this group is equal to the given group in terms of nodes and attributes.
@@ -123,11 +115,33 @@ class NodeGroup(models.Model):
         return True
 
 
-@receiver(post_save, sender=NodeGroup)
+@receiver(pre_save, sender=NodeGroup)
 @receiver(pre_delete, sender=NodeGroup)
+def graph_content_modify(sender, instance, **kwargs):
+    # snapshots that share the graph content get their own copy before it changes
+    if not kwargs.get('raw'):
+        graph_modification.before_modification(instance.graph_id)
+
+
+@receiver(post_save, sender=NodeGroup)
+@receiver(post_delete, sender=NodeGroup)
 def graph_modify(sender, instance, **kwargs):
-    instance.graph.modified = datetime.datetime.now()
-    instance.graph.save()
-    # updating project modification date
-    instance.graph.project.modified = instance.graph.modified
-    instance.graph.project.save()
+    # increments the graph revision, which invalidates cached serializations,
+    # and updates the graph and project modification dates. Deletions are reported
+    # once the row is gone, so that no reader caches the old state under the new revision.
+    if kwargs['signal'] is post_save:
+        graph_modification.element_modified(instance)
+    else:
+        graph_modification.graph_modified(instance.graph_id)
+
+
+@receiver(m2m_changed, sender=NodeGroup.nodes.through)
+def graph_membership_modify(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        graph_modification.before_modification(instance.graph_id)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            graph_modification.element_modified(instance)
+        else:
+            # changed from the node side, the instance is the node
+            graph_modification.graph_modified(instance.graph_id, NodeGroup, pk_set or ())
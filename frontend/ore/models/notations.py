@@ -1924,4 +1924,436 @@ graphml_node_data = {u'dfd': set([u'description',
               'x',
               'y'])}
 
+property_index = {(u'dfd', 'edges', u'name'): {'default': u'',
+                              'hidden': False,
+                              'kind': u'text',
+                              'mirror': None},
+ (u'dfd', u'external', u'name'): {'default': u'External Entity',
+                                  'hidden': False,
+                                  'kind': u'text',
+                                  'mirror': ''},
+ (u'dfd', u'node', u'name'): {'default': u'Node',
+                              'hidden': False,
+                              'kind': u'text',
+                              'mirror': ''},
+ (u'dfd', 'nodeGroups', u'name'): {'default': u'Node Group',
+                                   'hidden': False,
+                                   'kind': u'text',
+                                   'mirror': ''},
+ (u'dfd', u'process', u'name'): {'default': u'Process',
+                                 'hidden': False,
+                                 'kind': u'text',
+                                 'mirror': ''},
+ (u'dfd', u'stickyNote', u'description'): {'default': u'Sample Text',
+                                           'hidden': True,
+                                           'kind': u'textfield',
+                                           'mirror': None},
+ (u'dfd', u'stickyNote', u'height'): {'default': 150,
+                                      'hidden': True,
+                                      'kind': u'numeric',
+                                      'mirror': None},
+ (u'dfd', u'stickyNote', u'name'): {'default': u'Node',
+                                    'hidden': True,
+                                    'kind': u'text',
+                                    'mirror': ''},
+ (u'dfd', u'stickyNote', u'width'): {'default': 150,
+                                     'hidden': True,
+                                     'kind': u'numeric',
+                                     'mirror': None},
+ (u'dfd', u'storage', u'name'): {'default': u'Storage',
+                                 'hidden': False,
+                                 'kind': u'text',
+                                 'mirror': ''},
+ (u'faulttree', u'basicEvent', u'name'): {'default': u'Basic Event',
+                                          'hidden': False,
+                                          'kind': u'text',
+                                          'mirror': u'{{$0}}'},
+ (u'faulttree', u'basicEvent', u'probability'): {'default': [0, 0],
+                                                 'hidden': False,
+                                                 'kind': u'compound',
+                                                 'mirror': None},
+ (u'faulttree', u'basicEventSet', u'cardinality'): {'default': 1,
+                                                    'hidden': False,
+                                                    'kind': u'numeric',
+                                                    'mirror': u'#{{$0}}'},
+ (u'faulttree', u'basicEventSet', u'name'): {'default': u'Basic Event Set',
+                                             'hidden': False,
+                                             'kind': u'text',
+                                             'mirror': u'{{$0}}'},
+ (u'faulttree', u'basicEventSet', u'probability'): {'default': [0, 0],
+                                                    'hidden': False,
+                                                    'kind': u'compound',
+                                                    'mirror': None},
+ (u'faulttree', u'event', u'name'): {'default': u'Event',
+                                     'hidden': False,
+                                     'kind': u'text',
+                                     'mirror': u'{{$0}}'},
+ (u'faulttree', u'eventSet', u'cardinality'): {'default': 1,
+                                               'hidden': False,
+                                               'kind': u'numeric',
+                                               'mirror': u'#{{$0}}'},
+ (u'faulttree', u'eventSet', u'name'): {'default': u'Event Set',
+                                        'hidden': False,
+                                        'kind': u'text',
+                                        'mirror': u'{{$0}}'},
+ (u'faulttree', u'houseEvent', u'name'): {'default': u'House Event',
+                                          'hidden': False,
+                                          'kind': u'text',
+                                          'mirror': u'{{$0}}'},
+ (u'faulttree', u'houseEvent', u'probability'): {'default': [0, 0],
+                                                 'hidden': False,
+                                                 'kind': u'compound',
+                                                 'mirror': None},
+ (u'faulttree', u'intermediateEvent', u'name'): {'default': u'Intermediate Event',
+                                                 'hidden': False,
+                                                 'kind': u'text',
+                                                 'mirror': u'{{$0}}'},
+ (u'faulttree', u'intermediateEventSet', u'cardinality'): {'default': 1,
+                                                           'hidden': False,
+                                                           'kind': u'numeric',
+                                                           'mirror': u'#{{$0}}'},
+ (u'faulttree', u'intermediateEventSet', u'name'): {'default': u'Intermediate Event Set',
+                                                    'hidden': False,
+                                                    'kind': u'text',
+                                                    'mirror': u'{{$0}}'},
+ (u'faulttree', 'nodeGroups', u'name'): {'default': u'Repeated BasicEvent',
+                                         'hidden': False,
+                                         'kind': u'text',
+                                         'mirror': u'{{$0}}'},
+ (u'faulttree', 'nodeGroups', u'probability'): {'default': [0, 0],
+                                                'hidden': False,
+                                                'kind': u'compound',
+                                                'mirror': None},
+ (u'faulttree', u'spareGate', u'dormancyFactor'): {'default': 0,
+                                                   'hidden': False,
+                                                   'kind': u'numeric',
+                                                   'mirror': u'd={{$0}}'},
+ (u'faulttree', u'stickyNote', u'description'): {'default': u'Sample Text',
+                                                 'hidden': True,
+                                                 'kind': u'textfield',
+                                                 'mirror': None},
+ (u'faulttree', u'stickyNote', u'height'): {'default': 150,
+                                            'hidden': True,
+                                            'kind': u'numeric',
+                                            'mirror': None},
+ (u'faulttree', u'stickyNote', u'width'): {'default': 150,
+                                           'hidden': True,
+                                           'kind': u'numeric',
+                                           'mirror': None},
+ (u'faulttree', u'topEvent', u'missionTime'): {'default': 17532,
+                                               'hidden': False,
+                                               'kind': u'numeric',
+                                               'mirror': None},
+ (u'faulttree', u'topEvent', u'name'): {'default': u'Top Event',
+                                        'hidden': False,
+                                        'kind': u'text',
+                                        'mirror': u'{{$0}}'},
+ (u'faulttree', u'transferIn', u'transfer'): {'default': -1,
+                                              'hidden': False,
+                                              'kind': u'transfer',
+                                              'mirror': u'\u25c4 {{$0}}'},
+ (u'faulttree', u'undevelopedEvent', u'name'): {'default': u'Undeveloped Event',
+                                                'hidden': False,
+                                                'kind': u'text',
+                                                'mirror': u'{{$0}}'},
+ (u'faulttree', u'votingOrGate', u'k'): {'default': 1,
+                                         'hidden': False,
+                                         'kind': u'numeric',
+                                         'mirror': u'k={{$0}}'},
+ (u'fuzztree', u'basicEvent', u'cost'): {'default': 1,
+                                         'hidden': False,
+                                         'kind': u'numeric',
+                                         'mirror': u'c={{$0}}'},
+ (u'fuzztree', u'basicEvent', u'name'): {'default': u'Basic Event',
+                                         'hidden': False,
+                                         'kind': u'text',
+                                         'mirror': u'{{$0}}'},
+ (u'fuzztree', u'basicEvent', u'optional'): {'default': False,
+                                             'hidden': False,
+                                             'kind': u'bool',
+                                             'mirror': None},
+ (u'fuzztree', u'basicEvent', u'probability'): {'default': [0, [0.5, 0]],
+                                                'hidden': False,
+                                                'kind': u'compound',
+                                                'mirror': None},
+ (u'fuzztree', u'basicEventSet', u'cardinality'): {'default': 1,
+                                                   'hidden': False,
+                                                   'kind': u'numeric',
+                                                   'mirror': u'#{{$0}}'},
+ (u'fuzztree', u'basicEventSet', u'cost'): {'default': 1,
+                                            'hidden': False,
+                                            'kind': u'numeric',
+                                            'mirror': u'c={{$0}}'},
+ (u'fuzztree', u'basicEventSet', u'name'): {'default': u'Basic Event Set',
+                                            'hidden': False,
+                                            'kind': u'text',
+                                            'mirror': u'{{$0}}'},
+ (u'fuzztree', u'basicEventSet', u'optional'): {'default': False,
+                                                'hidden': False,
+                                                'kind': u'bool',
+                                                'mirror': None},
+ (u'fuzztree', u'basicEventSet', u'probability'): {'default': [0, [0.5, 0]],
+                                                   'hidden': False,
+                                                   'kind': u'compound',
+                                                   'mirror': None},
+ (u'fuzztree', u'event', u'cost'): {'default': 1,
+                                    'hidden': False,
+                                    'kind': u'numeric',
+                                    'mirror': u'c={{$0}}'},
+ (u'fuzztree', u'event', u'name'): {'default': u'Event',
+                                    'hidden': False,
+                                    'kind': u'text',
+                                    'mirror': u'{{$0}}'},
+ (u'fuzztree', u'event', u'optional'): {'default': False,
+                                        'hidden': False,
+                                        'kind': u'bool',
+                                        'mirror': None},
+ (u'fuzztree', u'eventSet', u'cardinality'): {'default': 1,
+                                              'hidden': False,
+                                              'kind': u'numeric',
+                                              'mirror': u'#{{$0}}'},
+ (u'fuzztree', u'eventSet', u'cost'): {'default': 1,
+                                       'hidden': False,
+                                       'kind': u'numeric',
+                                       'mirror': u'c={{$0}}'},
+ (u'fuzztree', u'eventSet', u'name'): {'default': u'Event Set',
+                                       'hidden': False,
+                                       'kind': u'text',
+                                       'mirror': u'{{$0}}'},
+ (u'fuzztree', u'eventSet', u'optional'): {'default': False,
+                                           'hidden': False,
+                                           'kind': u'bool',
+                                           'mirror': None},
+ (u'fuzztree', u'featureVariation', u'name'): {'default': u'Feature Variation',
+                                               'hidden': False,
+                                               'kind': u'text',
+                                               'mirror': u'{{$0}}'},
+ (u'fuzztree', u'houseEvent', u'cost'): {'default': 1,
+                                         'hidden': False,
+                                         'kind': u'numeric',
+                                         'mirror': u'c={{$0}}'},
+ (u'fuzztree', u'houseEvent', u'name'): {'default': u'House Event',
+                                         'hidden': False,
+                                         'kind': u'text',
+                                         'mirror': u'{{$0}}'},
+ (u'fuzztree', u'houseEvent', u'optional'): {'default': False,
+                                             'hidden': False,
+                                             'kind': u'bool',
+                                             'mirror': None},
+ (u'fuzztree', u'houseEvent', u'probability'): {'default': [0, [0.5, 0]],
+                                                'hidden': False,
+                                                'kind': u'compound',
+                                                'mirror': None},
+ (u'fuzztree', u'intermediateEvent', u'cost'): {'default': 1,
+                                                'hidden': False,
+                                                'kind': u'numeric',
+                                                'mirror': u'c={{$0}}'},
+ (u'fuzztree', u'intermediateEvent', u'name'): {'default': u'Intermediate Event',
+                                                'hidden': False,
+                                                'kind': u'text',
+                                                'mirror': u'{{$0}}'},
+ (u'fuzztree', u'intermediateEvent', u'optional'): {'default': False,
+                                                    'hidden': False,
+                                                    'kind': u'bool',
+                                                    'mirror': None},
+ (u'fuzztree', u'intermediateEventSet', u'cardinality'): {'default': 1,
+                                                          'hidden': False,
+                                                          'kind': u'numeric',
+                                                          'mirror': u'#{{$0}}'},
+ (u'fuzztree', u'intermediateEventSet', u'cost'): {'default': 1,
+                                                   'hidden': False,
+                                                   'kind': u'numeric',
+                                                   'mirror': u'c={{$0}}'},
+ (u'fuzztree', u'intermediateEventSet', u'name'): {'default': u'Intermediate Event Set',
+                                                   'hidden': False,
+                                                   'kind': u'text',
+                                                   'mirror': u'{{$0}}'},
+ (u'fuzztree', u'intermediateEventSet', u'optional'): {'default': False,
+                                                       'hidden': False,
+                                                       'kind': u'bool',
+                                                       'mirror': None},
+ (u'fuzztree', 'nodeGroups', u'cost'): {'default': 1,
+                                        'hidden': False,
+                                        'kind': u'numeric',
+                                        'mirror': u'c={{$0}}'},
+ (u'fuzztree', 'nodeGroups', u'name'): {'default': u'Repeated BasicEvent',
+                                        'hidden': False,
+                                        'kind': u'text',
+                                        'mirror': u'{{$0}}'},
+ (u'fuzztree', 'nodeGroups', u'optional'): {'default': False,
+                                            'hidden': False,
+                                            'kind': u'bool',
+                                            'mirror': None},
+ (u'fuzztree', 'nodeGroups', u'probability'): {'default': [0, [0.5, 0]],
+                                               'hidden': False,
+                                               'kind': u'compound',
+                                               'mirror': None},
+ (u'fuzztree', u'redundancyVariation', u'kFormula'): {'default': u'N-1',
+                                                      'hidden': False,
+                                                      'kind': u'text',
+                                                      'mirror': u'k: {{$0}}'},
+ (u'fuzztree', u'redundancyVariation', u'nRange'): {'default': [1, 2],
+                                                    'hidden': False,
+                                                    'kind': u'range',
+                                                    'mirror': u'N: {{$0}}-{{$1}}'},
+ (u'fuzztree', u'redundancyVariation', u'name'): {'default': u'Redundancy Variation',
+                                                  'hidden': False,
+                                                  'kind': u'text',
+                                                  'mirror': u'{{$0}}'},
+ (u'fuzztree', u'stickyNote', u'description'): {'default': u'Sample Text',
+                                                'hidden': True,
+                                                'kind': u'textfield',
+                                                'mirror': None},
+ (u'fuzztree', u'stickyNote', u'height'): {'default': 150,
+                                           'hidden': True,
+                                           'kind': u'numeric',
+                                           'mirror': None},
+ (u'fuzztree', u'stickyNote', u'width'): {'default': 150,
+                                          'hidden': True,
+                                          'kind': u'numeric',
+                                          'mirror': None},
+ (u'fuzztree', u'topEvent', u'cost'): None,
+ (u'fuzztree', u'topEvent', u'decompositions'): {'default': 1,
+                                                 'hidden': False,
+                                                 'kind': u'numeric',
+                                                 'mirror': None},
+ (u'fuzztree', u'topEvent', u'missionTime'): {'default': 17532,
+                                              'hidden': False,
+                                              'kind': u'numeric',
+                                              'mirror': None},
+ (u'fuzztree', u'topEvent', u'name'): {'default': u'Top Event',
+                                       'hidden': False,
+                                       'kind': u'text',
+                                       'mirror': u'{{$0}}'},
+ (u'fuzztree', u'topEvent', u'optional'): None,
+ (u'fuzztree', u'transferIn', u'transfer'): {'default': -1,
+                                             'hidden': False,
+                                             'kind': u'transfer',
+                                             'mirror': u'\u25c4 {{$0}}'},
+ (u'fuzztree', u'transferIn', u'transferMaxCost'): {'default': 1,
+                                                    'hidden': False,
+                                                    'kind': u'numeric',
+                                                    'mirror': u'max(c)={{$0}}'},
+ (u'fuzztree', u'undevelopedEvent', u'cost'): {'default': 1,
+                                               'hidden': False,
+                                               'kind': u'numeric',
+                                               'mirror': u'c={{$0}}'},
+ (u'fuzztree', u'undevelopedEvent', u'name'): {'default': u'Undeveloped Event',
+                                               'hidden': False,
+                                               'kind': u'text',
+                                               'mirror': u'{{$0}}'},
+ (u'fuzztree', u'undevelopedEvent', u'optional'): {'default': False,
+                                                   'hidden': False,
+                                                   'kind': u'bool',
+                                                   'mirror': None},
+ (u'fuzztree', u'variationPoint', u'name'): {'default': u'Variation Point',
+                                             'hidden': False,
+                                             'kind': u'text',
+                                             'mirror': u'{{$0}}'},
+ (u'fuzztree', u'votingOrGate', u'k'): {'default': 1,
+                                        'hidden': False,
+                                        'kind': u'numeric',
+                                        'mirror': u'k={{$0}}'},
+ (u'rbd', u'block', u'name'): {'default': u'Node',
+                               'hidden': False,
+                               'kind': u'text',
+                               'mirror': ''},
+ (u'rbd', u'block', u'probability'): {'default': [0, 0],
+                                      'hidden': False,
+                                      'kind': u'compound',
+                                      'mirror': None},
+ (u'rbd', u'end', u'name'): {'default': u'End',
+                             'hidden': False,
+                             'kind': u'text',
+                             'mirror': ''},
+ (u'rbd', u'node', u'name'): {'default': u'Node',
+                              'hidden': False,
+                              'kind': u'text',
+                              'mirror': ''},
+ (u'rbd', u'out_of', u'name'): {'default': u'Out of',
+                                'hidden': False,
+                                'kind': u'text',
+                                'mirror': ''},
+ (u'rbd', u'out_of', u'out_of'): {'default': [1, 1],
+                                  'hidden': False,
+                                  'kind': u'range',
+                                  'mirror': u'{{$0}}/{{$1}}'},
+ (u'rbd', u'start', u'name'): {'default': u'Start',
+                               'hidden': False,
+                               'kind': u'text',
+                               'mirror': ''},
+ (u'rbd', u'stickyNote', u'description'): {'default': u'Sample Text',
+                                           'hidden': True,
+                                           'kind': u'textfield',
+                                           'mirror': None},
+ (u'rbd', u'stickyNote', u'height'): {'default': 150,
+                                      'hidden': True,
+                                      'kind': u'numeric',
+                                      'mirror': None},
+ (u'rbd', u'stickyNote', u'name'): {'default': u'Node',
+                                    'hidden': True,
+                                    'kind': u'text',
+                                    'mirror': ''},
+ (u'rbd', u'stickyNote', u'width'): {'default': 150,
+                                     'hidden': True,
+                                     'kind': u'numeric',
+                                     'mirror': None}}
+
+hidden_child_properties = {(u'dfd', u'external'): set([]),
+ (u'dfd', u'node'): set([]),
+ (u'dfd', u'process'): set([]),
+ (u'dfd', u'stickyNote'): set([]),
+ (u'dfd', u'storage'): set([]),
+ (u'faulttree', u'andGate'): set([]),
+ (u'faulttree', u'basicEvent'): set([]),
+ (u'faulttree', u'basicEventSet'): set([]),
+ (u'faulttree', u'dynamicGate'): set([]),
+ (u'faulttree', u'event'): set([]),
+ (u'faulttree', u'eventSet'): set([]),
+ (u'faulttree', u'fdepGate'): set([]),
+ (u'faulttree', u'gate'): set([]),
+ (u'faulttree', u'houseEvent'): set([]),
+ (u'faulttree', u'intermediateEvent'): set([]),
+ (u'faulttree', u'intermediateEventSet'): set([]),
+ (u'faulttree', u'node'): set([]),
+ (u'faulttree', u'orGate'): set([]),
+ (u'faulttree', u'priorityAndGate'): set([]),
+ (u'faulttree', u'seqGate'): set([]),
+ (u'faulttree', u'spareGate'): set([]),
+ (u'faulttree', u'staticGate'): set([]),
+ (u'faulttree', u'stickyNote'): set([]),
+ (u'faulttree', u'topEvent'): set([]),
+ (u'faulttree', u'transferIn'): set([]),
+ (u'faulttree', u'undevelopedEvent'): set([]),
+ (u'faulttree', u'votingOrGate'): set([]),
+ (u'faulttree', u'xorGate'): set([]),
+ (u'fuzztree', u'andGate'): set([]),
+ (u'fuzztree', u'basicEvent'): set([]),
+ (u'fuzztree', u'basicEventSet'): set([]),
+ (u'fuzztree', u'dynamicGate'): set([]),
+ (u'fuzztree', u'event'): set([]),
+ (u'fuzztree', u'eventSet'): set([]),
+ (u'fuzztree', u'featureVariation'): set([u'optional']),
+ (u'fuzztree', u'gate'): set([]),
+ (u'fuzztree', u'houseEvent'): set([]),
+ (u'fuzztree', u'intermediateEvent'): set([]),
+ (u'fuzztree', u'intermediateEventSet'): set([]),
+ (u'fuzztree', u'node'): set([]),
+ (u'fuzztree', u'orGate'): set([]),
+ (u'fuzztree', u'redundancyVariation'): set([u'cardinality', u'optional']),
+ (u'fuzztree', u'staticGate'): set([]),
+ (u'fuzztree', u'stickyNote'): set([]),
+ (u'fuzztree', u'topEvent'): set([]),
+ (u'fuzztree', u'transferIn'): set([]),
+ (u'fuzztree', u'undevelopedEvent'): set([]),
+ (u'fuzztree', u'variationPoint'): set([]),
+ (u'fuzztree', u'votingOrGate'): set([]),
+ (u'fuzztree', u'xorGate'): set([]),
+ (u'rbd', u'block'): set([]),
+ (u'rbd', u'end'): set([]),
+ (u'rbd', u'node'): set([]),
+ (u'rbd', u'out_of'): set([]),
+ (u'rbd', u'start'): set([]),
+ (u'rbd', u'stickyNote'): set([])}
+
 # END OF GENERATED CONTENT
\ No newline at end of file
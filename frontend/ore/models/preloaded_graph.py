@@ -0,0 +1,484 @@
+import json
+import logging
+import sys
+import threading
+
+from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+from django.db.models import Q
+from django.db.models.aggregates import Max
+import pyxb.utils.domutils
+
+from . import xml_fuzztree
+from . import xml_faulttree
+from .node import Node, fuzztree_classes, faulttree_classes, xml_probability, notation_default
+from .edge import Edge
+from .node_group import NodeGroup
+from .property_owner import build_documents, encode_properties
+
+logger = logging.getLogger('ore')
+
+# Stack frames needed by PyXB / minidom for rendering one level of an XML tree, and for everything around it
+XML_RENDER_FRAMES_PER_LEVEL = 4
+XML_RENDER_FRAMES_RESERVE = 1000
+# C stack bytes for rendering one level of an XML tree, and for everything around it
+XML_RENDER_STACK_PER_LEVEL = 2048
+XML_RENDER_STACK_RESERVE = 1024 * 1024
+# Deeper graphs are rejected instead of being rendered
+XML_MAX_DEPTH = 10000
+
+# The recursion limit is global for the process, so only one deep rendering may change it at a time
+_deep_render_lock = threading.Lock()
+
+
+def render_deep(render, depth):
+    '''
+        Calls render() for an XML tree of the given depth, which PyXB and minidom walk recursively. Trees that do
+        not fit into the current recursion limit are rendered in a separate thread, whose C stack is large enough
+        for the raised limit. The former limit is restored afterwards.
+    '''
+    if depth > XML_MAX_DEPTH:
+        raise ValueError('Graph depth %u exceeds the XML rendering limit of %u' % (depth, XML_MAX_DEPTH))
+    needed_limit = XML_RENDER_FRAMES_PER_LEVEL * depth + XML_RENDER_FRAMES_RESERVE
+    if needed_limit <= sys.getrecursionlimit():
+        return render()
+
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = render()
+        except Exception:
+            outcome['error'] = sys.exc_info()
+
+    with _deep_render_lock:
+        logger.debug('Rendering XML of depth %u with recursion limit %u' % (depth, needed_limit))
+        former_limit = sys.getrecursionlimit()
+        former_stack_size = threading.stack_size(XML_RENDER_STACK_PER_LEVEL * depth + XML_RENDER_STACK_RESERVE)
+        try:
+            sys.setrecursionlimit(needed_limit)
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+        finally:
+            threading.stack_size(former_stack_size)
+            sys.setrecursionlimit(former_limit)
+    if 'error' in outcome:
+        raise outcome['error'][0], outcome['error'][1], outcome['error'][2]
+    return outcome['result']
+
+
+class PreloadedGraph(object):
+
+    """
+    Class: PreloadedGraph
+
+    An in-memory copy of all non-deleted nodes, edges, node groups and properties of a graph. The whole graph
+    is fetched with a fixed number of queries, independent of its size, so that serializers can walk it without
+    touching the database again.
+
+    Fields:
+     {Graph} graph            - the graph model instance this copy was loaded from
+     {Graph} content          - the graph holding the loaded rows, differs from 'graph' for shared snapshots
+     {int}   revision         - the graph revision the loaded rows belong to
+     {list}  nodes            - node rows as dictionaries, ordered by primary key
+     {list}  edges            - edge rows as dictionaries, ordered by primary key
+     {list}  groups           - node group rows as dictionaries, ordered by primary key
+     {dict}  node_properties  - node pk to {key: native property value}
+     {dict}  edge_properties  - edge pk to {key: native property value}
+     {dict}  group_properties - node group pk to {key: native property value}
+     {dict}  group_members    - node group pk to list of member node client ID's
+     {dict}  node_groups      - node pk to the pk of the first node group containing it
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        # Fetched first, so that modifications during the loading are reported again with the next changes request
+        self.revision = graph.current_revision()
+        self.content = graph.content_graph()
+        self._load(Node.objects.filter(graph=self.content, deleted=False),
+                   Edge.objects.filter(graph=self.content, deleted=False),
+                   NodeGroup.objects.filter(graph=self.content, deleted=False))
+
+    def _load(self, nodes, edges, groups, adjacent_edges=None):
+        '''
+            Fetches the given node, edge and node group querysets, together with their properties and group
+            memberships. The incoming and outgoing edges of the nodes are taken from 'adjacent_edges', which
+            defaults to the loaded edges.
+        '''
+        edge_fields = ('pk', 'client_id', 'source_id', 'target_id', 'source__client_id', 'target__client_id')
+        self.nodes = list(nodes.order_by('pk').values('pk', 'client_id', 'kind', 'x', 'y', 'property_document'))
+        self.edges = list(edges.order_by('pk').values(*(edge_fields + ('property_document',))))
+        self.groups = list(groups.order_by('pk').values('pk', 'client_id', 'property_document'))
+
+        self.group_members = {group['pk']: [] for group in self.groups}
+        self.group_member_kinds = {group['pk']: [] for group in self.groups}
+        self.node_groups = {}
+        memberships = NodeGroup.nodes.through.objects.filter(nodegroup__in=groups)
+        for group_pk, node_pk, node_client_id, node_kind in memberships.order_by('nodegroup_id', 'pk').values_list(
+                'nodegroup_id', 'node_id', 'node__client_id', 'node__kind'):
+            self.group_members[group_pk].append(node_client_id)
+            self.group_member_kinds[group_pk].append(node_kind)
+            self.node_groups.setdefault(node_pk, group_pk)
+
+        self.node_properties = self._load_properties(Node, self.nodes)
+        self.edge_properties = self._load_properties(Edge, self.edges)
+        self.group_properties = self._load_properties(NodeGroup, self.groups)
+
+        if adjacent_edges is None:
+            adjacent_edges = self.edges
+        else:
+            adjacent_edges = list(adjacent_edges.order_by('pk').values(*edge_fields))
+        self.nodes_by_pk = {node['pk']: node for node in self.nodes}
+        self.outgoing = {node['pk']: [] for node in self.nodes}
+        self.incoming = {node['pk']: [] for node in self.nodes}
+        for edge in adjacent_edges:
+            if edge['source_id'] in self.outgoing:
+                self.outgoing[edge['source_id']].append(edge)
+            if edge['target_id'] in self.incoming:
+                self.incoming[edge['target_id']].append(edge)
+
+    def _load_properties(self, model, rows):
+        '''
+            Takes the property documents out of the given element rows, missing documents are rebuilt
+            with one query for all of them.
+
+            Returns:
+             {dict} element pk to {key: native property value}
+        '''
+        result = {}
+        missing = []
+        for row in rows:
+            document = row.pop('property_document')
+            if document is None:
+                missing.append((row['pk'], row.get('kind')))
+            else:
+                result[row['pk']] = json.loads(document)
+        result.update(build_documents(model, self.graph.kind, missing))
+        return result
+
+    def node_property_values(self, node):
+        '''
+            Returns the properties of the given preloaded node in native representation.
+        '''
+        return self.node_properties.get(node['pk'], {})
+
+    def node_property(self, node, key, default=None):
+        '''
+            Same result as Node.get_property(), or NodeGroup.get_property() if the node is part of a group,
+            based on the preloaded data.
+        '''
+        group_pk = self.node_groups.get(node['pk'])
+        if group_pk is None:
+            values = self.node_properties.get(node['pk'], {})
+            node_kind = node['kind']
+        else:
+            # In theory, the node can be in multiple groups
+            # In (fault / fuzz) tree practice, it is only in one
+            values = self.group_properties.get(group_pk, {})
+            node_kind = self.group_member_kinds[group_pk][0]
+        if key in values:
+            return values[key]
+        return notation_default(self.graph.kind, node_kind, key, default)
+
+    def children(self, node):
+        '''
+            The preloaded child nodes of the given node, in edge order.
+        '''
+        return [self.nodes_by_pk[edge['target_id']] for edge in self.outgoing[node['pk']]
+                if edge['target_id'] in self.nodes_by_pk]
+
+    def parents(self, node):
+        '''
+            The preloaded parent nodes of the given node, in edge order.
+        '''
+        return [self.nodes_by_pk[edge['source_id']] for edge in self.incoming[node['pk']]
+                if edge['source_id'] in self.nodes_by_pk]
+
+    def top_event(self):
+        '''
+            The preloaded top event node of the graph.
+        '''
+        top_events = [node for node in self.nodes if node['kind'] == 'topEvent']
+        if not top_events:
+            raise ObjectDoesNotExist('Graph %u has no top event.' % self.graph.pk)
+        if len(top_events) > 1:
+            raise MultipleObjectsReturned('Graph %u has more than one top event.' % self.graph.pk)
+        return top_events[0]
+
+    def seed(self):
+        '''
+            The largest client ID ever used in this graph, including deleted elements.
+        '''
+        node_seed = Node.objects.filter(graph=self.content).aggregate(Max('client_id'))['client_id__max']
+        edge_seed = Edge.objects.filter(graph=self.content).aggregate(Max('client_id'))['client_id__max']
+        group_seed = NodeGroup.objects.filter(graph=self.content).aggregate(Max('client_id'))['client_id__max']
+        return max(node_seed, edge_seed, group_seed)
+
+    def node_to_dict(self, node, use_value_dict=False):
+        '''
+            Same output as Node.to_dict(), based on the preloaded data.
+        '''
+        prop_values = self.node_property_values(node)
+        if use_value_dict:
+            prop_values = {key: {'value': value} for key, value in prop_values.iteritems()}
+        return {
+            'properties': prop_values,
+            'id': node['client_id'],
+            'kind': node['kind'],
+            'x': node['x'],
+            'y': node['y'],
+            'outgoing': [edge['client_id'] for edge in self.outgoing[node['pk']]],
+            'incoming': [edge['client_id'] for edge in self.incoming[node['pk']]]
+        }
+
+    def edge_to_dict(self, edge, use_value_dict=False):
+        '''
+            Same output as Edge.to_dict(), based on the preloaded data.
+        '''
+        prop_values = encode_properties(self.edge_properties.get(edge['pk'], {}), self.graph.kind, 'edges')
+        if use_value_dict:
+            prop_values = {key: {'value': value} for key, value in prop_values.iteritems()}
+        return {
+            'properties': prop_values,
+            'id': edge['client_id'],
+            'graph': self.graph.pk,
+            'source': edge['source__client_id'],
+            'target': edge['target__client_id']
+        }
+
+    def group_to_dict(self, group, use_value_dict=False):
+        '''
+            Same output as NodeGroup.to_dict(), based on the preloaded data.
+        '''
+        prop_values = encode_properties(self.group_properties.get(group['pk'], {}), self.graph.kind, 'nodeGroups')
+        if use_value_dict:
+            prop_values = {key: {'value': value} for key, value in prop_values.iteritems()}
+        return {'id': group['client_id'],
+                'nodeIds': self.group_members[group['pk']],
+                'properties': prop_values,
+                }
+
+    def to_dict(self, use_value_dict=False):
+        '''
+            Same output as Graph.to_dict(), based on the preloaded data.
+        '''
+        return {
+            'id': self.graph.pk,
+            'seed': self.seed(),
+            'name': self.graph.name,
+            'type': self.graph.kind,
+            'readOnly': self.graph.read_only,
+            'revision': self.revision,
+            'nodes': [self.node_to_dict(node, use_value_dict) for node in self.nodes],
+            'edges': [self.edge_to_dict(edge, use_value_dict) for edge in self.edges],
+            'nodeGroups': [self.group_to_dict(group, use_value_dict) for group in self.groups]
+        }
+
+    def node_to_xml(self, node, xmltype):
+        '''
+            Creates the PyXB XML node for the given preloaded node, without its children. Same attributes as
+            created by the former recursive Node.to_xml().
+        '''
+        kind = node['kind']
+        properties = {
+            'id': node['client_id'],
+            'name': self.node_property(node, 'name', '-'),
+            'x': node['x'],
+            'y': node['y']
+        }
+
+        if kind == 'transferIn':
+            properties['fromModelId'] = self.node_property(node, 'transfer')
+
+        # for any node that may have a quantity, set the according property
+        if kind in {'basicEventSet', 'intermediateEventSet'}:
+            properties['quantity'] = self.node_property(node, 'cardinality')
+
+        if kind == 'topEvent':
+            properties['missionTime'] = self.node_property(node, 'missionTime')
+            properties['decompositionNumber'] = self.node_property(node, 'decompositions')
+
+        # Special treatment for some of the FuzzTree node types
+        if xmltype == 'fuzztree':
+            # for any node that may be optional, set the according property
+            if kind in {'basicEvent', 'basicEventSet', 'intermediateEvent', 'intermediateEventSet', 'houseEvent'}:
+                properties['optional'] = self.node_property(node, 'optional', False)
+
+            # determine fuzzy or crisp probability, set it accordingly
+            if kind in {'basicEvent', 'basicEventSet', 'houseEvent'}:
+                properties['probability'] = xml_probability(
+                    self.graph.kind, self.node_property(node, 'probability', False))
+                # nodes that have a probability also have costs in FuzzTrees
+                properties['costs'] = self.node_property(node, 'cost', 0)
+
+            # Voting OR in FuzzTrees has different parameter name than in fault trees
+            elif kind == 'votingOrGate':
+                properties['k'] = self.node_property(node, 'k')
+
+            # add range attribute for redundancy variation
+            elif kind == 'redundancyVariation':
+                nRange = self.node_property(node, 'nRange')
+                properties['start'] = nRange[0]
+                properties['end'] = nRange[1]
+                properties['formula'] = self.node_property(node, 'kFormula')
+
+            return fuzztree_classes[kind](**properties)
+
+        # Special treatment for some of the FaultTree node types
+        elif xmltype == 'faulttree':
+            if kind == 'votingOrGate':
+                properties['k'] = self.node_property(node, 'k')
+
+            # determine fuzzy or crisp probability, set it accordingly
+            if kind in {'basicEvent', 'basicEventSet', 'houseEvent'}:
+                properties['probability'] = xml_probability(
+                    self.graph.kind, self.node_property(node, 'probability'))
+
+            if kind == 'fdepGate':
+                properties['triggeredEvents'] = [parent['client_id'] for parent in self.parents(node)]
+                children = self.children(node)
+                # Frontend restriction, comes from notations.json
+                assert(len(children) == 1)
+                properties['trigger'] = children[0]['client_id']
+
+            if kind == 'spareGate':
+                children_sorted = sorted(self.children(node), key=lambda child: child['x'])
+                # TODO: This will kill the XML generation if the graph is
+                # incompletly drawn. Do we want that?
+                assert(len(children_sorted) > 0)
+                properties['primaryID'] = children_sorted[0]['client_id']
+                properties['dormancyFactor'] = self.node_property(node, 'dormancyFactor')
+
+            if kind in ['seqGate', 'priorityAndGate']:
+                properties['eventSequence'] = [
+                    child['client_id'] for child in sorted(self.children(node), key=lambda child: child['x'])]
+
+            return faulttree_classes[kind](**properties)
+
+        raise ValueError('No XML support for this graph type.')
+
+    def xml_subtree(self, root, xmltype=None):
+        '''
+            Creates the PyXB XML tree for the given preloaded node and everything below it. The tree is walked
+            with an explicit stack, so that the depth of the graph is not limited by the Python call stack.
+
+            Every node is emitted once, below the first parent reaching it in depth-first order. The only node
+            kind that may have several parents is the FDEP gate, which references all of its parents in the
+            'triggeredEvents' attribute anyway. The XML size is therefore linear in the graph size. Other nodes
+            with several parents can not be expressed without changing the analyzed tree, and raise a ValueError.
+
+            Returns a tuple of the XML node and the depth of the generated tree.
+        '''
+        if not xmltype:
+            xmltype = self.graph.kind
+        root_xml = self.node_to_xml(root, xmltype)
+        emitted = {root['pk']}
+        max_depth = 1
+        stack = [(child, root_xml, 2) for child in reversed(self.children(root))]
+        while stack:
+            node, parent_xml, depth = stack.pop()
+            if node['pk'] in emitted:
+                if node['kind'] != 'fdepGate':
+                    raise ValueError('Node %u has more than one parent, which is only allowed for FDEP gates.' %
+                                     node['client_id'])
+                continue
+            emitted.add(node['pk'])
+            xml_node = self.node_to_xml(node, xmltype)
+            parent_xml.children.append(xml_node)
+            max_depth = max(max_depth, depth)
+            stack.extend((child, xml_node, depth + 1) for child in reversed(self.children(node)))
+        return root_xml, max_depth
+
+    def to_xml(self, xmltype=None):
+        '''
+            Same output as the former Graph.to_xml(), based on the preloaded data.
+        '''
+        bds = pyxb.utils.domutils.BindingDOMSupport()
+        kind = xmltype or self.graph.kind
+        if kind == "fuzztree":
+            tree = xml_fuzztree.FuzzTree(name=self.graph.name, id=self.graph.pk)
+            bds.DeclareNamespace(xml_fuzztree.Namespace, 'fuzzTree')
+        elif kind == "faulttree":
+            tree = xml_faulttree.FaultTree(name=self.graph.name, id=self.graph.pk)
+            bds.DeclareNamespace(xml_faulttree.Namespace, 'faultTree')
+        else:
+            raise ValueError('No XML support for this graph type.')
+
+        tree.topEvent, depth = self.xml_subtree(self.top_event(), kind)
+        return render_deep(lambda: tree.toDOM(bds).toprettyxml(), depth)
+
+
+class PreloadedChanges(PreloadedGraph):
+
+    """
+    Class: PreloadedChanges
+
+    An in-memory copy of the nodes, edges and node groups of a graph that were created, modified or deleted after
+    a given graph revision. Nodes are also contained when only their incoming or outgoing edges changed, since the
+    edge lists are part of the node serialization. Deleted elements are only reported by their client ID.
+
+    Fields:
+     {int}  since    - the graph revision the changes are relative to
+     {int}  revision - the graph revision the changes lead to
+     {dict} deleted  - client ID's of the deleted elements, with the keys 'nodes', 'edges' and 'nodeGroups'
+    """
+
+    def __init__(self, graph, since):
+        self.graph = graph
+        self.since = since
+        # Fetched first, so that modifications during the loading are reported again with the next request
+        self.revision = graph.current_revision()
+        if since > self.revision:
+            raise ValueError('Graph %u has no revision %u yet.' % (graph.pk, since))
+        self.content = graph.content_graph()
+        if self.content != graph:
+            self._load_shared(since)
+            return
+
+        changed_edges = Edge.objects.filter(graph=graph, revision__gt=since)
+        nodes = Node.objects.filter(graph=graph, deleted=False).filter(
+            Q(revision__gt=since) |
+            Q(pk__in=changed_edges.values('source_id')) |
+            Q(pk__in=changed_edges.values('target_id')))
+        self._load(nodes,
+                   changed_edges.filter(deleted=False),
+                   NodeGroup.objects.filter(graph=graph, deleted=False, revision__gt=since),
+                   Edge.objects.filter(graph=graph, deleted=False).filter(Q(source__in=nodes) | Q(target__in=nodes)))
+
+        self.deleted = {
+            'nodes': list(Node.objects.filter(graph=graph, deleted=True, revision__gt=since)
+                                      .values_list('client_id', flat=True)),
+            'edges': list(changed_edges.filter(deleted=True).values_list('client_id', flat=True)),
+            'nodeGroups': list(NodeGroup.objects.filter(graph=graph, deleted=True, revision__gt=since)
+                                                .values_list('client_id', flat=True))
+        }
+
+    def _load_shared(self, since):
+        '''
+            The shared content of a snapshot is stamped with the revisions of its source graph, which are
+            meaningless for the snapshot. Since the snapshot content does not change as long as it is shared,
+            the whole content is reported for any older revision.
+        '''
+        if since == self.revision:
+            self._load(Node.objects.none(), Edge.objects.none(), NodeGroup.objects.none())
+        else:
+            self._load(Node.objects.filter(graph=self.content, deleted=False),
+                       Edge.objects.filter(graph=self.content, deleted=False),
+                       NodeGroup.objects.filter(graph=self.content, deleted=False))
+        self.deleted = {'nodes': [], 'edges': [], 'nodeGroups': []}
+
+    def to_dict(self, use_value_dict=False):
+        '''
+            Same output format as Graph.to_dict(), but only with the changed elements.
+        '''
+        return {
+            'id': self.graph.pk,
+            'since': self.since,
+            'revision': self.revision,
+            'seed': self.seed(),
+            'readOnly': self.graph.read_only,
+            'nodes': [self.node_to_dict(node, use_value_dict) for node in self.nodes],
+            'edges': [self.edge_to_dict(edge, use_value_dict) for edge in self.edges],
+            'nodeGroups': [self.group_to_dict(group, use_value_dict) for group in self.groups],
+            'deleted': self.deleted
+        }
@@ -1,12 +1,16 @@
 import logging
 import json
 
-from django.db import models
+from django.db import models, transaction
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
 
+from ore import graph_modification
 from .node import Node
 from .edge import Edge
 from .node_group import NodeGroup
-from .notations import by_kind
+from .notations import property_index
 
 logger = logging.getLogger('ore')
 
@@ -81,25 +85,33 @@ class Property(models.Model):
             and leads to a 500 in production if somebody tries to inject arbitrary property keys
             or misformated property values through the API.
         '''
+        if isinstance(obj, Node):
+            return cls.notation_value_type(key, obj.graph.kind, 'nodes', obj.kind, obj)
+        elif isinstance(obj, Edge):
+            return cls.notation_value_type(key, obj.graph.kind, 'edges', owner=obj)
+        elif isinstance(obj, NodeGroup):
+            return cls.notation_value_type(key, obj.graph.kind, 'nodeGroups', owner=obj)
+
+    @classmethod
+    def notation_value_type(cls, key, graph_kind, section, node_kind=None, owner=None):
+        '''
+            Return the expected value data type of the property 'key', based only on the
+            graph kind, the notation section ('nodes', 'edges' or 'nodeGroups') and, for nodes,
+            the node kind. This allows callers that work on preloaded rows to determine the
+            value type without touching the owning model instance.
+        '''
         # Check for property keys that are not part of the notations file
         # TODO: Make this an issue for the JS guys, so that the notations
         #       file really has all possible properties defined
         if key in ['x', 'y', 'key']:
             return 'numeric'
-        try:
-            if isinstance(obj, Node):
-                return by_kind[obj.graph.kind][
-                    'nodes'][obj.kind]['properties'][key]['kind']
-            elif isinstance(obj, Edge):
-                return by_kind[obj.graph.kind][
-                    'edges']['properties'][key]['kind']
-            elif isinstance(obj, NodeGroup):
-                return by_kind[obj.graph.kind][
-                    'nodeGroups']['properties'][key]['kind']
-        except Exception as e:
-            text = "Invalid property key '{0}' being used for {1}, exception thrown: {2}".format(key, obj, e)
+        entry = property_index.get((graph_kind, node_kind if section == 'nodes' else section, key))
+        if entry is None:
+            text = "Invalid property key '{0}' being used for {1}".format(
+                key, owner if owner is not None else node_kind or section)
             logger.error(text)
             raise Exception(text)
+        return entry['kind']
 
     def object(self):
         if self.node:
@@ -119,13 +131,21 @@ class Property(models.Model):
         else:
             val = self.value
         val_type = Property.value_type(self.key, self.object())
+        return Property.text_to_value(val_type, val, self.pk)
+
+    @staticmethod
+    def text_to_value(val_type, val, pk=None):
+        '''
+            Converts the stored text representation of a property value into its native
+            representation, according to the given notation value type.
+        '''
         if val_type == 'text' or val_type == 'textfield':
             return unicode(val)
         elif val_type == 'compound' or val_type == 'range':
             if val.startswith('"') and val.endswith('"'):
                 # Illformed legacy data stored in older versions
                 # We prefer to trust the notation type specification
-                logger.warning("Illformed value in property %u" % self.pk)
+                logger.warning("Illformed value in property %s" % pk)
                 val = val[1:-1]
             return json.loads(val)
         elif val_type == 'numeric':
@@ -142,26 +162,61 @@ class Property(models.Model):
             Saves the given value, converts from native representation before.
         '''
         val_type = Property.value_type(self.key, self.object())
+        try:
+            self.value = Property.value_to_text(val_type, new_value)
+        except ValueError:
+            raise Exception("Unknown property value type '%s' being used for %s" % (val_type, str(self)))
+        self.save()
+
+    @classmethod
+    def save_values(cls, owner, values):
+        '''
+            Saves many property values of one node, edge or node group, given as {key: native value}.
+            All values are converted and checked against the notation before anything is written, the
+            properties are then stored with a constant number of queries (see bulk.bulk_save_properties),
+            and merged into the property document of the owner, which is read again under a row lock.
+            No model signals are sent, the caller is responsible for reporting the owner as modified.
+        '''
+        from .bulk import bulk_save_properties
+        texts = {}
+        native = {}
+        for key, new_value in values.iteritems():
+            val_type = cls.value_type(key, owner)
+            try:
+                texts[key] = cls.value_to_text(val_type, new_value)
+            except ValueError:
+                raise Exception("Unknown property value type '%s' being used for %s" % (val_type, key))
+            native[key] = cls.text_to_value(val_type, texts[key])
+        if not texts:
+            return
+        graph_modification.before_modification(owner.graph_id)
+        with transaction.atomic(savepoint=False):
+            # The owner row lock serializes concurrent writers of the same owner
+            document = owner.locked_property_values()
+            bulk_save_properties(owner.property_owner_field, {owner.pk: texts})
+            document.update(native)
+            owner.store_property_document(document)
+
+    @staticmethod
+    def value_to_text(val_type, new_value):
+        '''
+            Converts the native representation of a property value into its stored text representation,
+            according to the given notation value type.
+        '''
         if val_type == 'text' or val_type == 'textfield':
-            self.value = unicode(new_value)
+            return unicode(new_value)
         elif val_type == 'compound' or val_type == 'range':
             if isinstance(new_value, basestring):
                 # Somebody, preferably some importer, forgot to interpret
                 # its JSON data and just passed the raw string
                 # Since this is the only position in the code where property
                 # types are checked anyway, we try to be gentle here.
-                self.value = new_value
+                return new_value
             else:
-                self.value = json.dumps(new_value)
-        elif val_type == 'numeric':
-            self.value = str(new_value)
-        elif val_type == 'bool':
-            self.value = str(new_value)
-        elif val_type == 'transfer':
-            self.value = str(new_value)
-        else:
-            raise Exception("Unknown property value type '%s' being used for %s" % (val_type, str(self)))
-        self.save()
+                return json.dumps(new_value)
+        elif val_type in ('numeric', 'bool', 'transfer'):
+            return str(new_value)
+        raise ValueError("Unknown property value type '%s'" % val_type)
 
     def same_as(self, prop):
         '''
@@ -173,3 +228,30 @@ class Property(models.Model):
         if not same_val:
             return False
         return True
+
+
+@receiver(pre_save, sender=Property)
+@receiver(pre_delete, sender=Property)
+def graph_content_modify(sender, instance, **kwargs):
+    # snapshots that share the graph content get their own copy before it changes
+    if not kwargs.get('raw'):
+        graph_modification.before_modification(instance.object().graph_id)
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def graph_modify(sender, instance, **kwargs):
+    # property changes do not save the owning graph, but must invalidate its cached serializations.
+    # Deletions are reported once the row is gone, so that no reader caches the old state under the new revision.
+    if kwargs.get('raw'):
+        # Fixture loading, the owner may not exist yet
+        return
+    try:
+        owner = instance.object()
+    except ObjectDoesNotExist:
+        # Deleted together with its owner, which reports the modification itself
+        return
+    # the stored property document of the owner is outdated now
+    owner.invalidate_property_document()
+    # the owner is reported as changed, together with its properties
+    graph_modification.element_modified(owner)
@@ -0,0 +1,150 @@
+'''
+    Per-object property documents for nodes, edges and node groups.
+
+    Every Property row is still stored, but readers do not need to fetch them. Each owner keeps its
+    current properties, in native representation, as one JSON document in the 'property_document' column.
+    The document is NULL when it has to be rebuilt from the Property rows. This happens for legacy data and
+    after writes that do not maintain the document themselves (e.g. fixtures, Property.save() calls or
+    batch updates). Rebuilt documents are stored again, so that the rows are only read once after a change.
+'''
+
+import json
+import logging
+
+from django.db import models
+
+logger = logging.getLogger('ore')
+
+
+def decode_properties(rows, graph_kind, section, node_kind=None):
+    '''
+        Converts (key, text value) rows of one owner into a dictionary of native property values.
+        Keys that are not covered by the notation keep their text value.
+    '''
+    from .properties import Property
+    values = {}
+    for key, text in rows:
+        try:
+            val_type = Property.notation_value_type(key, graph_kind, section, node_kind)
+        except Exception:
+            values[key] = text
+            continue
+        values[key] = Property.text_to_value(val_type, text)
+    return values
+
+
+def encode_properties(values, graph_kind, section, node_kind=None):
+    '''
+        Converts a dictionary of native property values into their text representation.
+    '''
+    from .properties import Property
+    texts = {}
+    for key, value in values.iteritems():
+        try:
+            val_type = Property.notation_value_type(key, graph_kind, section, node_kind)
+        except Exception:
+            texts[key] = value
+            continue
+        texts[key] = Property.value_to_text(val_type, value)
+    return texts
+
+
+def build_documents(model, graph_kind, owners):
+    '''
+        Rebuilds the property documents of many owners of the given model class from their Property rows,
+        with one read and one bulk update. 'owners' is a list of (pk, node kind) tuples, the node kind is
+        ignored for edges and node groups.
+
+        Returns:
+         {dict} the native property values by owner primary key
+    '''
+    from .bulk import bulk_update
+    from .properties import Property
+    if not owners:
+        return {}
+    owner_field = model.property_owner_field
+    rows = {pk: [] for pk, node_kind in owners}
+    properties = Property.objects.filter(deleted=False, **{owner_field + '_id__in': rows.keys()}).order_by('pk')
+    for owner_pk, key, text in properties.values_list(owner_field + '_id', 'key', 'value'):
+        rows[owner_pk].append((key, text))
+    result = {pk: decode_properties(rows[pk], graph_kind, model.property_section, node_kind)
+              for pk, node_kind in owners}
+    logger.debug("Rebuilt %u %s property documents" % (len(result), model.property_owner_field))
+    bulk_update(model, 'property_document', {pk: json.dumps(values) for pk, values in result.iteritems()})
+    return result
+
+
+class PropertyOwner(models.Model):
+
+    """
+    Class: PropertyOwner
+
+    Abstract base class for the models that own properties (Node, Edge and NodeGroup).
+
+    Fields:
+     {str} property_document - JSON dictionary of the native property values, None if it must be rebuilt
+    """
+    class Meta:
+        abstract = True
+
+    # Notation section and Property foreign key field of the owner model
+    property_section = None
+    property_owner_field = None
+
+    property_document = models.TextField(null=True, default=None, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            # A new owner has no properties yet, unless they are copied along with the document
+            if self.property_document is None:
+                self.property_document = '{}'
+        # The document is only written with explicit queries, so that saving an instance
+        # that was loaded before a property change does not bring back the old values
+        elif not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'property_document']
+        super(PropertyOwner, self).save(*args, **kwargs)
+
+    def property_node_kind(self):
+        return None
+
+    def property_values(self):
+        '''
+            Returns the native values of all properties of this owner, without touching the Property rows
+            as long as the document is up to date.
+
+            Returns:
+             {dict} the property values by key
+        '''
+        if self.property_document is None:
+            values = build_documents(type(self), self.graph.kind, [(self.pk, self.property_node_kind())])[self.pk]
+            self.property_document = json.dumps(values)
+            return values
+        return json.loads(self.property_document)
+
+    def property_texts(self):
+        '''
+            Returns the property values of this owner in text representation, as stored in the Property rows.
+        '''
+        return encode_properties(self.property_values(), self.graph.kind, self.property_section,
+                                 self.property_node_kind())
+
+    def locked_property_values(self):
+        '''
+            Reads the stored property values of this owner again, instead of trusting the ones cached on this
+            instance, and locks the owner row until the end of the transaction. Concurrent writers of other keys
+            through other instances are thus not overwritten.
+        '''
+        stored = type(self).objects.select_for_update().filter(pk=self.pk).values_list('property_document', flat=True)
+        if not stored or stored[0] is None:
+            return build_documents(type(self), self.graph.kind, [(self.pk, self.property_node_kind())])[self.pk]
+        return json.loads(stored[0])
+
+    def store_property_document(self, values):
+        self.property_document = json.dumps(values)
+        type(self).objects.filter(pk=self.pk).update(property_document=self.property_document)
+
+    def invalidate_property_document(self):
+        self.property_document = None
+        type(self).objects.filter(pk=self.pk).update(property_document=None)
+
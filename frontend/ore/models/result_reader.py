@@ -0,0 +1,157 @@
+'''
+    Incremental reader for the backend result XML (see common/xsd/backendResult.xsd).
+
+    The document is processed with iterparse, and every top-level element is handed out as plain Python
+    object as soon as its closing tag was read. The element is then dropped from the parse tree, so that
+    memory consumption depends on the size of single configurations / results, and not on the document size.
+
+    The produced objects offer the same attribute names as the PyXB bindings in xml_backend, so that
+    the existing interpretation code in Job can work with both. Attributes not given in the XML are None.
+    The XSD type of polymorphic elements (results, choices, probabilities) is given in the 'kind' attribute.
+'''
+
+import logging
+from StringIO import StringIO
+
+from defusedxml.ElementTree import iterparse
+
+logger = logging.getLogger('ore')
+
+XSI_TYPE = '{http://www.w3.org/2001/XMLSchema-instance}type'
+
+
+class ResultItem(object):
+
+    """
+    Class: ResultItem
+
+    Plain attribute container for one parsed XML element.
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __getattr__(self, name):
+        # Only called for attributes that were not given in the XML
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return None
+
+    def __repr__(self):
+        return 'ResultItem(%s)' % ', '.join('%s=%r' % item for item in sorted(self.__dict__.iteritems()))
+
+
+def xsd_type(element):
+    ''' The local name of the xsi:type of the element, namespace prefixes are ignored.'''
+    value = element.get(XSI_TYPE)
+    if value is None:
+        return None
+    return value.split(':')[-1]
+
+
+def to_bool(value):
+    if value is None:
+        return None
+    return value.strip() in ('true', '1')
+
+
+def to_int(value):
+    if value is None:
+        return None
+    return int(value)
+
+
+def to_float(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+def read_issue(element):
+    return ResultItem(issueId=to_int(element.get('issueId')),
+                      elementId=element.get('elementId'),
+                      message=element.get('message'),
+                      isFatal=to_bool(element.get('isFatal')))
+
+
+def read_choice(element):
+    value = element.find('value')
+    return ResultItem(key=element.get('key'),
+                      value_=ResultItem(kind=xsd_type(value),
+                                        included=to_bool(value.get('included')),
+                                        n=to_int(value.get('n')),
+                                        featureId=value.get('featureId')))
+
+
+def read_configuration(element):
+    return ResultItem(id=element.get('id'),
+                      costs=to_int(element.get('costs')),
+                      choice=[read_choice(choice) for choice in element.iter('choice')])
+
+
+def read_probability(element):
+    if element is None:
+        return None
+    alpha_cuts = []
+    for alpha_cut in element.iter('alphaCuts'):
+        value = alpha_cut.find('value')
+        alpha_cuts.append(ResultItem(key=to_float(alpha_cut.get('key')),
+                                     value_=ResultItem(lowerBound=to_float(value.get('lowerBound')),
+                                                       upperBound=to_float(value.get('upperBound')))))
+    return ResultItem(kind=xsd_type(element),
+                      val=to_float(element.get('val')),
+                      alphaCuts=alpha_cuts)
+
+
+def read_result(element):
+    return ResultItem(kind=xsd_type(element),
+                      id=element.get('id'),
+                      modelId=element.get('modelId'),
+                      configId=element.get('configId'),
+                      timestamp=element.get('timestamp'),
+                      validResult=to_bool(element.get('validResult')),
+                      decompositionNumber=to_int(element.get('decompositionNumber')),
+                      reliability=to_float(element.get('reliability')),
+                      availability=to_float(element.get('availability')),
+                      duration=to_float(element.get('duration')),
+                      mttf=to_float(element.get('mttf')),
+                      nFailures=to_int(element.get('nFailures')),
+                      nSimulatedRounds=to_int(element.get('nSimulatedRounds')),
+                      probability=read_probability(element.find('probability')),
+                      nodeid=[nodeid.text for nodeid in element.findall('nodeid')],
+                      issue=[read_issue(issue) for issue in element.findall('issue')])
+
+
+readers = {
+    'issue': read_issue,
+    'configuration': read_configuration,
+    'result': read_result
+}
+
+
+def iter_backend_result(data):
+    '''
+        Generator for the top-level elements of a backend result document, given as string or file-like object.
+
+        Returns:
+         Tuples of element name ('issue', 'configuration' or 'result') and the according ResultItem.
+    '''
+    source = StringIO(data) if isinstance(data, basestring) else data
+    depth = 0
+    root = None
+    for event, element in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        reader = readers.get(element.tag)
+        if reader is None:
+            logger.warning('Ignoring unknown element <%s> in backend result' % element.tag)
+        else:
+            yield element.tag, reader(element)
+        # Everything below the root that was read so far is no longer needed
+        root.clear()
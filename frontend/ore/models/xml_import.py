@@ -0,0 +1,117 @@
+'''
+    Bulk import of fuzztree and faulttree XML documents, see Graph.from_xml() and Node.load_xml().
+'''
+
+import datetime
+import json
+import logging
+
+from django.db import transaction
+
+from ore import graph_modification
+
+from .bulk import bulk_create_with_pks
+from .graph import Graph
+from .project import Project
+from .node import Node, fuzztree_classes, faulttree_classes
+from .edge import Edge
+from .properties import Property
+from . import notations
+
+logger = logging.getLogger('ore')
+
+# Node properties that are taken over from the XML, if the notation supports them for the node kind
+XML_PROPERTIES = ('name', 'optional')
+
+
+class XmlImport(object):
+
+    """
+    Class: XmlImport
+
+    Creates the nodes, edges and node properties for a PyXB fuzztree or faulttree XML tree. The tree is walked
+    iteratively, so that its depth is not limited by the Python stack. All nodes are inserted with one bulk
+    operation, followed by one for their properties and one for the edges to their parents. The XML has no
+    edge ID's, so the edge client ID's are allocated as one block behind the largest node client ID of the graph.
+
+    Fields:
+     {Graph} graph    - the graph to be filled
+     {str}   xmltype  - 'faulttree' or 'fuzztree', the schema of the XML tree
+     {int}   revision - the graph revision the imported elements are stamped with
+    """
+
+    def __init__(self, graph, xmltype=None):
+        self.graph = graph
+        self.xmltype = xmltype or graph.kind
+        assert (self.xmltype in ["faulttree", "fuzztree"])
+        self.revision = None
+
+    def run(self, xml_root, root=None, parent=None):
+        '''
+            Imports the given XML node and all of its children. The model instance for the XML root node can be
+            given in 'root', and an already existing parent node in 'parent'.
+
+            Returns:
+             {Node} the node created for the XML root node
+        '''
+        with transaction.atomic():
+            graph_modification.before_modification(self.graph.pk)
+            self.revision = Graph.bump_revision(self.graph.pk)
+            nodes, texts, parents = self.walk(xml_root, root)
+            bulk_create_with_pks(Node, nodes)
+            Property.objects.bulk_create([Property(node_id=node.pk, key=key, value=text)
+                                          for node, node_texts in zip(nodes, texts)
+                                          for key, text in node_texts.iteritems()])
+            seed = max(Node.objects.filter(graph=self.graph).order_by('-client_id')
+                                   .values_list('client_id', flat=True)[:1] or [0])
+            edges = []
+            for node, parent_index in zip(nodes, parents):
+                source = nodes[parent_index] if parent_index >= 0 else parent
+                if source is not None:
+                    edges.append(Edge(graph_id=self.graph.pk, revision=self.revision, client_id=seed + 1 + len(edges),
+                                      source_id=source.pk, target_id=node.pk, property_document='{}'))
+            Edge.objects.bulk_create(edges)
+            now = datetime.datetime.now()
+            Graph.objects.filter(pk=self.graph.pk).update(modified=now)
+            Project.objects.filter(pk=self.graph.project_id).update(modified=now)
+        logger.debug("Imported %u nodes and %u edges from XML into graph %u" % (len(nodes), len(edges), self.graph.pk))
+        return nodes[0]
+
+    def walk(self, xml_root, root=None):
+        '''
+            Creates the unsaved nodes and their property text values, in depth-first order.
+
+            Returns:
+             {tuple} the nodes, the property texts per node, and the index of the parent of each node in the node
+                     list (-1 for the root)
+        '''
+        classes = faulttree_classes if self.xmltype == 'faulttree' else fuzztree_classes
+        nodes, texts, parents = [], [], []
+        pending = [(xml_root, -1)]
+        while pending:
+            xml_node, parent_index = pending.pop()
+            node = root if root is not None and not nodes else Node()
+            node.graph = self.graph
+            node.revision = self.revision
+            # All XML nodes got a client id
+            node.client_id = xml_node.id
+            node.x = xml_node.x
+            node.y = xml_node.y
+            # Finding the right kind string is not possible by lookup, since the type(xml_node) result
+            # is different from the used type on generation (TopEvent vs. TopEvent_)
+            node.kind = classes[type(xml_node)]
+            node_texts, document = {}, {}
+            for key in XML_PROPERTIES:
+                if getattr(xml_node, key, None) is not None and \
+                        (self.graph.kind, node.kind, key) in notations.property_index:
+                    val_type = Property.notation_value_type(key, self.graph.kind, 'nodes', node.kind)
+                    node_texts[key] = Property.value_to_text(val_type, getattr(xml_node, key))
+                    document[key] = Property.text_to_value(val_type, node_texts[key])
+            node.property_document = json.dumps(document)
+            parents.append(parent_index)
+            nodes.append(node)
+            texts.append(node_texts)
+            # Reversed, so that the children are created in document order
+            for child in reversed(xml_node.children):
+                pending.append((child, len(nodes) - 1))
+        return nodes, texts, parents
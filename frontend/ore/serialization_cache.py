@@ -0,0 +1,101 @@
+'''
+    A cache for the serialized representations of graphs (JSON, XML, GraphML, TikZ).
+
+    Entries are keyed on the graph primary key and the graph revision, which is incremented
+    in the database with every modification of the graph or its elements. Entries of outdated
+    revisions are therefore never returned again, and are removed by the size-limited
+    eviction of the cache backend ('serialization' in the CACHES setting).
+
+    Hit and miss counters are kept in the database, so that they cover all worker processes.
+'''
+
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+from ore.models.cache_counter import CacheCounter
+
+logger = logging.getLogger('ore')
+
+CACHE_ALIAS = 'serialization'
+HITS_COUNTER = 'serialization:hits'
+MISSES_COUNTER = 'serialization:misses'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def cache_key(graph_pk, revision, output, args):
+    '''
+        The cache key for one serialization output of one graph revision.
+        Positional arguments of the serialization method become part of the key.
+    '''
+    return 'graph:%u:%u:%s:%s' % (graph_pk, revision, output, ':'.join(str(arg) for arg in args))
+
+
+def store(key, text):
+    '''
+        Stores the given serialization result, unless it is larger than the configured maximum item size.
+    '''
+    if len(text) > settings.SERIALIZATION_CACHE_MAX_ITEM_SIZE:
+        logger.debug('Not caching %s, size %u is above the limit' % (key, len(text)))
+        return
+    get_cache().set(key, text, None)
+
+
+def get_or_render(graph, output, args, render):
+    '''
+        Returns the cached serialization result for the current revision of the graph,
+        or calls render(*args) and caches its result.
+    '''
+    key = cache_key(graph.pk, graph.current_revision(), output, args)
+    text = get_cache().get(key)
+    if text is not None:
+        CacheCounter.count(HITS_COUNTER)
+        return text
+    CacheCounter.count(MISSES_COUNTER)
+    text = render(*args)
+    store(key, text)
+    return text
+
+
+def iter_or_render(graph, output, args, render):
+    '''
+        Generator variant of get_or_render(), for serializations that are streamed.
+        The chunks produced by render(*args) are collected for caching only until the
+        maximum item size is reached, so that streaming large graphs stays memory bounded.
+    '''
+    key = cache_key(graph.pk, graph.current_revision(), output, args)
+    text = get_cache().get(key)
+    if text is not None:
+        CacheCounter.count(HITS_COUNTER)
+        yield text
+        return
+    CacheCounter.count(MISSES_COUNTER)
+    chunks, size = [], 0
+    for chunk in render(*args):
+        yield chunk
+        if chunks is not None:
+            size += len(chunk)
+            if size > settings.SERIALIZATION_CACHE_MAX_ITEM_SIZE:
+                chunks = None
+            else:
+                chunks.append(chunk)
+    if chunks is not None:
+        store(key, ''.join(chunks))
+
+
+def stats():
+    '''
+        Returns the hit / miss counters of the cache, as dictionary.
+    '''
+    hits, misses = CacheCounter.values(HITS_COUNTER, MISSES_COUNTER)
+    return {'hits': hits,
+            'misses': misses,
+            'hit_rate': float(hits) / (hits + misses) if hits + misses else None}
+
+
+def reset_stats():
+    CacheCounter.reset(HITS_COUNTER, MISSES_COUNTER)
@@ -5,6 +5,9 @@ import os.path
 class Common(Configuration):
     BACKEND_DAEMON = values.Value(
         'http://back:8000', environ_prefix='ORE')
+    # Several backend daemons, jobs go to the least loaded one. BACKEND_DAEMON is used if empty.
+    BACKEND_DAEMONS = values.ListValue(
+        [], environ_prefix='ORE')
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.postgresql_psycopg2',
@@ -15,6 +18,37 @@ class Common(Configuration):
             'PORT': values.Value('', environ_name='DB_PORT', environ_prefix='ORE'),
         }
     }
+    # Serialized graphs (JSON, XML, GraphML, TikZ), keyed on graph revision
+    # Eviction happens when MAX_ENTRIES is reached, results above the item size limit are not cached
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'serialization': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'ore-serialization',
+            'TIMEOUT': None,
+            'OPTIONS': {
+                'MAX_ENTRIES': values.IntegerValue(1000, environ_name='SERIALIZATION_CACHE_ENTRIES',
+                                                   environ_prefix='ORE'),
+                'CULL_FREQUENCY': 4,
+            }
+        }
+    }
+    SERIALIZATION_CACHE_MAX_ITEM_SIZE = values.IntegerValue(
+        2 * 1024 * 1024, environ_prefix='ORE')
+    # Summed size of the compressed backend results in the result cache, least recently used ones are evicted
+    RESULT_CACHE_SIZE = values.IntegerValue(
+        256 * 1024 * 1024, environ_prefix='ORE')
+    # Maximum size of an uploaded backend result after decompression, larger uploads fail the job
+    BACKEND_RESULT_MAX_SIZE = values.IntegerValue(
+        512 * 1024 * 1024, environ_prefix='ORE')
+    # Maximum seconds a job status request waits for the job to finish, 0 disables waiting
+    JOB_WAIT_TIMEOUT = values.IntegerValue(
+        20, environ_prefix='ORE')
+    # Job status requests per process that may wait at the same time, must be below the WSGI threads per process
+    JOB_WAIT_SLOTS = values.IntegerValue(
+        8, environ_prefix='ORE')
     # Environment variable "SERVER" contains the host name of the server
     ALLOWED_HOSTS = ['localhost', '127.0.0.1', values.Value(
         'xxx', environ_prefix='ORE', environ_name='SERVER')]
@@ -114,6 +148,7 @@ class Common(Configuration):
         'django.contrib.auth.middleware.AuthenticationMiddleware',
         'django.contrib.messages.middleware.MessageMiddleware',
         'ore.middleware.HttpErrorMiddleware',
+        'ore.middleware.GraphModificationMiddleware',
     )
 
     INSTALLED_APPS = (
@@ -16,6 +16,7 @@ define(['factory', 'class', 'config', 'progress_indicator', 'jquery'], function(
          *      {Function}    errorCallback      - Function that is called if the resource was not found.
          *      {Function}    errorCallback      - Function that is called if the job results in an error.
          *      {Number}      queryInterval      - The interval (in ms) between job queries.
+         *      {Number}      waitTime           - Seconds the server may hold a query until the job is finished.
          *      {String}      _url               - The query URL of this job.
          *      {Timeout)     _timeout           - A reference to the current job query timeout.
          */
@@ -24,6 +25,7 @@ define(['factory', 'class', 'config', 'progress_indicator', 'jquery'], function(
         notFoundCallback: jQuery.noop,
         errorCallback:    jQuery.noop,
         queryInterval:    1000,
+        waitTime:         20,
         progressMessage:          Factory.getModule('Config').ProgressIndicator.DEFAULT_PROGRESS_MESSAGE,
         progressSuccessMessage:   Factory.getModule('Config').ProgressIndicator.DEFAULT_SUCCESS_MESSAGE,
         progressErrorMessage:     Factory.getModule('Config').ProgressIndicator.DEFAULT_ERROR_MESSAGE,
@@ -91,11 +93,13 @@ define(['factory', 'class', 'config', 'progress_indicator', 'jquery'], function(
         /**
          * Method: _query
          *      Fetch the Job's status from the backend using AJAX and call the callback corresponding to the result.
-         *      In case the Job is not finished, set a timeout for the next query.
+         *      The server answers as soon as the Job is finished, or when the wait time is over. In case the Job is not
+         *      finished, set a timeout for the next query.
          */
         _query: function() {
             jQuery.ajax({
                 url: this._url,
+                data: {wait: this.waitTime},
                 // we do the progress indication manually so we don't want the global AJAX handlers to trigger here
                 global: false,
                 beforeSend: function() {
@@ -12,6 +12,8 @@ import urlparse
 from django.test import LiveServerTestCase, TestCase
 from django.test.client import Client
 
+from ore import serialization_cache
+
 
 # This disables all the debug output from the server, e.g. Latex rendering nodes etc.
 # import logging
@@ -146,8 +148,16 @@ class OreTestHelpers():
 
 
 class OreLiveServerTestCase(LiveServerTestCase, OreTestHelpers):
-    pass
+
+    def _pre_setup(self):
+        super(OreLiveServerTestCase, self)._pre_setup()
+        # Primary keys and graph revisions start over with every test database state
+        serialization_cache.get_cache().clear()
 
 
 class OreTestCase(TestCase, OreTestHelpers):
-    pass
+
+    def _pre_setup(self):
+        super(OreTestCase, self)._pre_setup()
+        # Primary keys and graph revisions start over with every test database state
+        serialization_cache.get_cache().clear()
@@ -84,7 +84,8 @@ class ExternalAPITestCase(OreLiveServerTestCase):
                     '/api/v1/graph/%u/?format=graphml' %
                     id)
                 self.assertEqual(response.status_code, 200)
-                assert ("<graphml" in response.content)
+                assert ("<graphml" in response.getvalue())
+                self.assertEqual(response["Content-Disposition"], "attachment; filename=graph.xml")
 
     def testGraphmlImport(self):
         for id, kind in fixt_simple['graphs'].iteritems():
@@ -94,7 +95,7 @@ class ExternalAPITestCase(OreLiveServerTestCase):
                 '/api/v1/graph/%u/?format=graphml' %
                 id)
             self.assertEqual(response.status_code, 200)
-            graphml = response.content
+            graphml = response.getvalue()
             # Now import the same GraphML
             response = self.postWithAPIKey('/api/v1/graph/?format=graphml&project=%u' % fixt_simple['pkProject'], graphml,
                                            'application/xml')
@@ -111,7 +112,7 @@ class ExternalAPITestCase(OreLiveServerTestCase):
             '/api/v1/graph/%u/?format=graphml' %
             fixt_simple['pkFaultTree'])
         self.assertEqual(response.status_code, 200)
-        graphml = response.content
+        graphml = response.getvalue()
         # Now send request with wrong project ID
         response = self.postWithAPIKey(
             '/api/v1/graph/?format=graphml&project=99',
@@ -125,7 +126,7 @@ class ExternalAPITestCase(OreLiveServerTestCase):
             '/api/v1/graph/%u/?format=graphml' %
             fixt_simple['pkFaultTree'])
         self.assertEqual(response.status_code, 200)
-        graphml = response.content
+        graphml = response.getvalue()
         # Now send request with wrong project ID
         response = self.postWithAPIKey(
             '/api/v1/graph/?format=graphml',
@@ -4,7 +4,7 @@ import json
 
 from django.contrib.auth.models import User
 
-from ore.models import Notification
+from ore.models import Notification, Node
 from .common import fixt_simple, OreLiveServerTestCase
 
 
@@ -49,7 +49,7 @@ class FrontendApiTestCase(OreLiveServerTestCase):
                         format)
                 response = self.ajaxGet(url)
                 self.assertEqual(response.status_code, 200)
-                self.assertIn(test_str, response.content)
+                self.assertIn(test_str, response.getvalue())
 
     def testGetGraphs(self):
         url = self.baseUrl + '/graphs/'
@@ -230,6 +230,133 @@ class FrontendApiTestCase(OreLiveServerTestCase):
 #        newedge = Edge.objects.get(client_id=newid, deleted=False)
 #        self.assertItemsEqual(initial_properties, newedge.get_properties())
 
+    def getChanges(self, graph_pk, since):
+        response = self.ajaxGet(self.baseUrl + '/graphs/%u/changes/?since=%s' % (graph_pk, since))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def testGraphChanges(self):
+        graph_url = self.baseUrl + '/graphs/%u' % fixt_simple['pkFaultTree']
+        revision = json.loads(self.ajaxGet(graph_url).content)['revision']
+        changes = self.getChanges(fixt_simple['pkFaultTree'], revision)
+        self.assertEqual(changes['revision'], revision)
+        for key in ['nodes', 'edges', 'nodeGroups']:
+            self.assertEqual(changes[key], [])
+            self.assertEqual(changes['deleted'][key], [])
+        # Modified node
+        Node.objects.get(graph=fixt_simple['pkFaultTree'], client_id=fixt_simple['clientIdBasicEvent']).set_attrs(
+            {'name': 'changed'})
+        changes = self.getChanges(fixt_simple['pkFaultTree'], revision)
+        self.assertGreater(changes['revision'], revision)
+        self.assertEqual([node['id'] for node in changes['nodes']], [fixt_simple['clientIdBasicEvent']])
+        self.assertEqual(changes['nodes'][0]['properties']['name']['value'], 'changed')
+        # Deleted edge, the connected nodes get new edge lists
+        revision = changes['revision']
+        self.ajaxDelete(graph_url + '/edges/%u' % fixt_simple['clientIdEdge'])
+        changes = self.getChanges(fixt_simple['pkFaultTree'], revision)
+        self.assertEqual(changes['deleted']['edges'], [fixt_simple['clientIdEdge']])
+        self.assertEqual(len(changes['nodes']), 2)
+        for node in changes['nodes']:
+            self.assertNotIn(fixt_simple['clientIdEdge'], node['incoming'] + node['outgoing'])
+        # Deleted node
+        revision = changes['revision']
+        self.ajaxDelete(graph_url + '/nodes/%u' % fixt_simple['clientIdBasicEvent'])
+        changes = self.getChanges(fixt_simple['pkFaultTree'], revision)
+        self.assertEqual(changes['deleted']['nodes'], [fixt_simple['clientIdBasicEvent']])
+        graph = json.loads(self.ajaxGet(graph_url).content)
+        self.assertNotIn(fixt_simple['clientIdBasicEvent'], [node['id'] for node in graph['nodes']])
+        self.assertEqual(graph['revision'], changes['revision'])
+        # Everything since the beginning
+        changes = self.getChanges(fixt_simple['pkFaultTree'], 0)
+        self.assertEqual(len(changes['nodes']), len(graph['nodes']))
+
+    def testInvalidGraphChanges(self):
+        url = self.baseUrl + '/graphs/%u/changes/' % fixt_simple['pkFaultTree']
+        self.assertEqual(self.ajaxGet(url).status_code, 400)
+        self.assertEqual(self.ajaxGet(url + '?since=foo').status_code, 400)
+        self.assertEqual(self.ajaxGet(url + '?since=999999').status_code, 400)
+        self.assertEqual(self.ajaxGet(self.baseUrl + '/graphs/9999/changes/?since=0').status_code, 404)
+
+    def testBatch(self):
+        graph_url = self.baseUrl + '/graphs/%u' % fixt_simple['pkFaultTree']
+        operations = [
+            {'action': 'create', 'type': 'node',
+             'data': {'client_id': 5001, 'kind': 'basicEvent', 'properties': {'name': 'A', 'x': 3}}},
+            {'action': 'create', 'type': 'node', 'data': {'client_id': 5002, 'kind': 'basicEvent', 'y': 4}},
+            {'action': 'create', 'type': 'edge',
+             'data': {'client_id': 5003, 'source': fixt_simple['clientIdAndGate'], 'target': 5001}},
+            {'action': 'create', 'type': 'nodegroup', 'data': {'client_id': 5004, 'nodeIds': [5001, 5002]}},
+            {'action': 'update', 'type': 'node', 'id': fixt_simple['clientIdBasicEvent'],
+             'data': {'properties': {'name': 'B', 'x': 9}}},
+            {'action': 'delete', 'type': 'edge', 'id': fixt_simple['clientIdEdge']}
+        ]
+        response = self.ajaxPost(graph_url + '/batch', json.dumps({'operations': operations}), 'application/json')
+        self.assertEqual(response.status_code, 200)
+        changes = json.loads(response.content)
+        # The top event and the AND gate lost their connecting edge
+        self.assertItemsEqual([node['id'] for node in changes['nodes']],
+                              [5001, 5002, 0, fixt_simple['clientIdAndGate'], fixt_simple['clientIdBasicEvent']])
+        self.assertEqual([edge['id'] for edge in changes['edges']], [5003])
+        self.assertEqual([group['id'] for group in changes['nodeGroups']], [5004])
+        self.assertItemsEqual(changes['nodeGroups'][0]['nodeIds'], [5001, 5002])
+        self.assertEqual(changes['deleted']['edges'], [fixt_simple['clientIdEdge']])
+        graph = json.loads(self.ajaxGet(graph_url).content)
+        self.assertEqual(graph['revision'], changes['revision'])
+        nodes = {node['id']: node for node in graph['nodes']}
+        self.assertEqual(nodes[5001]['properties']['name']['value'], 'A')
+        self.assertEqual((nodes[5001]['x'], nodes[5002]['y']), (3, 4))
+        self.assertEqual(nodes[5001]['incoming'], [5003])
+        self.assertEqual(nodes[fixt_simple['clientIdBasicEvent']]['properties']['name']['value'], 'B')
+        self.assertEqual(nodes[fixt_simple['clientIdBasicEvent']]['x'], 9)
+        # Deleting a node removes its edges and group memberships
+        operations = [{'action': 'delete', 'type': 'node', 'id': 5001}]
+        response = self.ajaxPost(graph_url + '/batch', json.dumps({'operations': operations}), 'application/json')
+        changes = json.loads(response.content)
+        self.assertEqual(changes['deleted']['nodes'], [5001])
+        self.assertEqual(changes['deleted']['edges'], [5003])
+        self.assertEqual(changes['nodeGroups'][0]['nodeIds'], [5002])
+
+    def testInvalidBatch(self):
+        graph_url = self.baseUrl + '/graphs/%u' % fixt_simple['pkFaultTree']
+        revision = json.loads(self.ajaxGet(graph_url).content)['revision']
+        for operations in [
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent'}},
+             {'action': 'update', 'type': 'node', 'id': 6001, 'data': {'properties': {'nonsense': 1}}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'nonsense'}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent', 'x': 'left'}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent', 'y': 2 ** 40}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 'new', 'kind': 'basicEvent'}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent'}},
+             {'action': 'update', 'type': 'node', 'id': fixt_simple['clientIdBasicEvent'],
+              'data': {'properties': {'kind': 'nonsense'}}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent'}},
+             {'action': 'update', 'type': 'node', 'id': fixt_simple['clientIdBasicEvent'],
+              'data': {'properties': {'kind': 'intermediateEvent', 'probability': [0, 0.5]}}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent'}},
+             {'action': 'update', 'type': 'node', 'id': fixt_simple['clientIdBasicEvent'],
+              'data': {'properties': {'x': [1]}}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent'}},
+             {'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent'}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent'}},
+             {'action': 'create', 'type': 'node',
+              'data': {'client_id': fixt_simple['clientIdBasicEvent'], 'kind': 'basicEvent'}}],
+            [{'action': 'create', 'type': 'node', 'data': {'client_id': 6001, 'kind': 'basicEvent'}},
+             {'action': 'update', 'type': 'node', 'id': fixt_simple['clientIdBasicEvent'],
+              'data': {'properties': {'client_id': 6001}}}],
+            [{'action': 'create', 'type': 'edge', 'data': {'client_id': 6001, 'source': 6002, 'target': 6003}}],
+            [{'action': 'delete', 'type': 'node', 'id': 6004}],
+            [{'action': 'rename', 'type': 'node', 'id': fixt_simple['clientIdBasicEvent']}],
+            'nonsense'
+        ]:
+            response = self.ajaxPost(graph_url + '/batch', json.dumps({'operations': operations}),
+                                     'application/json')
+            self.assertEqual(response.status_code, 400)
+        response = self.ajaxPost(graph_url + '/batch', 'nonsense', 'application/json')
+        self.assertEqual(response.status_code, 400)
+        graph = json.loads(self.ajaxGet(graph_url).content)
+        self.assertEqual(graph['revision'], revision)
+        self.assertNotIn(6001, [node['id'] for node in graph['nodes']])
+
     def testNotificationDismiss(self):
         # Create notification entry in the database
         u = User.objects.get(username='testadmin')
@@ -1,9 +1,23 @@
 import unittest
 import sys
 import json
+import zlib
+import gzip
+import tarfile
+from cStringIO import StringIO
+import socket
+import threading
+import time
+from SimpleXMLRPCServer import SimpleXMLRPCServer
 
-from ore.models import Graph, Job, Result
-from .common import fixt_analysis, fixt_mincut, OreLiveServerTestCase
+from django.db.models.signals import post_save
+from django.test.utils import override_settings
+
+from ore.models import Graph, Job, Node, Result, Configuration, NodeConfiguration, CachedResult, xml_backend
+from ore.models.job import job_post_save
+from ore import job_completion, backend_cluster
+from ore.models.result_reader import iter_backend_result
+from .common import fixt_analysis, fixt_mincut, fixt_simple, OreLiveServerTestCase, OreTestCase
 
 
 class BackendDaemonTestCase(OreLiveServerTestCase):
@@ -55,6 +69,94 @@ class InternalTestCase(BackendDaemonTestCase):
                 print result
 
 
+class ResultReaderTestCase(OreTestCase):
+
+    """
+        The incremental result XML reader must deliver the same information as the PyXB bindings.
+    """
+    fixtures = fixt_analysis['files']
+
+    def createJob(self, graph):
+        # The job is not meant to reach a backend daemon here
+        post_save.disconnect(job_post_save, sender=Job)
+        try:
+            job = Job(graph_modified=graph.modified, graph=graph, kind=Job.TOP_EVENT_JOB)
+            job.save()
+        finally:
+            post_save.connect(job_post_save, sender=Job)
+        return job
+
+    def testSameAsPyXB(self):
+        for graphResult in fixt_analysis['results'].itervalues():
+            data = open('ore/fixtures/' + graphResult).read()
+            doc = xml_backend.CreateFromDocument(data)
+            items = list(iter_backend_result(data))
+            configurations = [item for element, item in items if element == 'configuration']
+            results = [item for element, item in items if element == 'result']
+            issues = [item for element, item in items if element == 'issue']
+            self.assertEqual(len(configurations), len(doc.configuration))
+            self.assertEqual(len(results), len(doc.result))
+            self.assertEqual(len(issues), len(doc.issue))
+            for ours, theirs in zip(configurations, doc.configuration):
+                self.assertEqual((ours.id, ours.costs), (theirs.id, theirs.costs))
+                for our_choice, their_choice in zip(ours.choice, theirs.choice):
+                    self.assertEqual(our_choice.key, their_choice.key)
+                    self.assertEqual(our_choice.value_.kind, type(their_choice.value_).__name__)
+            for ours, theirs in zip(results, doc.result):
+                self.assertEqual(ours.kind, type(theirs).__name__)
+                self.assertEqual((ours.modelId, ours.configId, ours.timestamp),
+                                 (theirs.modelId, theirs.configId, theirs.timestamp))
+                self.assertEqual([(cut.key, cut.value_.lowerBound, cut.value_.upperBound)
+                                  for cut in ours.probability.alphaCuts],
+                                 [(cut.key, cut.value_.lowerBound, cut.value_.upperBound)
+                                  for cut in theirs.probability.alphaCuts])
+                self.assertEqual([(issue.issueId, issue.elementId, issue.message, issue.isFatal)
+                                  for issue in ours.issue],
+                                 [(issue.issueId, issue.elementId, issue.message, issue.isFatal)
+                                  for issue in theirs.issue])
+
+    def testBulkConfigurationIngestion(self):
+        for graphPk, graphResult in fixt_analysis['results'].iteritems():
+            graph = Graph.objects.get(pk=graphPk)
+            data = open('ore/fixtures/' + graphResult).read()
+            configurations = [item for element, item in iter_backend_result(data) if element == 'configuration']
+            job = self.createJob(graph)
+            job.parse_result(data)
+            self.assertEqual(Configuration.objects.filter(graph=graph).count(), len(configurations))
+            self.assertEqual(NodeConfiguration.objects.filter(configuration__graph=graph).count(),
+                             sum(len(configuration.choice) for configuration in configurations))
+            for result in job.results.exclude(kind=Result.GRAPH_ISSUES):
+                if result.configuration:
+                    self.assertEqual(result.configuration.graph, graph)
+
+    def testUnknownConfigurationNode(self):
+        graphPk, graphResult = [item for item in fixt_analysis['results'].items() if 'prdc' in item[1]][0]
+        graph = Graph.objects.get(pk=graphPk)
+        data = open('ore/fixtures/' + graphResult).read()
+        data = data.replace('<choice key="', '<choice key="999999', 1)
+        job = self.createJob(graph)
+        self.assertRaises(Node.DoesNotExist, job.parse_result, data)
+        self.assertEqual(Configuration.objects.filter(graph=graph).count(), 0)
+
+    def testReplaceOnlyContainedSections(self):
+        graphPk, graphResult = [item for item in fixt_analysis['results'].items() if 'prdc' in item[1]][0]
+        graph = Graph.objects.get(pk=graphPk)
+        data = open('ore/fixtures/' + graphResult).read()
+        self.createJob(graph).parse_result(data)
+        configurations = Configuration.objects.filter(graph=graph).count()
+        results = Result.objects.filter(graph=graph, kind=Result.ANALYSIS_RESULT).count()
+        self.assertGreater(configurations, 0)
+        self.assertGreater(results, 0)
+        # Without configurations and results, the former ones are kept
+        self.createJob(graph).parse_result(
+            '<p1:backendResults xmlns:p1="http://www.fuzzed.org/backendResults"></p1:backendResults>')
+        self.assertEqual(Configuration.objects.filter(graph=graph).count(), configurations)
+        self.assertEqual(Result.objects.filter(graph=graph, kind=Result.ANALYSIS_RESULT).count(), results)
+        self.createJob(graph).parse_result(data)
+        self.assertEqual(Configuration.objects.filter(graph=graph).count(), configurations)
+        self.assertEqual(Result.objects.filter(graph=graph, kind=Result.ANALYSIS_RESULT).count(), results)
+
+
 class AnalysisFixtureTestCase(BackendDaemonTestCase):
 
     """
@@ -186,3 +288,309 @@ class MinCutFixtureTestCase(BackendDaemonTestCase):
         assert('mincutResults' in data['aaData'][0])
         mincut_results = data['aaData'][0]['mincutResults']
         self.assertEqual(len(mincut_results), fixt_mincut['mincut_numcuts'])
+
+
+class DispatchTestCase(OreTestCase):
+
+    """
+        Job dispatching to a fake backend daemon. The job input is sent along with the job,
+        and a daemon with a full job queue rejects new jobs, which must reach the client as 503.
+    """
+    fixtures = fixt_simple['files']
+
+    def setUp(self):
+        self.setUpLogin()
+        self.accept = True
+        self.received = []
+        self.daemon = SimpleXMLRPCServer(('127.0.0.1', 0), logRequests=False)
+        self.daemon.register_function(self.startJob, 'start_job')
+        threading.Thread(target=self.daemon.serve_forever).start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.daemon.server_close()
+
+    def startJob(self, *args):
+        self.received.append(args)
+        return self.accept
+
+    def postJob(self):
+        with override_settings(BACKEND_DAEMON='http://127.0.0.1:%u' % self.daemon.server_address[1]):
+            return self.ajaxPost('/api/front/graphs/%u/jobs/' % fixt_simple['pkFaultTree'],
+                                 json.dumps({'kind': Job.TOP_EVENT_JOB}), 'application/json')
+
+    def testInlineInput(self):
+        response = self.postJob()
+        self.assertEqual(response.status_code, 201)
+        jobtype, joburl, input_data = self.received[0]
+        self.assertEqual(jobtype, Job.TOP_EVENT_JOB)
+        job = Job.objects.get(secret=joburl.rsplit('/', 1)[1])
+        self.assertEqual(zlib.decompress(input_data.data), job.graph.to_xml().encode('utf-8'))
+        self.assertEqual(job.input_hash, CachedResult.input_hash(job.kind, zlib.decompress(input_data.data)))
+
+    def testFrozenInput(self):
+        self.postJob()
+        jobtype, joburl, input_data = self.received[0]
+        graph = Graph.objects.get(pk=fixt_simple['pkFaultTree'])
+        original = graph.to_xml()
+        Node.objects.get(graph=graph, client_id=fixt_simple['clientIdBasicEvent']).set_attrs({'name': 'changed'})
+        self.assertNotEqual(graph.to_xml(), original)
+        # The backend gets the graph as it was on submission
+        response = self.c.get('/api/back/jobs/' + joburl.rsplit('/', 1)[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, original.encode('utf-8'))
+
+    def testRejectedJob(self):
+        self.accept = False
+        response = self.postJob()
+        self.assertEqual(response.status_code, 503)
+
+
+class ResultUploadTestCase(OreTestCase):
+
+    """
+        Result uploads of the backend daemon, as gzip-compressed binary body.
+    """
+    fixtures = fixt_analysis['files']
+
+    def setUp(self):
+        self.setUpAnonymous()
+        self.graph = Graph.objects.get(pk=fixt_analysis['rate_faulttree'])
+        self.data = open('ore/fixtures/' + fixt_analysis['results'][self.graph.pk]).read()
+
+    def createJob(self, kind):
+        post_save.disconnect(job_post_save, sender=Job)
+        try:
+            return Job.objects.create(graph_modified=self.graph.modified, graph=self.graph, kind=kind)
+        finally:
+            post_save.connect(job_post_save, sender=Job)
+
+    def gzip(self, data):
+        buf = StringIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as compressed:
+            compressed.write(data)
+        return buf.getvalue()
+
+    def upload(self, job, body, content_type, **headers):
+        return self.c.patch('/api/back/jobs/' + job.secret, body, content_type,
+                            HTTP_CONTENT_ENCODING='gzip', HTTP_X_EXIT_CODE='0', **headers)
+
+    def testSingleFile(self):
+        job = self.createJob(Job.TOP_EVENT_JOB)
+        response = self.upload(job, self.gzip(self.data), 'application/octet-stream',
+                               HTTP_X_FILE_NAME='result.xml', HTTP_X_RUNTIME='1.5', HTTP_X_PEAK_MEMORY='2048')
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual((job.exit_code, job.runtime, job.peak_memory), (0, 1.5, 2048))
+        results = [item for element, item in iter_backend_result(self.data) if element == 'result']
+        self.assertEqual(job.results.exclude(kind=Result.GRAPH_ISSUES).count(), len(results))
+
+    def testSeveralFiles(self):
+        job = self.createJob(Job.EPS_RENDERING_JOB)
+        buf = StringIO()
+        with tarfile.open(fileobj=buf, mode='w') as archive:
+            for name, data in (('page1.eps', 'first'), ('page2.eps', 'second')):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, StringIO(data))
+        response = self.upload(job, self.gzip(buf.getvalue()), 'application/x-tar')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(sorted(str(result.binary_value) for result in job.results.all()), ['first', 'second'])
+
+    def testTooLarge(self):
+        job = self.createJob(Job.TOP_EVENT_JOB)
+        with override_settings(BACKEND_RESULT_MAX_SIZE=len(self.data) - 1):
+            response = self.upload(job, self.gzip(self.data), 'application/octet-stream',
+                                   HTTP_X_FILE_NAME='result.xml')
+        self.assertEqual(response.status_code, 413)
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.exit_code, -444)
+        self.assertFalse(job.results.exists())
+
+    def testFailure(self):
+        job = self.createJob(Job.TOP_EVENT_JOB)
+        response = self.c.patch('/api/back/jobs/' + job.secret, '', 'application/octet-stream',
+                                HTTP_X_EXIT_CODE='-2')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Job.objects.get(pk=job.pk).exit_code, -2)
+        self.assertEqual(self.c.patch('/api/back/jobs/' + self.createJob(Job.TOP_EVENT_JOB).secret, '',
+                                      'application/octet-stream').status_code, 400)
+
+
+class JobWaitTestCase(OreTestCase):
+
+    """
+        Job status requests that wait for the job to finish, instead of being repeated by the client.
+    """
+    fixtures = fixt_simple['files']
+
+    def setUp(self):
+        self.setUpLogin()
+        graph = Graph.objects.get(pk=fixt_simple['pkFaultTree'])
+        post_save.disconnect(job_post_save, sender=Job)
+        try:
+            self.job = Job.objects.create(graph_modified=graph.modified, graph=graph, kind=Job.TOP_EVENT_JOB)
+        finally:
+            post_save.connect(job_post_save, sender=Job)
+        self.url = '/api/front/graphs/%u/jobs/%s' % (graph.pk, self.job.secret)
+
+    def finishLater(self, notify):
+        finished = threading.Event()
+
+        def finish():
+            time.sleep(0.1)
+            finished.set()
+            if notify:
+                job_completion.notify()
+        threading.Thread(target=finish).start()
+        return finished
+
+    def testPendingTimeout(self):
+        start = time.time()
+        response = self.ajaxGet(self.url + '?wait=0.2')
+        self.assertEqual(response.status_code, 202)
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertEqual(self.ajaxGet(self.url + '?wait=soon').status_code, 400)
+
+    def testFinishedInOtherProcess(self):
+        # Without notification, the job state is only seen by checking again
+        finished = self.finishLater(notify=False)
+        start = time.time()
+        self.assertTrue(job_completion.wait(finished.is_set, 30))
+        self.assertLess(time.time() - start, 0.1 + 4 * job_completion.CHECK_INTERVAL)
+
+    def testFinishedJobNotifies(self):
+        # Only the notification can end the wait early
+        interval, job_completion.CHECK_INTERVAL = job_completion.CHECK_INTERVAL, 60
+        try:
+            finished = self.finishLater(notify=True)
+            start = time.time()
+            self.assertTrue(job_completion.wait(finished.is_set, 30))
+            self.assertLess(time.time() - start, 10)
+        finally:
+            job_completion.CHECK_INTERVAL = interval
+        seen = job_completion._generation
+        self.job.exit_code = 0
+        self.job.save()
+        self.assertGreater(job_completion._generation, seen)
+        start = time.time()
+        self.assertEqual(self.ajaxGet(self.url + '?wait=10').status_code, 200)
+        self.assertLess(time.time() - start, 5)
+
+    def testNoFreeSlot(self):
+        start = time.time()
+        with override_settings(JOB_WAIT_SLOTS=0):
+            self.assertEqual(self.ajaxGet(self.url + '?wait=10').status_code, 202)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(job_completion._waiting, 0)
+
+
+class FakeDaemon(object):
+
+    """
+        A backend daemon stand-in with a fixed load report, which records the jobs it gets.
+    """
+
+    def __init__(self, load, capacity=4, accept=True, port=0):
+        self.report = {Job.TOP_EVENT_JOB: {'load': load, 'capacity': capacity}}
+        self.accept = accept
+        self.jobs = []
+        self.server = SimpleXMLRPCServer(('127.0.0.1', port), logRequests=False)
+        self.server.register_function(self.startJob, 'start_job')
+        self.server.register_function(lambda: self.report, 'load')
+        self.url = 'http://127.0.0.1:%u' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def startJob(self, jobtype, joburl, input_data):
+        self.jobs.append(joburl)
+        return self.accept
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ClusterTestCase(OreTestCase):
+
+    """
+        Dispatching of jobs to several backend daemons.
+    """
+    fixtures = fixt_simple['files']
+
+    def setUp(self):
+        self.setUpLogin()
+        backend_cluster._daemons.clear()
+        self.busy = FakeDaemon(load=3)
+        self.idle = FakeDaemon(load=1)
+        # A port nobody listens on
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.unreachable = 'http://127.0.0.1:%u' % sock.getsockname()[1]
+        sock.close()
+
+    def tearDown(self):
+        self.busy.stop()
+        self.idle.stop()
+
+    def postJob(self, *urls):
+        with override_settings(BACKEND_DAEMONS=list(urls)):
+            return self.ajaxPost('/api/front/graphs/%u/jobs/' % fixt_simple['pkFaultTree'],
+                                 json.dumps({'kind': Job.TOP_EVENT_JOB}), 'application/json')
+
+    def testLeastLoaded(self):
+        self.assertEqual(self.postJob(self.unreachable, self.busy.url, self.idle.url).status_code, 201)
+        self.assertEqual((len(self.busy.jobs), len(self.idle.jobs)), (0, 1))
+        self.assertFalse(backend_cluster._daemons[self.unreachable].healthy)
+        # Dispatched jobs count until the next health check, 3/4 on both daemons now
+        self.postJob(self.unreachable, self.busy.url, self.idle.url)
+        self.postJob(self.unreachable, self.busy.url, self.idle.url)
+        self.assertEqual((len(self.busy.jobs), len(self.idle.jobs)), (1, 2))
+
+    def testFailover(self):
+        self.idle.accept = False
+        self.assertEqual(self.postJob(self.idle.url, self.busy.url).status_code, 201)
+        self.assertEqual((len(self.busy.jobs), len(self.idle.jobs)), (1, 1))
+        self.idle.stop()
+        self.idle = FakeDaemon(load=0)
+        self.assertEqual(self.postJob(self.unreachable, self.idle.url).status_code, 201)
+        self.assertEqual(len(self.idle.jobs), 1)
+
+    def testHangingDaemon(self):
+        # Accepts connections, but never answers
+        hanging = socket.socket()
+        hanging.bind(('127.0.0.1', 0))
+        hanging.listen(5)
+        url = 'http://127.0.0.1:%u' % hanging.getsockname()[1]
+        try:
+            start = time.time()
+            self.assertEqual(self.postJob(url, self.idle.url).status_code, 201)
+            # Outdated health checks run in the background
+            with backend_cluster._lock:
+                for daemon in backend_cluster._daemons.itervalues():
+                    daemon.checked -= 60
+            self.assertEqual(self.postJob(url, self.idle.url).status_code, 201)
+            self.assertLess(time.time() - start, backend_cluster.RPC_TIMEOUT / 2)
+            self.assertEqual(len(self.idle.jobs), 2)
+        finally:
+            hanging.close()
+
+    def testSingleDaemonRecovers(self):
+        url = self.idle.url
+        self.assertEqual(self.postJob(url).status_code, 201)
+        # Restarted daemon
+        self.idle.stop()
+        self.assertEqual(self.postJob(url).status_code, 500)
+        self.assertFalse(backend_cluster._daemons[url].healthy)
+        self.idle = FakeDaemon(load=0, port=self.idle.server.server_address[1])
+        # Tried as last resort, without waiting for the next health check
+        self.assertEqual(self.postJob(url).status_code, 201)
+        self.assertEqual(len(self.idle.jobs), 1)
+        self.assertTrue(backend_cluster._daemons[url].healthy)
+
+    def testAllBusyOrDown(self):
+        self.busy.accept = self.idle.accept = False
+        jobs = Job.objects.count()
+        self.assertEqual(self.postJob(self.unreachable, self.busy.url, self.idle.url).status_code, 503)
+        self.assertEqual(self.postJob(self.unreachable).status_code, 500)
+        # Rejected jobs do not remain as pending ones
+        self.assertEqual(Job.objects.count(), jobs)
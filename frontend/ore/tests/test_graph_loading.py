@@ -0,0 +1,306 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ore.models import Graph, Project, Node, Edge, NodeGroup
+from .common import fixt_simple, OreTestCase
+
+
+class GraphLoadingTestCase(OreTestCase):
+
+    """
+        Query count benchmark for the graph serialization, based on generated fault trees of growing size.
+    """
+    fixtures = fixt_simple['files']
+
+    sizes = (10, 100, 500)
+
+    def build_faulttree(self, size):
+        ''' Creates a fault tree with an OR gate, 'size' named basic events below it and a node group.'''
+        graph = Graph(kind='faulttree',
+                      name='Generated tree with %u events' % size,
+                      owner=User.objects.get(username='testadmin'),
+                      project=Project.objects.get(pk=fixt_simple['pkProject']))
+        graph.save()
+        top = Node(graph=graph, kind='topEvent', client_id=0)
+        top.save()
+        gate = Node(graph=graph, kind='orGate', client_id=1)
+        gate.save()
+        Edge(graph=graph, source=top, target=gate, client_id=2).save()
+        group = NodeGroup(graph=graph, client_id=3)
+        group.save()
+        for index in xrange(size):
+            event = Node(graph=graph, kind='basicEvent', client_id=10 + 2 * index, x=index)
+            event.save()
+            event.set_attrs({'name': 'Event %u' % index, 'probability': [0, 0.5]})
+            Edge(graph=graph, source=gate, target=event, client_id=11 + 2 * index).save()
+            if index % 10 == 0:
+                group.nodes.add(event)
+        return graph
+
+    def build_deep_faulttree(self, depth):
+        ''' Creates a fault tree that is a single chain of 'depth' intermediate events, ending in a basic event.'''
+        graph = Graph(kind='faulttree',
+                      name='Generated chain of depth %u' % depth,
+                      owner=User.objects.get(username='testadmin'),
+                      project=Project.objects.get(pk=fixt_simple['pkProject']))
+        graph.save()
+        parent = Node(graph=graph, kind='topEvent', client_id=0)
+        parent.save()
+        for index in xrange(depth):
+            kind = 'basicEvent' if index == depth - 1 else 'intermediateEvent'
+            node = Node(graph=graph, kind=kind, client_id=1 + 2 * index)
+            node.save()
+            Edge(graph=graph, source=parent, target=node, client_id=2 + 2 * index).save()
+            parent = node
+        parent.set_attrs({'probability': [0, 0.5]})
+        return graph
+
+    def build_fdep_faulttree(self, triggered):
+        ''' Creates a fault tree with 'triggered' basic events below an OR gate, which all lead to one FDEP gate.
+            The FDEP gate is the only node with several parents, its trigger event is below it.'''
+        graph = Graph(kind='faulttree',
+                      name='Generated FDEP with %u events' % triggered,
+                      owner=User.objects.get(username='testadmin'),
+                      project=Project.objects.get(pk=fixt_simple['pkProject']))
+        graph.save()
+        client_ids = iter(xrange(1000000))
+        top = Node(graph=graph, kind='topEvent', client_id=next(client_ids))
+        top.save()
+        gate = Node(graph=graph, kind='orGate', client_id=next(client_ids))
+        gate.save()
+        Edge(graph=graph, source=top, target=gate, client_id=next(client_ids)).save()
+        fdep = Node(graph=graph, kind='fdepGate', client_id=next(client_ids))
+        fdep.save()
+        trigger = Node(graph=graph, kind='basicEvent', client_id=next(client_ids))
+        trigger.save()
+        trigger.set_attrs({'probability': [0, 0.5]})
+        Edge(graph=graph, source=fdep, target=trigger, client_id=next(client_ids)).save()
+        for index in xrange(triggered):
+            event = Node(graph=graph, kind='basicEvent', client_id=next(client_ids), x=index)
+            event.save()
+            event.set_attrs({'probability': [0, 0.5]})
+            Edge(graph=graph, source=gate, target=event, client_id=next(client_ids)).save()
+            Edge(graph=graph, source=event, target=fdep, client_id=next(client_ids)).save()
+        return graph
+
+    def legacy_dict(self, graph):
+        ''' The graph dictionary as assembled from the per-object serializers.'''
+        return {
+            'nodes': [node.to_dict(True) for node in graph.nodes.filter(deleted=False).order_by('pk')],
+            'edges': [edge.to_dict(True) for edge in graph.edges.filter(deleted=False).order_by('pk')],
+            'nodeGroups': [group.to_dict(True) for group in graph.groups.filter(deleted=False).order_by('pk')]
+        }
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return len(context.captured_queries)
+
+    def testSameResultAsLegacy(self):
+        graph = self.build_faulttree(20)
+        result = graph.to_dict(use_value_dict=True)
+        legacy = self.legacy_dict(graph)
+        for key in ['nodes', 'edges', 'nodeGroups']:
+            self.assertEqual(result[key], legacy[key])
+        self.assertEqual(result['seed'], 11 + 2 * 19)
+
+    def testRevisionOfStaleInstance(self):
+        graph = self.build_faulttree(5)
+        stale = Graph.objects.get(pk=graph.pk)
+        graph.top_node().set_attrs({'name': 'changed'})
+        result = stale.to_dict()
+        self.assertEqual(result['revision'], graph.current_revision())
+        self.assertIn('changed', [node['properties'].get('name') for node in result['nodes']])
+
+    def testConstantQueryCount(self):
+        counts = []
+        for size in self.sizes:
+            graph = self.build_faulttree(size)
+            preloaded = self.count_queries(lambda: graph.to_json(use_value_dict=True))
+            legacy = self.count_queries(lambda: self.legacy_dict(graph))
+            print "\n%5u events: %5u queries for to_json(), %5u queries for per-object serialization" % (
+                size, preloaded, legacy)
+            counts.append(preloaded)
+        self.assertEqual(len(set(counts)), 1)
+
+    def testConstantXmlQueryCount(self):
+        counts = []
+        for size in self.sizes:
+            graph = self.build_faulttree(size)
+            counts.append(self.count_queries(graph.to_xml))
+            self.assertEqual(graph.to_xml().count(':BasicEvent"'), size)
+        self.assertEqual(len(set(counts)), 1)
+
+    def testDeepXml(self):
+        depth = 1500
+        graph = self.build_deep_faulttree(depth)
+        limit = sys.getrecursionlimit()
+        xml = graph.to_xml()
+        self.assertEqual(xml.count('<children '), depth)
+        self.assertEqual(sys.getrecursionlimit(), limit)
+
+    def testStreamedGraphml(self):
+        counts = []
+        for size in self.sizes:
+            graph = self.build_faulttree(size)
+            chunks = []
+            counts.append(self.count_queries(lambda: chunks.extend(graph.iter_graphml())))
+            graphml = ''.join(chunks)
+            for node in graph.nodes.filter(deleted=False):
+                self.assertIn(node.to_graphml(), graphml)
+            self.assertEqual(graphml.count('<edge '), size + 1)
+        self.assertEqual(len(set(counts)), 1)
+
+    def testSharedFdepEmittedOnce(self):
+        triggered = 12
+        graph = self.build_fdep_faulttree(triggered)
+        node_count = graph.nodes.count()
+        edge_count = graph.edges.count()
+        xml = graph.to_xml()
+        self.assertEqual(xml.count('<children '), node_count - 1)
+        self.assertEqual(xml.count(':FDEP"'), 1)
+        tikz = graph.to_tikz()
+        self.assertEqual(tikz.count('[shape='), node_count)
+        self.assertEqual(tikz.count('[fork edge'), edge_count)
+
+    def testSeveralParentsRejected(self):
+        graph = self.build_fdep_faulttree(2)
+        # The trigger event becomes a child of the OR gate, too
+        trigger = graph.edges.get(source__kind='fdepGate').target
+        Edge(graph=graph, source=graph.nodes.get(kind='orGate'), target=trigger, client_id=1000).save()
+        self.assertRaises(ValueError, graph.to_xml)
+
+    def build_batch_faulttree(self, size):
+        ''' Same tree as build_faulttree(), created with one batch, which is much faster for large sizes.'''
+        graph = Graph(kind='faulttree',
+                      name='Generated tree with %u events' % size,
+                      owner=User.objects.get(username='testadmin'),
+                      project=Project.objects.get(pk=fixt_simple['pkProject']))
+        graph.save()
+        operations = [{'action': 'create', 'type': 'node', 'data': {'client_id': 0, 'kind': 'topEvent'}},
+                      {'action': 'create', 'type': 'node', 'data': {'client_id': 1, 'kind': 'orGate'}},
+                      {'action': 'create', 'type': 'edge', 'data': {'client_id': 2, 'source': 0, 'target': 1}},
+                      {'action': 'create', 'type': 'nodegroup',
+                       'data': {'client_id': 3, 'nodeIds': range(10, 10 + 2 * size, 20)}}]
+        for index in xrange(size):
+            operations.append({'action': 'create', 'type': 'node', 'data': {
+                'client_id': 10 + 2 * index, 'kind': 'basicEvent', 'x': index,
+                'properties': {'name': 'Event %u' % index, 'probability': [0, 0.5]}}})
+            operations.append({'action': 'create', 'type': 'edge', 'data': {
+                'client_id': 11 + 2 * index, 'source': 1, 'target': 10 + 2 * index}})
+        graph.apply_batch(operations)
+        return graph
+
+    def copy_graph(self, graph):
+        copy = Graph(kind=graph.kind, name=graph.name + ' (copy)', owner=graph.owner, project=graph.project)
+        copy.save()
+        start = time.time()
+        queries = self.count_queries(lambda: copy.copy_values(graph))
+        return copy, queries, time.time() - start
+
+    def testCopy(self):
+        graph = self.build_faulttree(20)
+        copy, queries, duration = self.copy_graph(graph)
+        self.assertTrue(copy.same_as(graph))
+        result = copy.to_dict(use_value_dict=True)
+        original = graph.to_dict(use_value_dict=True)
+        for edge in result['edges'] + original['edges']:
+            del edge['graph']
+        for key in ['nodes', 'edges', 'nodeGroups']:
+            self.assertEqual(result[key], original[key])
+        self.assertGreater(copy.current_revision(), 0)
+        self.assertEqual(len(copy.changes_since(0)['nodes']), len(original['nodes']))
+
+    def testCopyQueryCount(self):
+        counts = []
+        for size in self.sizes + (10000,):
+            graph = self.build_batch_faulttree(size)
+            copy, queries, duration = self.copy_graph(graph)
+            print "\n%5u events: %5u queries, %.2fs for copy_values()" % (size, queries, duration)
+            self.assertEqual(copy.nodes.count(), size + 2)
+            counts.append(queries)
+        if connection.vendor == 'postgresql':
+            self.assertEqual(len(set(counts)), 1)
+        else:
+            # SQLite splits large inserts into batches, because of its limit on query parameters
+            self.assertLess(counts[-1], 10000 / 20)
+
+    def import_graphml(self, graphml):
+        graph = Graph(owner=User.objects.get(username='testadmin'),
+                      project=Project.objects.get(pk=fixt_simple['pkProject']))
+        graph.save()
+        start = time.time()
+        queries = self.count_queries(lambda: graph.from_graphml(graphml))
+        return graph, queries, time.time() - start
+
+    def testGraphmlImport(self):
+        graph = self.build_faulttree(20)
+        graph.top_node().set_attrs({'missionTime': 1000})
+        imported, queries, duration = self.import_graphml(graph.to_graphml())
+        self.assertEqual(imported.kind, 'faulttree')
+        self.assertTrue(imported.same_as(graph))
+        self.assertEqual(imported.to_graphml(), graph.to_graphml())
+        self.assertEqual(imported.top_node().get_property('missionTime'), graph.top_node().get_property('missionTime'))
+        self.assertEqual(len(set(imported.edges.values_list('client_id', flat=True))), imported.edges.count())
+
+    def testInvalidGraphmlImport(self):
+        graphml = self.build_faulttree(2).to_graphml().replace('<data key="x">', '<data key="nonsense">', 1)
+        node_count = Node.objects.count()
+        with self.assertRaises(Exception):
+            self.import_graphml(graphml)
+        self.assertEqual(Node.objects.count(), node_count)
+
+    def testGraphmlImportQueryCount(self):
+        counts = []
+        for size in self.sizes + (10000,):
+            graphml = self.build_batch_faulttree(size).to_graphml()
+            imported, queries, duration = self.import_graphml(graphml)
+            print "\n%5u events: %5u queries, %.2fs for from_graphml()" % (size, queries, duration)
+            self.assertEqual(imported.nodes.count(), size + 2)
+            self.assertEqual(imported.edges.count(), size + 1)
+            counts.append(queries)
+        # One batch of inserts per 500 nodes
+        self.assertLess(counts[-1], 10000 / 20)
+
+    def import_xml(self, xml):
+        graph = Graph(kind='faulttree', owner=User.objects.get(username='testadmin'),
+                      project=Project.objects.get(pk=fixt_simple['pkProject']))
+        graph.save()
+        start = time.time()
+        queries = self.count_queries(lambda: graph.from_xml(xml))
+        return graph, queries, time.time() - start
+
+    def testXmlImport(self):
+        graph = self.build_faulttree(20)
+        imported, queries, duration = self.import_xml(graph.to_xml())
+        self.assertEqual(imported.name, graph.name)
+        self.assertEqual(imported.nodes.count(), graph.nodes.count())
+        self.assertEqual(imported.edges.count(), graph.edges.count())
+        self.assertEqual(len(set(imported.edges.values_list('client_id', flat=True))), imported.edges.count())
+        names = sorted(node.get_property('name') for node in imported.nodes.filter(kind='basicEvent'))
+        # Grouped nodes are exported with the properties of their group
+        preloaded = graph.preload()
+        self.assertEqual(names, sorted(preloaded.node_property(node, 'name') for node in preloaded.nodes
+                                       if node['kind'] == 'basicEvent'))
+        top = imported.top_node()
+        self.assertEqual(top.outgoing.get().target.outgoing.count(), 20)
+        # The imported tree can be exported again
+        self.assertEqual(imported.to_xml().count(':BasicEvent"'), 20)
+
+    def testXmlImportQueryCount(self):
+        counts = []
+        for size in self.sizes + (5000,):
+            xml = self.build_batch_faulttree(size).to_xml()
+            imported, queries, duration = self.import_xml(xml)
+            print "\n%5u events: %5u queries, %.2fs for from_xml()" % (size, queries, duration)
+            self.assertEqual(imported.nodes.count(), size + 2)
+            self.assertEqual(imported.edges.count(), size + 1)
+            counts.append(queries)
+        if connection.vendor == 'postgresql':
+            self.assertEqual(len(set(counts)), 1)
+        else:
+            self.assertLess(counts[-1], 5000 / 20)
@@ -0,0 +1,124 @@
+from django.core.signals import request_finished
+from django.db import connection
+from django.db.models.signals import pre_delete
+from django.test.utils import CaptureQueriesContext
+
+from ore.models import Graph, Node, Edge, Project, Property
+from ore import graph_modification
+from .common import fixt_simple, OreTestCase
+
+
+class GraphModificationTestCase(OreTestCase):
+
+    """
+        Tests for the coalesced update of graph revisions and modification dates.
+    """
+    fixtures = fixt_simple['files']
+
+    def setUp(self):
+        self.graph = Graph.objects.get(pk=fixt_simple['pkFaultTree'])
+
+    def addNodes(self, count):
+        top = Node.objects.get(graph=self.graph, kind='topEvent')
+        for index in xrange(count):
+            node = Node(graph=self.graph, kind='basicEvent', client_id=1000 + 2 * index)
+            node.save()
+            node.set_attrs({'name': 'Event %u' % index, 'x': index})
+            Edge(graph=self.graph, source=top, target=node, client_id=1001 + 2 * index).save()
+
+    def countUpdates(self, queries, table):
+        return len([query for query in queries if 'UPDATE "%s"' % table in query['sql']])
+
+    def testCoalescedUpdates(self):
+        before = Graph.objects.get(pk=self.graph.pk)
+        with CaptureQueriesContext(connection) as context:
+            with graph_modification.collect():
+                self.addNodes(20)
+        self.assertEqual(self.countUpdates(context.captured_queries, 'ore_graph'), 1)
+        self.assertEqual(self.countUpdates(context.captured_queries, 'ore_project'), 1)
+        after = Graph.objects.get(pk=self.graph.pk)
+        self.assertEqual(after.revision, before.revision + 1)
+        self.assertGreater(after.modified, before.modified)
+        self.assertEqual(Project.objects.get(pk=after.project_id).modified, after.modified)
+        self.assertEqual(Node.objects.filter(graph=self.graph, revision=after.revision).count(), 20)
+        self.assertEqual(Edge.objects.filter(graph=self.graph, revision=after.revision).count(), 20)
+
+    def testDirectUpdates(self):
+        before = self.graph.current_revision()
+        self.addNodes(2)
+        self.assertGreater(self.graph.current_revision(), before + 2)
+
+    def testReadInsideCollection(self):
+        with graph_modification.collect():
+            revision = self.graph.current_revision()
+            self.addNodes(1)
+            self.assertTrue(graph_modification.is_pending(self.graph.pk))
+            self.assertIn('Event 0', self.graph.to_json())
+            self.assertFalse(graph_modification.is_pending(self.graph.pk))
+            self.assertIn(1000, [node['id'] for node in self.graph.changes_since(revision)['nodes']])
+
+    def testFailedCollection(self):
+        revision = self.graph.current_revision()
+        try:
+            with graph_modification.collect():
+                self.addNodes(1)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(graph_modification.is_pending(self.graph.pk))
+        self.assertEqual(self.graph.current_revision(), revision + 1)
+
+    def testAbandonedCollection(self):
+        revision = self.graph.current_revision()
+        # As if a request failed before its collection was ended
+        graph_modification.begin()
+        self.addNodes(1)
+        request_finished.send(sender=self.__class__)
+        self.assertFalse(graph_modification.is_pending(self.graph.pk))
+        self.assertEqual(self.graph.current_revision(), revision + 1)
+        self.assertEqual(Node.objects.get(graph=self.graph, client_id=1000).revision, revision + 1)
+
+    def testRevisionAfterDeletion(self):
+        self.addNodes(1)
+        revision = self.graph.current_revision()
+        seen = []
+
+        def record(sender, instance, **kwargs):
+            seen.append(self.graph.current_revision())
+        # Connected after the model receivers, a reader at this point still sees the element
+        pre_delete.connect(record, sender=Node)
+        pre_delete.connect(record, sender=Property)
+        try:
+            Node.objects.get(graph=self.graph, client_id=1000).properties.get(key='name').delete()
+            Node.objects.get(graph=self.graph, client_id=1000).delete()
+        finally:
+            pre_delete.disconnect(record, sender=Node)
+            pre_delete.disconnect(record, sender=Property)
+        self.assertEqual(seen[0], revision)
+        self.assertEqual(seen[-1], revision + 1)
+        self.assertGreater(self.graph.current_revision(), seen[-1])
+
+    def testBulkSetAttrs(self):
+        node = Node.objects.get(graph=self.graph, kind='basicEvent', client_id=fixt_simple['clientIdBasicEvent'])
+        node.set_attrs({'name': 'warm up'})
+        node = Node.objects.get(pk=node.pk)
+        with graph_modification.collect():
+            with CaptureQueriesContext(connection) as context:
+                node.set_attrs({'name': 'changed', 'probability': [0, 0.25], 'x': 5, 'y': 7})
+        # Transaction, graph lookup, shared snapshot check, locked property document read, property read,
+        # update, insert, property document reset and update, node save
+        self.assertLessEqual(len(context.captured_queries), 10)
+        node = Node.objects.get(pk=node.pk)
+        self.assertEqual((node.x, node.y), (5, 7))
+        self.assertEqual(node.get_property('name'), 'changed')
+        self.assertEqual(node.get_property('probability'), [0, 0.25])
+        self.assertEqual(node.properties.filter(key='name').count(), 1)
+
+    def testInvalidSetAttrs(self):
+        node = Node.objects.get(graph=self.graph, client_id=fixt_simple['clientIdBasicEvent'])
+        name = node.get_property('name')
+        with self.assertRaises(Exception):
+            node.set_attrs({'name': 'changed', 'nonsense': 1, 'x': 5})
+        node = Node.objects.get(pk=node.pk)
+        self.assertEqual(node.get_property('name'), name)
+        self.assertNotEqual(node.x, 5)
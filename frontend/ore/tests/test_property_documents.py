@@ -0,0 +1,77 @@
+from importlib import import_module
+
+from django.apps import apps
+
+from ore.models import Graph, Node, Edge, NodeGroup, Property
+from .common import fixt_simple, OreTestCase
+
+
+class PropertyDocumentTestCase(OreTestCase):
+
+    """
+        Tests for the per-object property documents of nodes, edges and node groups.
+    """
+    fixtures = fixt_simple['files']
+
+    def setUp(self):
+        self.graph = Graph.objects.get(pk=fixt_simple['pkFaultTree'])
+
+    def getNode(self):
+        return Node.objects.get(graph=self.graph, client_id=fixt_simple['clientIdBasicEvent'])
+
+    def rowValues(self, node):
+        return {prop.key: prop.get_value() for prop in node.properties.filter(deleted=False)}
+
+    def testDocumentRebuild(self):
+        node = self.getNode()
+        self.assertIsNone(node.property_document)
+        values = self.rowValues(node)
+        self.assertEqual(node.property_values(), values)
+        # Stored for the next reader, which does not touch the Property rows anymore
+        node = self.getNode()
+        self.assertIsNotNone(node.property_document)
+        with self.assertNumQueries(0):
+            self.assertEqual(node.get_property('name'), values['name'])
+
+    def testDocumentUpdates(self):
+        node = self.getNode()
+        node.set_attrs({'name': 'bulk'})
+        self.assertEqual(self.getNode().get_property('name'), 'bulk')
+        node.set_attr('probability', [0, 0.75])
+        self.assertEqual(node.get_property('probability'), [0, 0.75])
+        self.assertEqual(self.getNode().get_property('probability'), [0, 0.75])
+        self.assertEqual(self.getNode().property_values(), self.rowValues(node))
+
+    def testOutdatedInstanceSave(self):
+        outdated = self.getNode()
+        outdated.property_values()
+        self.getNode().set_attrs({'name': 'changed'})
+        outdated.x = 42
+        outdated.save()
+        node = self.getNode()
+        self.assertEqual(node.x, 42)
+        self.assertEqual(node.get_property('name'), 'changed')
+
+    def testStaleInstances(self):
+        first, second = self.getNode(), self.getNode()
+        first.property_values()
+        second.property_values()
+        first.set_attrs({'name': 'first'})
+        second.set_attrs({'probability': [0, 0.5]})
+        node = self.getNode()
+        self.assertEqual(node.get_property('name'), 'first')
+        self.assertEqual(node.get_property('probability'), [0, 0.5])
+        self.assertEqual(node.property_values(), self.rowValues(node))
+
+    def testMigration(self):
+        expected = {node.pk: self.rowValues(node) for node in Node.objects.filter(graph=self.graph)}
+        for model in (Node, Edge, NodeGroup):
+            model.objects.update(property_document=None)
+        migration = import_module('ore.migrations.0004_property_document')
+        migration.build_property_documents(apps, None)
+        for model in (Node, Edge, NodeGroup):
+            self.assertFalse(model.objects.filter(property_document=None).exists())
+        for node in Node.objects.filter(graph=self.graph):
+            self.assertEqual(node.property_values(), expected[node.pk])
+        self.assertEqual(Property.objects.filter(node__graph=self.graph).count(),
+                         sum(len(values) for values in expected.itervalues()))
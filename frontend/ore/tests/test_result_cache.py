@@ -0,0 +1,122 @@
+import json
+import zlib
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save
+from django.test.utils import override_settings
+
+from ore.models import Graph, Job, Result, CachedResult
+from ore.models.job import job_post_save
+from .common import fixt_analysis, OreTestCase
+
+
+class ResultCacheTestCase(OreTestCase):
+
+    """
+        Tests for the result cache that is shared between graphs with the same job input.
+    """
+    fixtures = fixt_analysis['files']
+
+    def setUp(self):
+        self.setUpLogin()
+        self.graph = Graph.objects.get(pk=fixt_analysis['rate_faulttree'])
+        self.data = open('ore/fixtures/' + fixt_analysis['results'][self.graph.pk]).read()
+        CachedResult.reset_stats()
+
+    def finishJob(self, graph, data):
+        ''' Runs a top event job for the graph as the backend would, without contacting the daemon.'''
+        post_save.disconnect(job_post_save, sender=Job)
+        try:
+            job = Job.objects.create(graph_modified=graph.modified, graph=graph, kind=Job.TOP_EVENT_JOB)
+        finally:
+            post_save.connect(job_post_save, sender=Job)
+        job.exit_code = 0
+        job.parse_result(data)
+        job.cache_result(data)
+        job.save()
+        return job
+
+    def snapshot(self):
+        return self.graph.snapshot('Snapshot', User.objects.get(username='testadmin'), self.graph.project)
+
+    def testHitForSnapshot(self):
+        self.assertIsNone(Job.exists_with_result(self.graph, Job.TOP_EVENT_JOB))
+        job = self.finishJob(self.graph, self.data)
+        snapshot = self.snapshot()
+        cached = Job.exists_with_result(snapshot, Job.TOP_EVENT_JOB)
+        self.assertIsNotNone(cached)
+        self.assertNotEqual(cached.pk, job.pk)
+        self.assertEqual(cached.exit_code, 0)
+        self.assertEqual(cached.input_hash, job.input_hash)
+        self.assertEqual(cached.results.exclude(kind=Result.GRAPH_ISSUES).count(),
+                         job.results.exclude(kind=Result.GRAPH_ISSUES).count())
+        self.assertFalse(cached.results.exclude(graph=snapshot).exists())
+        stats = CachedResult.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def testRenderingInputOfCopy(self):
+        copy = Graph(kind=self.graph.kind, name='Copy', owner=self.graph.owner, project=self.graph.project)
+        copy.save()
+        copy.copy_values(self.graph)
+        for kind in (Job.PDF_RENDERING_JOB, Job.EPS_RENDERING_JOB):
+            original, copied = Job(graph=self.graph, kind=kind), Job(graph=copy, kind=kind)
+            original.freeze_input()
+            copied.freeze_input()
+            self.assertEqual(original.input_hash, copied.input_hash)
+
+    def testStatsView(self):
+        self.finishJob(self.graph, self.data)
+        Job.exists_with_result(self.snapshot(), Job.TOP_EVENT_JOB)
+        User.objects.filter(username='testadmin').update(is_staff=True)
+        response = self.get('/admin/result-cache/')
+        self.assertEqual(response.status_code, 200)
+        stats = json.loads(response.content)
+        self.assertEqual((stats['hits'], stats['entries']), (1, 1))
+
+    def testMissAfterModification(self):
+        self.finishJob(self.graph, self.data)
+        node = self.graph.nodes.filter(kind='basicEvent', deleted=False)[0]
+        node.set_attrs({'name': 'changed'})
+        self.assertIsNone(Job.exists_with_result(Graph.objects.get(pk=self.graph.pk), Job.TOP_EVENT_JOB))
+
+    def testFrontendJobCreation(self):
+        self.finishJob(self.graph, self.data)
+        # The backend daemon is not reachable, cached jobs must not need it
+        with override_settings(BACKEND_DAEMON='http://127.0.0.1:1'):
+            response = self.ajaxPost('/api/front/graphs/%u/jobs/' % self.graph.pk,
+                                     json.dumps({'kind': Job.TOP_EVENT_JOB}), 'application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Job.objects.filter(graph=self.graph, exit_code=0).count(), 2)
+
+    def testInputRenderedOnce(self):
+        rendered = []
+        render_input = Job.render_input
+
+        def counting_render_input(job):
+            rendered.append(job.kind)
+            return render_input(job)
+        # The job is not meant to reach a backend daemon here
+        post_save.disconnect(job_post_save, sender=Job)
+        Job.render_input = counting_render_input
+        try:
+            response = self.ajaxPost('/api/front/graphs/%u/jobs/' % self.graph.pk,
+                                     json.dumps({'kind': Job.TOP_EVENT_JOB}), 'application/json')
+        finally:
+            Job.render_input = render_input
+            post_save.connect(job_post_save, sender=Job)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(rendered, [Job.TOP_EVENT_JOB])
+        job = Job.objects.get(graph=self.graph, exit_code=None)
+        self.assertEqual(zlib.decompress(job.input_document), self.graph.to_xml().encode('utf-8'))
+
+    def testEviction(self):
+        first = self.finishJob(self.graph, self.data)
+        size = CachedResult.objects.get(key=first.input_hash).size
+        other = Graph.objects.get(pk=fixt_analysis['prdc_fuzztree'])
+        data = open('ore/fixtures/' + fixt_analysis['results'][other.pk]).read()
+        # Room for the second result, but not for both
+        with override_settings(RESULT_CACHE_SIZE=size + len(zlib.compress(data)) - 1):
+            second = self.finishJob(other, data)
+        self.assertFalse(CachedResult.objects.filter(key=first.input_hash).exists())
+        self.assertTrue(CachedResult.objects.filter(key=second.input_hash).exists())
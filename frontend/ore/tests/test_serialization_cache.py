@@ -0,0 +1,70 @@
+from django.db import connection
+from django.test.utils import override_settings, CaptureQueriesContext
+
+from ore.models import Graph, Node, CacheCounter
+from ore import serialization_cache
+from .common import fixt_simple, OreTestCase
+
+
+class SerializationCacheTestCase(OreTestCase):
+
+    """
+        Tests for the revision-keyed cache of graph serializations.
+    """
+    fixtures = fixt_simple['files']
+
+    def setUp(self):
+        self.graph = Graph.objects.get(pk=fixt_simple['pkFaultTree'])
+        serialization_cache.reset_stats()
+
+    def testHitAfterMiss(self):
+        first = self.graph.to_json()
+        second = self.graph.to_json()
+        self.assertEqual(first, second)
+        self.assertEqual(serialization_cache.stats()['misses'], 1)
+        self.assertEqual(serialization_cache.stats()['hits'], 1)
+        self.graph.to_json(use_value_dict=True)
+        self.assertEqual(serialization_cache.stats()['misses'], 2)
+
+    def testCountersInDatabase(self):
+        self.graph.to_json()
+        with CaptureQueriesContext(connection) as context:
+            self.graph.to_json()
+        # Cache hits are counted in memory, not with a write
+        self.assertFalse([query for query in context.captured_queries if 'UPDATE' in query['sql']])
+        # Other worker processes have their own cache instance, but see the same counters
+        serialization_cache.get_cache().clear()
+        self.assertEqual(CacheCounter.values(serialization_cache.HITS_COUNTER, serialization_cache.MISSES_COUNTER),
+                         (1, 1))
+        self.assertEqual(serialization_cache.stats()['hit_rate'], 0.5)
+
+    def testNodeChangeInvalidates(self):
+        before = self.graph.to_graphml()
+        node = self.graph.nodes.filter(deleted=False)[0]
+        node.set_attrs({'x': node.x + 100})
+        after = self.graph.to_graphml()
+        self.assertNotEqual(before, after)
+        self.assertEqual(after, ''.join(self.graph.render_graphml()))
+
+    def testPropertyChangeInvalidates(self):
+        node = Node.objects.get(graph=self.graph, kind='topEvent')
+        self.graph.to_json()
+        # Same as Node.set_attr(), which does not save the node itself
+        prop, created = node.properties.get_or_create(key='name', defaults={'node': node})
+        prop.save_value('New name')
+        self.assertIn('New name', self.graph.to_json())
+
+    def testRevisionNeverMovesBack(self):
+        outdated = Graph.objects.get(pk=self.graph.pk)
+        self.graph.save()
+        self.graph.save()
+        revision = self.graph.current_revision()
+        outdated.save()
+        self.assertEqual(outdated.revision, revision + 1)
+
+    @override_settings(SERIALIZATION_CACHE_MAX_ITEM_SIZE=10)
+    def testSizeLimit(self):
+        self.graph.to_tikz()
+        self.graph.to_tikz()
+        self.assertEqual(serialization_cache.stats()['misses'], 2)
+        self.assertEqual(serialization_cache.stats()['hits'], 0)
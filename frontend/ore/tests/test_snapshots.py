@@ -0,0 +1,139 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ore.models import Graph, Node, Project, Configuration, NodeConfiguration
+from ore import graph_modification
+from .common import fixt_simple, OreTestCase
+
+
+class SnapshotTestCase(OreTestCase):
+
+    """
+        Tests for graph snapshots that share the content of their source graph.
+    """
+    fixtures = fixt_simple['files']
+
+    def setUp(self):
+        self.graph = Graph.objects.get(pk=fixt_simple['pkFaultTree'])
+        self.user = User.objects.get(username='testadmin')
+        self.project = Project.objects.get(pk=fixt_simple['pkProject'])
+
+    def snapshot(self, graph=None):
+        return (graph or self.graph).snapshot('Snapshot', self.user, self.project)
+
+    def content(self, graph):
+        ''' The graph content as dictionary, without the entries that differ between copies.'''
+        result = graph.to_dict(use_value_dict=True)
+        for edge in result['edges']:
+            del edge['graph']
+        return {key: result[key] for key in ['nodes', 'edges', 'nodeGroups']}
+
+    def getNode(self, graph):
+        return Node.objects.get(graph=graph, client_id=fixt_simple['clientIdBasicEvent'])
+
+    def testCreation(self):
+        original = self.content(self.graph)
+        node_count = Node.objects.count()
+        with CaptureQueriesContext(connection) as context:
+            snapshot = self.snapshot()
+        self.assertLessEqual(len(context.captured_queries), 2)
+        self.assertEqual(Node.objects.count(), node_count)
+        self.assertTrue(snapshot.read_only)
+        self.assertEqual(self.content(snapshot), original)
+        self.assertTrue(snapshot.same_as(self.graph))
+        self.assertEqual(snapshot.to_graphml().count('<node '), self.graph.to_graphml().count('<node '))
+        # Snapshots of snapshots share the content of the original graph
+        self.assertEqual(self.snapshot(snapshot).content_source, self.graph)
+
+    def testSourceModification(self):
+        original = self.content(self.graph)
+        node_count = Node.objects.count()
+        first, second = self.snapshot(), self.snapshot()
+        self.getNode(self.graph).set_attrs({'name': 'changed'})
+        # Only one copy of the old content is made, the other snapshot shares it
+        self.assertEqual(Node.objects.count(), node_count + self.graph.nodes.count())
+        first, second = Graph.objects.get(pk=first.pk), Graph.objects.get(pk=second.pk)
+        self.assertIsNone(first.content_source)
+        self.assertEqual(second.content_source, first)
+        self.assertEqual(self.content(first), original)
+        self.assertEqual(self.content(second), original)
+        self.assertEqual(self.getNode(self.graph).get_property('name'), 'changed')
+        self.assertNotEqual(self.getNode(first).get_property('name'), 'changed')
+        # The copy is not repeated for further modifications
+        self.getNode(self.graph).set_attrs({'name': 'changed again'})
+        self.assertEqual(Node.objects.count(), node_count + self.graph.nodes.count())
+
+    def testBatchOnSource(self):
+        original = self.content(self.graph)
+        snapshot = self.snapshot()
+        self.graph.apply_batch([{'action': 'delete', 'type': 'node', 'id': fixt_simple['clientIdBasicEvent']}])
+        self.assertFalse(self.graph.nodes.filter(client_id=fixt_simple['clientIdBasicEvent'], deleted=False).exists())
+        self.assertEqual(self.content(Graph.objects.get(pk=snapshot.pk)), original)
+
+    def testChangesSince(self):
+        snapshot = self.snapshot()
+        revision = snapshot.current_revision()
+        changes = snapshot.changes_since(revision)
+        self.assertEqual(changes['nodes'], [])
+        self.assertEqual(changes['revision'], revision)
+        self.getNode(self.graph).set_attrs({'name': 'changed'})
+        # The snapshot got its own content, which clients have to load again
+        changes = Graph.objects.get(pk=snapshot.pk).changes_since(revision)
+        self.assertGreater(changes['revision'], revision)
+        self.assertEqual(len(changes['nodes']), self.graph.nodes.filter(deleted=False).count())
+
+    def testSourceDeletion(self):
+        original = self.content(self.graph)
+        snapshot = self.snapshot()
+        self.graph.delete()
+        self.assertEqual(self.content(Graph.objects.get(pk=snapshot.pk)), original)
+
+
+    def testStaleMaterialize(self):
+        snapshot = self.snapshot()
+        stale = Graph.objects.get(pk=snapshot.pk)
+        node_count = Node.objects.count()
+        Graph.objects.get(pk=snapshot.pk).materialize()
+        # As if a concurrent request had read the snapshot before the first one copied its content
+        stale.materialize()
+        self.assertEqual(Node.objects.count(), node_count + self.graph.nodes.count())
+        self.assertEqual(self.content(Graph.objects.get(pk=snapshot.pk)), self.content(self.graph))
+
+    def testResultsFollowCopiedContent(self):
+        first, second = self.snapshot(), self.snapshot()
+        node_configurations = []
+        for snapshot in (first, second):
+            # As stored by Job.parse_result(), for the nodes of the shared content
+            configuration = Configuration.objects.create(graph=snapshot, costs=0)
+            node_configurations.append(NodeConfiguration.objects.create(
+                node=self.getNode(self.graph), setting='{}', configuration=configuration))
+        self.getNode(self.graph).set_attrs({'name': 'changed'})
+        self.graph.delete()
+        for snapshot, node_configuration in zip((first, second), node_configurations):
+            node = NodeConfiguration.objects.get(pk=node_configuration.pk).node
+            self.assertEqual(node.graph, Graph.objects.get(pk=snapshot.pk).content_graph())
+            self.assertEqual(node.client_id, fixt_simple['clientIdBasicEvent'])
+
+    def testElementResources(self):
+        self.setUpLogin()
+        snapshot = self.snapshot()
+        url = '/api/front/graphs/%u/nodes/%u' % (snapshot.pk, fixt_simple['clientIdBasicEvent'])
+        response = self.ajaxGet(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/graphs/%u/nodes/' % snapshot.pk, json.loads(response.content)['resource_uri'])
+        response = self.ajaxPatch(url, json.dumps({'properties': {'name': 'changed'}}), 'application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotEqual(self.getNode(self.graph).get_property('name'), 'changed')
+        response = self.ajaxGet('/api/front/graphs/%u/edges/%u' % (snapshot.pk, fixt_simple['clientIdEdge']))
+        self.assertEqual(response.status_code, 200)
+
+    def testNoCheckRememberedOutsideCollection(self):
+        graph_modification.before_modification(self.graph.pk)
+        # Created by another process, which does not tell this one
+        snapshot = Graph.objects.create(kind=self.graph.kind, name='Snapshot', owner=self.user, project=self.project,
+                                        read_only=True, content_source=self.graph)
+        graph_modification.before_modification(self.graph.pk)
+        self.assertIsNone(Graph.objects.get(pk=snapshot.pk).content_source)
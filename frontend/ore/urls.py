@@ -27,6 +27,12 @@ re_uuid = "[0-F]{8}-[0-F]{4}-[0-F]{4}-[0-F]{4}-[0-F]{12}"
 
 urlpatterns = patterns('',
                        # admin
+                       url(r'^admin/serialization-cache/$',
+                           'ore.views.serialization_cache_stats',
+                           name='serialization_cache_stats'),
+                       url(r'^admin/result-cache/$',
+                           'ore.views.result_cache_stats',
+                           name='result_cache_stats'),
                        url(r'^admin/doc/',
                            include('django.contrib.admindocs.urls')),
                        url(r'^admin/', include(admin.site.urls)),
@@ -3,15 +3,17 @@ import logging
 
 from django.contrib import auth, messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.db.models import Q
 from django.template import RequestContext
-from django.http import HttpResponseBadRequest
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_http_methods
 from django.http import Http404
 
-from ore.models import Graph, Project, notations, Sharing
+from ore.models import Graph, Project, notations, Sharing, CachedResult
+from ore import serialization_cache
 
 
 logger = logging.getLogger('ore')
@@ -300,7 +302,7 @@ def dashboard_import(request, project_id):
         for name, f in request.FILES.iteritems():
             graph = Graph(owner=request.user, project=project)
             try:
-                graph.from_graphml(f.read())
+                graph.from_graphml(f)
                 graph.name = request.POST.get("title", "Imported graph")
                 graph.save()
                 graph.ensure_default_nodes()
@@ -444,16 +446,8 @@ def dashboard_edit(request, project_id):
     elif POST.get('snapshot'):
         # "Snapshot" button pressed for one or multiple graphs
         for old_graph in graphs:
-            graph = Graph(
-                kind=old_graph.kind,
-                name=old_graph.name +
-                ' (snapshot)',
-                owner=request.user,
-                project=project)
-            graph.save()
-            graph.copy_values(old_graph)
-            graph.read_only = True
-            graph.save()
+            # shares the content of the old graph, until one of them is modified
+            old_graph.snapshot(old_graph.name + ' (snapshot)', request.user, project)
         messages.add_message(
             request,
             messages.SUCCESS,
@@ -678,6 +672,38 @@ def snapshot(request, graph_id):
     return render(request, 'editor/editor.html', parameters)
 
 
+@staff_member_required
+def serialization_cache_stats(request):
+    """
+    Function: serialization_cache_stats
+
+    Returns the hit and miss counters of the graph serialization cache as JSON, for sizing the cache.
+
+    Parameters:
+     {HttpRequest} request - a django request object
+
+    Returns:
+     {HttpResponse} a django response object
+    """
+    return HttpResponse(json.dumps(serialization_cache.stats()), content_type='application/json')
+
+
+@staff_member_required
+def result_cache_stats(request):
+    """
+    Function: result_cache_stats
+
+    Returns the hit and miss counters and the size of the shared analysis result cache as JSON, for sizing the cache.
+
+    Parameters:
+     {HttpRequest} request - a django request object
+
+    Returns:
+     {HttpResponse} a django response object
+    """
+    return HttpResponse(json.dumps(CachedResult.stats()), content_type='application/json')
+
+
 @require_http_methods(['GET', 'POST'])
 def login(request):
     """
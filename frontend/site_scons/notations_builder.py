@@ -192,6 +192,57 @@ def resolve_inheritance(notations):
             nodes[node_name] = inherit(node_name, node, nodes, node_cache)
 
 
+def generate_property_index(notations):
+    '''
+        Flattens the property definitions of all notations into one dictionary, so that the model
+        code can determine type, default and rendering of a property with a single lookup, instead of
+        walking the nested notation dictionaries on every access.
+
+        The 'property_index' is keyed by (graph kind, owner, property name). The owner is the node kind
+        for node properties, or 'edges' / 'nodeGroups' for the properties of these sections. Each entry
+        is a dictionary with:
+
+         'kind'    - the property value type, e.g. 'text' or 'compound'
+         'default' - the default value, None if the notation gives none
+         'mirror'  - the mirror format string, '' for mirrored properties without format,
+                     None for properties that are not shown in the mirror
+         'hidden'  - True if the property is not shown in the editor
+
+        Properties that are declared without configuration in the notation (e.g. 'optional': None)
+        have None as entry.
+
+        The 'hidden_child_properties' give, per (graph kind, node kind), the set of property
+        names that are hidden in the child nodes.
+    '''
+    property_index = {}
+    hidden_child_properties = {}
+
+    def index_entry(propertie):
+        if propertie is None:
+            return None
+        mirror = propertie.get('mirror')
+        return {
+            'kind': propertie['kind'],
+            'default': propertie.get('default'),
+            'mirror': None if mirror is None else mirror.get('format', ''),
+            'hidden': propertie.get('hidden', False)
+        }
+
+    for notation in notations:
+        notation_kind = notation['kind']
+        for section in ('edges', 'nodeGroups'):
+            for property_name, propertie in notation.get(section, {}).get('properties', {}).items():
+                property_index[(notation_kind, section, property_name)] = index_entry(propertie)
+        for node_kind, node in notation['nodes'].items():
+            for property_name, propertie in node.get('properties', {}).items():
+                property_index[(notation_kind, node_kind, property_name)] = index_entry(propertie)
+            hidden_child_properties[(notation_kind, node_kind)] = set(
+                property_name for property_name, settings in node.get('childProperties', {}).items()
+                if settings.get('hidden') is True)
+
+    return property_index, hidden_child_properties
+
+
 def notations(target, source, env):
     '''
         The central build task for the Python notations file equivalents.
@@ -221,6 +272,11 @@ def notations(target, source, env):
         pprint.pprint(graph_data, out)
         out.write('\ngraphml_node_data = ')
         pprint.pprint(node_data, out)
+        property_index, hidden_child_properties = generate_property_index(notations)
+        out.write('\nproperty_index = ')
+        pprint.pprint(property_index, out)
+        out.write('\nhidden_child_properties = ')
+        pprint.pprint(hidden_child_properties, out)
         out.write('\n# END OF GENERATED CONTENT')
 
 